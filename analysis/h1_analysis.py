@@ -29,10 +29,12 @@ import seaborn as sns
 from scipy import stats
 import os
 import warnings
+
+from scenarios.results import find_results, read_results
 warnings.filterwarnings('ignore')
 
 # ── пути ──────────────────────────────────────────────────────────────────────
-DATA_PATH   = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h1_portfolio_freedom.csv')
+DATA_PATH   = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h1_portfolio_freedom')
 FIGURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'figures')
 
 # ── стиль ─────────────────────────────────────────────────────────────────────
@@ -76,12 +78,12 @@ DEMOGRAPHIC_LINESTYLES = {
 
 
 def load_data() -> pd.DataFrame:
-    if not os.path.exists(DATA_PATH):
+    if find_results(DATA_PATH) is None:
         raise FileNotFoundError(
             f"Файл не найден: {DATA_PATH}\n"
             "Сначала запустите: python -m scenarios.h1_portfolio_freedom"
         )
-    df = pd.read_csv(DATA_PATH)
+    df = read_results(DATA_PATH, categorical=False)
     df['program_label'] = df['portfolio'].map(LABELS)
     if 'transition_scenario' not in df.columns:
         df['transition_scenario'] = 'baseline'
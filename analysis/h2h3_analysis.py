@@ -32,9 +32,11 @@ import seaborn as sns
 from scipy import stats
 import os
 import warnings
+
+from scenarios.results import find_results, read_results
 warnings.filterwarnings('ignore')
 
-DATA_RAW   = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h2h3_raw.csv')
+DATA_RAW   = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h2h3_raw')
 DATA_INF   = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h2h3_inflection_points.csv')
 FIGURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'figures')
 
@@ -71,12 +73,12 @@ DEMOGRAPHIC_LINESTYLES = {
 
 def load_data():
     for p in [DATA_RAW, DATA_INF]:
-        if not os.path.exists(p):
+        if not os.path.exists(p) and find_results(p) is None:
             raise FileNotFoundError(
                 f"Файл не найден: {p}\n"
                 "Сначала запустите: python -m scenarios.h2h3_cofin_threshold"
             )
-    df  = pd.read_csv(DATA_RAW)
+    df  = read_results(DATA_RAW, categorical=False)
     inf = pd.read_csv(DATA_INF)
     if 'market_scenario' not in df.columns:
         df['market_scenario'] = 'baseline'
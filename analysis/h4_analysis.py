@@ -23,9 +23,11 @@ import seaborn as sns
 from scipy import stats
 import os
 import warnings
+
+from scenarios.results import find_results, read_results
 warnings.filterwarnings('ignore')
 
-DATA_RAW    = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h4_raw.csv')
+DATA_RAW    = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h4_raw')
 DATA_WINNER = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h4_winner_map.csv')
 DATA_POP    = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'h4_population_summary.csv')
 FIGURES_DIR  = os.path.join(os.path.dirname(__file__), '..', 'scenarios', 'temp_data', 'figures')
@@ -38,13 +40,13 @@ COLOR_IIS  = '#d73027'
 
 
 def load_data():
-    missing = [p for p in [DATA_RAW, DATA_WINNER, DATA_POP] if not os.path.exists(p)]
+    missing = [p for p in [DATA_RAW, DATA_WINNER, DATA_POP] if not os.path.exists(p) and find_results(p) is None]
     if missing:
         raise FileNotFoundError(
             f"Файлы не найдены: {missing}\n"
             "Сначала запустите: python -m scenarios.h4_demographic_heterogeneity"
         )
-    df     = pd.read_csv(DATA_RAW)
+    df     = read_results(DATA_RAW, categorical=False)
     winner = pd.read_csv(DATA_WINNER)
     pop    = pd.read_csv(DATA_POP)
     if 'transition_scenario' not in df.columns:
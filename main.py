@@ -24,7 +24,7 @@ if __name__ == '__main__':
     corr_matrix = indexes[[col for col in indexes.columns if YIELD_COL in col]].corr()
 
     portfolio = PortfolioModel(assets=securities, corr_matrix=corr_matrix)
-    simulated_returns = portfolio.simulate(n_years=15, n_simulations=1, dt=1/252)
+    simulated_returns = portfolio.simulate(n_years=15, n_simulations=1, dt=1/252, sample_every=252)
 
 ############
 
@@ -42,7 +42,7 @@ if __name__ == '__main__':
         n = 15,
         age = 45,
         sex = 'M',
-        rates = simulated_returns[:,0][::252],
+        rates = simulated_returns[:,0],
         payment_mode = 'relative',
         payment_rate = 0.06,
         salary_model = salary_model,
@@ -1,20 +1,42 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 import numpy as np
 
 class BaseSalaryModel(ABC):
     @abstractmethod
-    def simulate(self, n_years: int, initial_salary: float) -> np.ndarray:
+    def simulate(self, n_years: int, initial_salary: float, rng: Optional[np.random.Generator] = None) -> np.ndarray:
         """
         Возвращает массив годовых зарплат длиной n_years + 1 (последний = 0).
+        rng — источник случайности для стохастических реализаций
+        (детерминированные модели его игнорируют).
         """
         pass
 
+    def simulate_many(self, initial_ages, initial_salaries, n_years: int,
+                      rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Матрица годовых зарплат (n_paths, n_years + 1) для набора работников.
+        initial_ages учитывают модели с возрастной зависимостью (None — возраст модели).
+        По умолчанию — по одному вызову simulate на работника.
+        """
+        salaries = np.atleast_1d(np.asarray(initial_salaries, dtype=float))
+        return np.stack([self.simulate(n_years, s, rng=rng) for s in salaries])
+
 
 class BaseUnemploymentModel(ABC):
     @abstractmethod
-    def simulate_shocks(self, n_years: int) -> np.ndarray:
+    def simulate_shocks(self, n_years: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
         """
         Возвращает массив множителей длиной n_years + 1.
         1 = полностью занят, <1 = частичная безработица.
+        rng — numpy.random.Generator (None — свежий поток).
+        """
+        pass
+
+    def simulate_shocks_matrix(self, n_years: int, n_sims: int,
+                               rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Матрица множителей (n_sims, n_years + 1) для целой ячейки сценария.
+        По умолчанию — по одному вызову simulate_shocks на симуляцию.
         """
-        pass
\ No newline at end of file
+        return np.stack([self.simulate_shocks(n_years, rng=rng) for _ in range(n_sims)])
@@ -1,18 +1,45 @@
 import numpy as np
+from functools import lru_cache
 from models.macro.base import BaseSalaryModel
-from typing import Callable
+from typing import Callable, Optional
 
 class DeterministicSalaryModel(BaseSalaryModel):
     def __init__(self, annual_growth: float = 0.05):
         self.annual_growth = annual_growth
 
-    def simulate(self, n_years: int, initial_salary: float) -> np.ndarray:
+    def simulate(self, n_years: int, initial_salary: float, rng: Optional[np.random.Generator] = None) -> np.ndarray:
         salaries = np.zeros(n_years)
         salaries[0] = initial_salary
         for i in range(1, n_years):
             salaries[i] = salaries[i-1] * (1 + self.annual_growth)
         return np.append(salaries * 12, 0.0)
 
+    def simulate_many(self, initial_ages, initial_salaries, n_years: int,
+                      rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        salaries = np.atleast_1d(np.asarray(initial_salaries, dtype=float))
+        factors = np.full((len(salaries), n_years - 1), 1 + self.annual_growth)
+        paths = np.cumprod(np.column_stack([salaries, factors]), axis=1)
+        return np.column_stack([paths * 12, np.zeros(len(salaries))])
+
+
+# ── кэш таблиц роста и траекторий StochasticSalaryModel ─────────────────────
+# Модель детерминирована при заданных (initial_age, initial_salary, n_years, mu, rho, ipc, u_func),
+# поэтому множители роста по возрасту и готовые траектории кэшируются по параметрам.
+
+@lru_cache(maxsize=4096)
+def _growth_factor(age: int, mu: float, rho: float, ipc: float, u_func: Callable[[float], float]) -> float:
+    return 1 + (mu + rho * ipc + (u_func(age) / u_func(age - 1) - 1))
+
+
+@lru_cache(maxsize=1024)
+def _trajectory(initial_age: int, initial_salary: float, n_years: int,
+                mu: float, rho: float, ipc: float, u_func: Callable[[float], float]) -> np.ndarray:
+    factors = [_growth_factor(initial_age + i, mu, rho, ipc, u_func) for i in range(1, n_years)]
+    path = np.append(np.cumprod([initial_salary, *factors]) * 12, 0.0)
+    path.setflags(write=False)
+    return path
+
+
 class StochasticSalaryModel(BaseSalaryModel):
     def __init__(
             self,
@@ -28,13 +55,33 @@ class StochasticSalaryModel(BaseSalaryModel):
         self.ipc = ipc
         self.u_func = u_func
 
-    def simulate(self, n_years: int, initial_salary: float) -> np.ndarray:
-        salaries = np.zeros(n_years)
-        salaries[0] = initial_salary
-        for i in range(1, n_years):
-            growth = self.mu + self.rho * self.ipc + (self.u_func(self.initial_age+i) / self.u_func(self.initial_age+i-1) - 1)
-            salaries[i] = salaries[i-1] * (1 + growth)
-        return np.append(salaries * 12, 0.0)
+    def growth_factors(self, ages) -> np.ndarray:
+        """Таблица множителей роста 1 + g(age) для перехода age − 1 → age (кэшируется по возрасту)."""
+        ages = np.asarray(ages, dtype=int)
+        table = {int(a): _growth_factor(int(a), self.mu, self.rho, self.ipc, self.u_func) for a in np.unique(ages)}
+        return np.vectorize(table.__getitem__, otypes=[float])(ages) if ages.size else np.zeros(ages.shape)
+
+    def trajectory(self, n_years: int, initial_salary: float) -> np.ndarray:
+        """Годовые зарплаты (n_years + 1,) из LRU-кэша; массив только для чтения."""
+        return _trajectory(int(self.initial_age), float(initial_salary), int(n_years),
+                           self.mu, self.rho, self.ipc, self.u_func)
+
+    def simulate(self, n_years: int, initial_salary: float, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        return self.trajectory(n_years, initial_salary).copy()
+
+    def simulate_many(self, initial_ages, initial_salaries, n_years: int,
+                      rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Зарплаты для набора (возраст, стартовая зарплата) одним cumprod по таблице
+        множителей роста; результат побитово совпадает с simulate.
+        """
+        ages = self.initial_age if initial_ages is None else initial_ages
+        ages, salaries = np.broadcast_arrays(np.asarray(ages, dtype=int), np.asarray(initial_salaries, dtype=float))
+        ages, salaries = np.atleast_1d(ages).ravel(), np.atleast_1d(salaries).ravel()
+
+        factors = self.growth_factors(ages[:, None] + np.arange(1, n_years))
+        paths = np.cumprod(np.column_stack([salaries, factors]), axis=1)
+        return np.column_stack([paths * 12, np.zeros(len(salaries))])
 
 
 if __name__ == '__main__':
@@ -43,4 +90,4 @@ if __name__ == '__main__':
 
     resb = b.simulate(10, 10000)
     resa = a.simulate(10, 10000, 50)
-    print(1)
\ No newline at end of file
+    print(1)
@@ -1,4 +1,6 @@
 import numpy as np
+from typing import Optional
+from models.utils import as_generator
 from .base import BaseUnemploymentModel
 
 class WeibullUnemploymentModel(BaseUnemploymentModel):
@@ -7,19 +9,33 @@ class WeibullUnemploymentModel(BaseUnemploymentModel):
         self.weibull_k = weibull_k
         self.weibull_lambda = weibull_lambda
 
-    def _generate_duration(self, size: int) -> np.ndarray:
-        U = np.random.uniform(0, 1, size=size)
+    def _generate_duration(self, size, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        U = as_generator(rng).uniform(0, 1, size=size)
         return self.weibull_lambda * (-np.log(U)) ** (1 / self.weibull_k)
 
-    def simulate_shocks(self, n_years: int, seed: int = None) -> np.ndarray:
-        if seed is not None:
-            np.random.seed(seed)
+    def simulate_shocks(self, n_years: int, seed: int = None, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        rng = as_generator(rng if seed is None else seed)
         shocks = np.ones(n_years + 1)
-        binary = np.random.binomial(1, 1 - self.p_exit, size=n_years)
+        binary = rng.binomial(1, 1 - self.p_exit, size=n_years)
         shocks[1:] = binary
 
-        durations = self._generate_duration(n_years + 1) / 12
+        durations = self._generate_duration(n_years + 1, rng) / 12
         durations = np.minimum(1.0, durations)
         employment = 1.0 - durations
         shocks = np.where(shocks == 0, employment, shocks)
         return shocks
+
+    def simulate_shocks_matrix(self, n_years: int, n_sims: int,
+                               rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Шоки для n_sims траекторий сразу: выходы из занятости (n_sims, n_years)
+        и длительности Вейбулла (n_sims, n_years + 1) тянутся двумя массивами.
+        По распределению строки совпадают с simulate_shocks.
+        """
+        rng = as_generator(rng)
+        shocks = np.ones((n_sims, n_years + 1))
+        shocks[:, 1:] = rng.binomial(1, 1 - self.p_exit, size=(n_sims, n_years))
+
+        durations = np.minimum(1.0, self._generate_duration((n_sims, n_years + 1), rng) / 12)
+        return np.where(shocks == 0, 1.0 - durations, shocks)
+
@@ -7,6 +7,7 @@ from models.macro.base import BaseSalaryModel, BaseUnemploymentModel
 
 from models.macro.salary import DeterministicSalaryModel
 from models.macro.unemployment import WeibullUnemploymentModel
+from models.programs.fees import FeeRules, accumulate_balances
 from quality.metrics import savings_metric, roi_metric, irr_metric, twr_metric, kz_metric, pension_metric
 
 @dataclass
@@ -29,8 +30,11 @@ class ProgramInput:
     # налоговый вычет
     tax_deduction_rate: float = 0
 
+    # источник случайности для макромоделей (None — свежий поток)
+    rng: Optional[np.random.Generator] = None
 
-class BaseProgram(ABC):
+
+class BaseProgram(FeeRules, ABC):
     def __init__(self, params: ProgramInput, life_table):
         self.params = params
         self.life_table = life_table
@@ -70,14 +74,15 @@ class BaseProgram(ABC):
         if self.params.salary_model is not None:
             self.annual_salaries = self.params.salary_model.simulate(
                 n_years=self.params.n,
-                initial_salary=self.params.initial_salary
+                initial_salary=self.params.initial_salary,
+                rng=self.params.rng,
             )
         else:
             self.annual_salaries = np.full(self.params.n + 1, float(self.params.initial_salary) * 12)
 
     def _apply_unemployment_shocks(self):
         if self.params.unemployment_model is not None:
-            self.shocks = self.params.unemployment_model.simulate_shocks(self.params.n)
+            self.shocks = self.params.unemployment_model.simulate_shocks(self.params.n, rng=self.params.rng)
             self.annual_salaries *= self.shocks
         else:
             self.shocks = np.ones(self.params.n + 1)
@@ -125,39 +130,9 @@ class BaseProgram(ABC):
         self.final_accumulation = self.portfolio_path[-1]
 
     def _simulate_portfolio_with_fees(self, total_inflows: np.ndarray, rates: list[float]) -> dict:
-        n = len(rates)
-        do = np.zeros(n)
-        perc_arr = np.zeros(n)
-        var_fee_arr = np.zeros(n)
-        fixed_fee_arr = np.zeros(n)
-        total_fee_arr = np.zeros(n)
-        after_fee = np.zeros(n)
-
-        do[0] = total_inflows[0]
-        perc_arr[0] = do[0] * rates[0]
-        after0 = do[0] + perc_arr[0]
-        total_fee_arr[0], var_fee_arr[0], fixed_fee_arr[0] = self._calculate_fee(perc_arr[0], 0.0, after0)
-        after_fee[0] = after0 - total_fee_arr[0]
-
-        for i in range(1, n):
-            do[i] = total_inflows[i] + after_fee[i-1]
-            perc_arr[i] = do[i] * rates[i]
-            after_i = do[i] + perc_arr[i]
-            total_fee_arr[i], var_fee_arr[i], fixed_fee_arr[i] = self._calculate_fee(perc_arr[i], after_fee[i-1], after_i)
-            after_fee[i] = after_i - total_fee_arr[i]
-
-        return {
-            'do': do,
-            'perc': perc_arr,
-            'var_fee': var_fee_arr,
-            'fixed_fee': fixed_fee_arr,
-            'total_fee': total_fee_arr,
-            'after_fee': after_fee,
-            'after_fee_path': np.append(after_fee, after_fee[-1] + self.tax_deduction[-1]),
-        }
-
-    def _calculate_fee(self, perc, prev_value, current_value) -> tuple[float, float, float]:
-        return 0.0, 0.0, 0.0  # total, var, fixed
+        details = accumulate_balances(total_inflows, np.asarray(rates, dtype=float), self._fee_function())
+        details['after_fee_path'] = np.append(details['after_fee'], details['after_fee'][-1] + self.tax_deduction[-1])
+        return details
 
     def compute_metrics(self) -> dict[str, float]:
 
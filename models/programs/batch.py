@@ -0,0 +1,219 @@
+from abc import ABC
+from dataclasses import dataclass
+from typing import Literal, Optional, Sequence, Union
+import numpy as np
+from models.macro.base import BaseSalaryModel, BaseUnemploymentModel
+
+from models.programs.fees import FeeRules, accumulate_balances
+from quality.metrics import compute_metrics_batch
+
+
+@dataclass
+class BatchProgramInput:
+    """
+    Вход пакетного движка: то же, что ProgramInput, но для n_sims траекторий сразу.
+
+    rates    — матрица годовых доходностей (n_sims, n);
+    salaries — готовые годовые зарплаты до шоков (n + 1,) или (n_sims, n + 1);
+               если не заданы — берутся из salary_model / initial_salary;
+    shocks   — готовые множители занятости (n_sims, n + 1);
+               если не заданы — берутся из unemployment_model.
+    """
+    n: int
+    age: int
+    sex: Literal['M', 'F']
+    rates: np.ndarray
+
+    # взносы
+    payment_mode: Literal['const', 'relative'] = 'const'
+    payment_rate: float = None
+    fix_payment: float = None
+    initial_salary: Optional[Union[int, float]] = None
+
+    # готовые траектории (необязательно)
+    salaries: Optional[np.ndarray] = None
+    shocks: Optional[np.ndarray] = None
+
+    # макромодели (плагины)
+    salary_model: Optional[BaseSalaryModel] = None
+    unemployment_model: Optional[BaseUnemploymentModel] = None
+
+    # налоговый вычет
+    tax_deduction_rate: float = 0
+
+    # источник случайности для макромоделей (None — свежий поток)
+    rng: Optional[np.random.Generator] = None
+
+
+class BaseBatchProgram(FeeRules, ABC):
+    """
+    Пакетный аналог BaseProgram: те же шаги run(), но все величины — матрицы
+    (n_sims, n + 1), а расчёт идёт массивными операциями по всем симуляциям.
+    Результаты совпадают со скалярным движком с точностью до плавающей точки.
+    """
+
+    def __init__(self, params: BatchProgramInput, life_table):
+        self.params = params
+        self.life_table = life_table
+        self.tax = self.params.tax_deduction_rate
+        self.rates = np.atleast_2d(np.asarray(self.params.rates, dtype=float))
+        self.n_sims = self.rates.shape[0]
+
+        self.__check_input__()
+
+        self.shocks = None
+        self.annual_salaries = None
+        self.payments = None
+        self.tax_deduction = None
+        self.co_financing = None
+        self.total_inflows = None
+        self.portfolio_path = None
+        self.final_accumulation = None
+        self.first_pension = None
+        self._sim_details = None
+
+    def __check_input__(self):
+        if (self.params.payment_mode == 'relative') and (self.params.payment_rate is None):
+            raise ValueError('Determine payment_rate for relative payment_mode')
+
+        if (self.params.payment_mode == 'const') and (self.params.fix_payment is None):
+            raise ValueError('Determine fix_payment for const payment_mode')
+
+        if self.rates.shape[1] != self.params.n:
+            raise ValueError(f'rates should have shape (n_sims, {self.params.n}), receive: {self.rates.shape}')
+
+    def run(self):
+        self._simulate_salary()
+        self._apply_unemployment_shocks()
+        self._calculate_contributions()
+        self._apply_co_financing()
+        self._accumulate_with_fees()
+        self._finalize()
+        return self
+
+    def _simulate_salary(self):
+        n, shape = self.params.n, (self.n_sims, self.params.n + 1)
+        if self.params.salaries is not None:
+            salaries = np.broadcast_to(np.asarray(self.params.salaries, dtype=float), shape)
+        elif self.params.salary_model is not None:
+            salaries = self.params.salary_model.simulate_many(
+                initial_ages=None,
+                initial_salaries=np.full(self.n_sims, float(self.params.initial_salary)),
+                n_years=n,
+                rng=self.params.rng,
+            )
+        else:
+            salaries = np.full(shape, float(self.params.initial_salary) * 12)
+        self.annual_salaries = np.array(salaries, dtype=float)
+
+    def _apply_unemployment_shocks(self):
+        n = self.params.n
+        if self.params.shocks is not None:
+            self.shocks = np.broadcast_to(np.asarray(self.params.shocks, dtype=float), (self.n_sims, n + 1)).copy()
+            self.annual_salaries *= self.shocks
+        elif self.params.unemployment_model is not None:
+            self.shocks = self.params.unemployment_model.simulate_shocks_matrix(n, self.n_sims, rng=self.params.rng)
+            self.annual_salaries *= self.shocks
+        else:
+            self.shocks = np.ones((self.n_sims, n + 1))
+
+    def _calculate_contributions(self):
+        if self.params.payment_mode == 'relative':
+            self.payments, self.tax_deduction = self._salary_contributions(self.params.payment_rate)
+        else:
+            self._calculate_fixed_contributions()
+
+    def _salary_contributions(self, payment_rate) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Взносы и вычеты при relative-режиме. payment_rate — число или массив ставок
+        формы (..., 1, 1): тогда результат (..., n_sims, n + 1) — по ставке на слой.
+        """
+        n = self.params.n
+        rate = np.asarray(payment_rate, dtype=float)
+        shape = np.broadcast_shapes(rate.shape, (self.n_sims, n + 1))
+        payments = np.zeros(shape)
+        tax_deduction = np.zeros(shape)
+
+        payments[..., :n] = self.annual_salaries[:, :n] * rate
+        tax_deduction[..., 1:] = payments[..., :n] * self.tax
+        return payments, tax_deduction
+
+    def _calculate_fixed_contributions(self):
+        n = self.params.n
+        payments = np.zeros((self.n_sims, n + 1))
+        tax_deduction = np.zeros((self.n_sims, n + 1))
+
+        payments[:, :n] = self.params.fix_payment
+        tax_deduction[:, 1:] = self.params.fix_payment * self.tax
+
+        self.payments = payments * self.shocks
+        self.tax_deduction = tax_deduction * self.shocks
+
+    def _apply_co_financing(self):
+        self.co_financing = self._co_financing(self.payments)
+
+    def _co_financing(self, payments: np.ndarray) -> np.ndarray:
+        """Софинансирование по матрице взносов (..., n_sims, n + 1); по умолчанию — нет."""
+        return np.zeros(payments.shape)
+
+    def _accumulate_with_fees(self):
+        self.total_inflows = self.payments + self.tax_deduction + self.co_financing
+        self._sim_details = self._simulate_portfolio_with_fees(self.total_inflows, self.rates)
+        self.portfolio_path = self._sim_details['after_fee_path']
+        self.final_accumulation = self.portfolio_path[:, -1]
+
+    def _simulate_portfolio_with_fees(self, total_inflows: np.ndarray, rates: np.ndarray) -> dict:
+        details = accumulate_balances(total_inflows, rates, self._fee_function())
+        details['after_fee_path'] = np.column_stack([details['after_fee'],
+                                                     details['after_fee'][:, -1] + self.tax_deduction[:, -1]])
+        return details
+
+    def _annuity_months(self):
+        if self.life_table is None:
+            return None
+        return self.life_table.loc[self.params.age + self.params.n, self.params.sex]
+
+    def compute_metrics(self) -> dict[str, np.ndarray]:
+        """Метрики compute_metrics скалярного движка — векторами длины n_sims."""
+        return self._metrics(self.final_accumulation, self.payments, self.portfolio_path)
+
+    def _metrics(self, final_accumulation: np.ndarray, payments: np.ndarray, portfolio_path: np.ndarray,
+                 metrics: Optional[Sequence[str]] = None) -> dict[str, np.ndarray]:
+        # final_accumulation (..., n_sims); payments, portfolio_path (..., n_sims, n + 1)
+        return compute_metrics_batch(final_accumulation, payments, portfolio_path, self.annual_salaries,
+                                     self.params.n, self._annuity_months(), metrics)
+
+    def sweep_payment_rates(self, payment_rates, metrics: Optional[Sequence[str]] = None) -> dict[str, np.ndarray]:
+        """
+        Метрики для целой сетки ставок взноса за один проход (только relative-режим).
+
+        Зарплаты и шоки занятости считаются один раз и общие для всех ставок.
+        Взносы и вычеты пропорциональны ставке r, софинансирование — min(cap, r·share·взнос),
+        а балансы — фиксированный линейный функционал притоков, коэффициенты
+        которого зависят только от траектории доходностей. Поэтому итог по r
+        линеен (ИИС-3) или кусочно-линеен с изломами на cap (ПДС), и вся сетка
+        считается трансляцией по оси ставок без повторных прогонов программы.
+
+        Повторные вызовы используют те же траектории (общие случайные числа).
+        metrics — подмножество METRICS (по умолчанию все).
+        Возвращает dict метрик формы (n_rates, n_sims); params.payment_rate не используется.
+        """
+        if self.params.payment_mode != 'relative':
+            raise ValueError('Payment-rate sweep requires relative payment_mode')
+
+        if self.annual_salaries is None:
+            self._simulate_salary()
+            self._apply_unemployment_shocks()
+
+        rates_grid = np.asarray(payment_rates, dtype=float)
+        payments, tax_deduction = self._salary_contributions(rates_grid[:, None, None])
+        total_inflows = payments + tax_deduction + self._co_financing(payments)
+
+        after_fee = accumulate_balances(total_inflows, self.rates, self._fee_function())['after_fee']
+        portfolio_path = np.concatenate([after_fee, after_fee[..., -1:] + tax_deduction[..., -1:]], axis=-1)
+
+        return self._metrics(portfolio_path[..., -1], payments, portfolio_path, metrics)
+
+    def _finalize(self) -> None:
+        annuity_months = self._annuity_months()
+        self.first_pension = None if annuity_months is None else self.final_accumulation / annuity_months
@@ -0,0 +1,137 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+import numpy as np
+
+
+class FeeSchedule(ABC):
+    """
+    Комиссия за год: fee(perc, prev_value, current_value) -> (total, var, fixed).
+
+    perc — начисленный доход, prev_value — баланс на конец прошлого года,
+    current_value — баланс до комиссии. Аргументы — числа или массивы одной формы.
+    """
+
+    @abstractmethod
+    def __call__(self, perc, prev_value, current_value):
+        ...
+
+    def linear_coefficients(self, rates: np.ndarray) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """
+        Коэффициенты (alpha, beta) рекурсии B[i] = alpha[i]·B[i−1] + beta[i]·inflow[i],
+        если после вычета комиссии баланс линеен по (B[i−1], inflow[i]); иначе None.
+        """
+        return None
+
+
+@dataclass(frozen=True)
+class LinearFee(FeeSchedule):
+    """
+    fee = var_rate · perc + fixed_rate · (prev + cur) / 2 — линейна по балансам.
+
+    С do = inflow + B[i−1], perc = do·r, cur = do·(1 + r):
+        B[i] = do·g − f/2·B[i−1],   g = 1 + r(1 − v) − f(1 + r)/2,
+    т.е. alpha = g − f/2, beta = g.
+    """
+    var_rate: float = 0.0
+    fixed_rate: float = 0.0
+
+    def __call__(self, perc, prev_value, current_value):
+        var_fee = self.var_rate * perc
+        fixed_fee = self.fixed_rate * (prev_value + current_value) / 2
+        return var_fee + fixed_fee, var_fee, fixed_fee
+
+    def linear_coefficients(self, rates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        v, f = self.var_rate, self.fixed_rate
+        g = 1 + rates * (1 - v) - f * (1 + rates) / 2
+        return g - f / 2, g
+
+
+FeeFunction = Union[FeeSchedule, Callable]
+
+
+class FeeRules:
+    """Комиссии программы, общие для скалярного и пакетного движков."""
+    # по умолчанию — без комиссий
+    fee_schedule: FeeSchedule = LinearFee()
+
+    def _fee_function(self) -> FeeFunction:
+        # переопределённый в наследнике _calculate_fee считается нелинейным (пошаговый расчёт)
+        if type(self)._calculate_fee is FeeRules._calculate_fee:
+            return self.fee_schedule
+        return self._calculate_fee
+
+    def _calculate_fee(self, perc, prev_value, current_value) -> tuple[float, float, float]:
+        return self.fee_schedule(perc, prev_value, current_value)  # total, var, fixed
+
+
+def accumulate_balances(total_inflows: np.ndarray, rates: np.ndarray, fee: FeeFunction) -> dict:
+    """
+    Балансы после комиссии по годам для одной траектории (n,) или матрицы (n_sims, n).
+
+    Линейная комиссия (FeeSchedule с linear_coefficients) решается в замкнутом виде:
+        B[i] = P[i] · Σ_{k≤i} beta[k]·inflow[k] / P[k],   P[i] = Π_{j≤i} alpha[j],
+    через cumprod/cumsum сразу по всем симуляциям. Нелинейная комиссия (или
+    alpha ≤ 0, где деление на P неустойчиво) считается пошагово.
+
+    Коэффициенты зависят только от rates, поэтому inflows может нести лишние
+    ведущие оси (например, сетку ставок взноса (n_rates, n_sims, n)) — они
+    транслируются на одни и те же alpha, beta.
+
+    Возвращает do, perc, var_fee, fixed_fee, total_fee, after_fee общей формы.
+    """
+    rates = np.asarray(rates, dtype=float)
+    n = rates.shape[-1]
+    inflows = np.asarray(total_inflows, dtype=float)[..., :n]
+    shape = np.broadcast_shapes(inflows.shape, rates.shape)
+
+    coefficients = fee.linear_coefficients(rates) if isinstance(fee, FeeSchedule) else None
+    if coefficients is None or not np.all(coefficients[0] > 0):
+        return _accumulate_stepped(np.broadcast_to(inflows, shape), np.broadcast_to(rates, shape), fee)
+
+    alpha, beta = coefficients
+    P = np.cumprod(alpha, axis=-1)
+    after_fee = P * np.cumsum(beta * inflows / P, axis=-1)
+
+    prev = np.zeros_like(after_fee)
+    prev[..., 1:] = after_fee[..., :-1]
+    do = inflows + prev
+    perc = do * rates
+    total_fee, var_fee, fixed_fee = fee(perc, prev, do + perc)
+
+    return {
+        'do': do,
+        'perc': perc,
+        'var_fee': np.broadcast_to(var_fee, shape).astype(float),
+        'fixed_fee': np.broadcast_to(fixed_fee, shape).astype(float),
+        'total_fee': np.broadcast_to(total_fee, shape).astype(float),
+        'after_fee': after_fee,
+    }
+
+
+def _accumulate_stepped(inflows: np.ndarray, rates: np.ndarray, fee: FeeFunction) -> dict:
+    n = rates.shape[-1]
+    do = np.zeros(rates.shape)
+    perc_arr = np.zeros(rates.shape)
+    var_fee_arr = np.zeros(rates.shape)
+    fixed_fee_arr = np.zeros(rates.shape)
+    total_fee_arr = np.zeros(rates.shape)
+    after_fee = np.zeros(rates.shape)
+
+    prev = np.zeros(rates.shape[:-1])
+    for i in range(n):
+        do[..., i] = inflows[..., i] + prev
+        perc_arr[..., i] = do[..., i] * rates[..., i]
+        after_i = do[..., i] + perc_arr[..., i]
+        total_fee_arr[..., i], var_fee_arr[..., i], fixed_fee_arr[..., i] = fee(perc_arr[..., i], prev, after_i)
+        after_fee[..., i] = after_i - total_fee_arr[..., i]
+        prev = after_fee[..., i]
+
+    return {
+        'do': do,
+        'perc': perc_arr,
+        'var_fee': var_fee_arr,
+        'fixed_fee': fixed_fee_arr,
+        'total_fee': total_fee_arr,
+        'after_fee': after_fee,
+    }
@@ -1,4 +1,5 @@
 from .base import BaseProgram
+from .batch import BaseBatchProgram
 
 
 class IIS3Program(BaseProgram):
@@ -9,4 +10,9 @@ class IIS3Program(BaseProgram):
     Если в будущем появятся особенности (например, лимит на взносы, другой tax deduction),
     их можно будет добавить здесь.
     """
-    pass
\ No newline at end of file
+    pass
+
+
+class IIS3BatchProgram(BaseBatchProgram):
+    """Пакетный ИИС-3: те же правила, что у IIS3Program, для n_sims траекторий сразу."""
+    pass
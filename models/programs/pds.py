@@ -1,34 +1,56 @@
 from .base import BaseProgram, ProgramInput
+from .batch import BaseBatchProgram, BatchProgramInput
+from .fees import LinearFee
 import numpy as np
 
 
-class PDSProgram(BaseProgram):
+class PDSRules:
+    """Параметры ПДС, общие для скалярного и пакетного движков."""
+    var_rate = 0.2
+    fixed_rate = 0.005
+    fee_schedule = LinearFee(var_rate=var_rate, fixed_rate=fixed_rate)
+
+    cofin_cap = 36_000
+    cofin_years = 10
+
+    @staticmethod
+    def cofin_share(initial_salary) -> float:
+        """Доля взноса прошлого года, которую софинансирует государство."""
+        if initial_salary < 80_000:
+            return 1.0
+        elif initial_salary < 150_000:
+            return 1 / 2
+        return 1 / 4
+
+
+class PDSProgram(PDSRules, BaseProgram):
     def __init__(self, params: ProgramInput, life_table):
         super().__init__(params, life_table)
 
-        self.var_rate = 0.2
-        self.fixed_rate = 0.005
-
     def _apply_co_financing(self) -> None:
         n = self.params.n
         co_fin = np.zeros(n + 1)
-        initial_salary = self.params.initial_salary
+        share = self.cofin_share(self.params.initial_salary)
 
         member_contrib = self.payments[:n]
 
-        for i in range(1, min(11, n + 1)):
+        for i in range(1, min(self.cofin_years + 1, n + 1)):
             contrib_prev_year = member_contrib[i - 1]
-
-            if initial_salary < 80_000:
-                co_fin[i] = min(36_000, contrib_prev_year)
-            elif initial_salary < 150_000:
-                co_fin[i] = min(36_000, contrib_prev_year / 2)
-            else:
-                co_fin[i] = min(36_000, contrib_prev_year / 4)
+            co_fin[i] = min(self.cofin_cap, contrib_prev_year * share)
 
         self.co_financing = co_fin
 
-    def _calculate_fee(self, perc: float, prev_value: float, current_value: float) -> tuple[float, float, float]:
-        var_fee = self.var_rate * perc
-        fixed_fee = self.fixed_rate * (prev_value + current_value) / 2
-        return var_fee + fixed_fee, var_fee, fixed_fee
\ No newline at end of file
+
+class PDSBatchProgram(PDSRules, BaseBatchProgram):
+    def __init__(self, params: BatchProgramInput, life_table):
+        super().__init__(params, life_table)
+
+    def _co_financing(self, payments: np.ndarray) -> np.ndarray:
+        n = self.params.n
+        co_fin = np.zeros(payments.shape)
+        share = self.cofin_share(self.params.initial_salary)
+
+        k = min(self.cofin_years, n)
+        co_fin[..., 1:k + 1] = np.minimum(self.cofin_cap, payments[..., :k] * share)
+
+        return co_fin
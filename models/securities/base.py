@@ -14,6 +14,43 @@ class SecurityModel(ABC):
     def simulate_path(self, correlated_shocks: np.ndarray, n_years: float, dt: float = 1/252) -> np.ndarray:
         pass
 
+    def simulate_paths(self, correlated_shocks: np.ndarray, n_years: float, dt: float = 1/252) -> np.ndarray:
+        """
+        Батч-версия simulate_path: шоки (n_steps, n_sims) → пути (n_steps, n_sims).
+        По умолчанию — цикл по симуляциям; наследники переопределяют векторизованно.
+        """
+        return np.column_stack([
+            self.simulate_path(correlated_shocks[:, j], n_years, dt)
+            for j in range(correlated_shocks.shape[1])
+        ])
+
+    @abstractmethod
+    def exact_kernel(self) -> tuple[float, float]:
+        """
+        Параметры (σ, a) стохастической части за шаг h: σ·∫₀ʰ e^{−a(h−s)} dW_s.
+        Нужны PortfolioModel для точной совместной ковариации инноваций активов.
+        """
+        pass
+
+    @abstractmethod
+    def simulate_exact(self, innovations: np.ndarray, step: float = 1.0) -> np.ndarray:
+        """
+        Путь на грубой сетке с шагом step (в годах) по точному переходному закону.
+        innovations (n_rows, n_sims) — уже масштабированные стохастические интегралы
+        за шаг (строка 0 не используется). Возвращает (n_rows, n_sims).
+        """
+        pass
+
+    @abstractmethod
+    def expected_path(self, n_years: float, dt: float = 1/252, sample_every: int = 1,
+                      method: str = 'daily') -> np.ndarray:
+        """
+        Аналитическое E[путь] в строках PortfolioModel.simulate_assets
+        (каждое sample_every-е наблюдение; method — 'daily' или 'exact').
+        Нужно как известное среднее для контрольных переменных.
+        """
+        pass
+
 @dataclass
 class SecurityParams:
     """Базовые параметры любого актива."""
@@ -28,4 +65,4 @@ class StockParams(SecurityParams):
 class BondParams(SecurityParams):
     a: float   # скорость возврата к среднему
     b: float   # долгосрочное среднее
-    Y0: float  # начальная доходность
\ No newline at end of file
+    Y0: float  # начальная доходность
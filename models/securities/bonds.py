@@ -1,18 +1,77 @@
 import numpy as np
+from typing import Literal
+from scipy.signal import lfilter
 from .base import SecurityModel, BondParams
 
 class BondModel(SecurityModel):
-    def __init__(self, params: BondParams):
+    """
+    Доходность облигаций по Васичеку (OU): dY = a(b − Y)dt + σdW.
+
+    scheme='euler' — схема Эйлера с шагом dt (как раньше);
+    scheme='exact' — точный переходный закон OU, несмещённый при любом шаге dt:
+        Y[t] = b + (Y[t−1] − b)·e^{−a·dt} + σ·√((1 − e^{−2a·dt}) / (2a))·Z[t]
+    """
+
+    def __init__(self, params: BondParams, scheme: Literal['euler', 'exact'] = 'euler'):
         super().__init__(params)
+        if scheme not in ('euler', 'exact'):
+            raise ValueError(f'Invalid scheme. Expected "euler" or "exact", receive: {scheme}')
+        self.scheme = scheme
 
     def get_weight(self) -> float:
         return self.params.weight
 
+    def transition_coefficients(self, dt: float) -> tuple[float, float, float]:
+        """Коэффициенты AR(1)-рекурсии Y[t] = phi·Y[t−1] + c + s·Z[t]."""
+        a, b, sigma = self.params.a, self.params.b, self.params.sigma
+        if self.scheme == 'euler':
+            phi = 1 - a * dt
+            return phi, a * b * dt, sigma * np.sqrt(dt)
+
+        phi = np.exp(-a * dt)
+        s = sigma * np.sqrt((1 - phi ** 2) / (2 * a)) if a > 0 else sigma * np.sqrt(dt)
+        return phi, b * (1 - phi), s
+
     def simulate_path(self, correlated_shocks: np.ndarray, n_years: float, dt: float = 1/252) -> np.ndarray:
+        return self.simulate_paths(correlated_shocks, n_years, dt)
+
+    def simulate_paths(self, correlated_shocks: np.ndarray, n_years: float, dt: float = 1/252) -> np.ndarray:
+        """
+        Рекурсия вычисляется линейным фильтром lfilter сразу по всем симуляциям.
+        Форма выхода повторяет форму шоков: (n_steps,) или (n_steps, n_sims).
+        """
         n_steps = int(n_years / dt)
-        Y = np.zeros(n_steps)
-        Y[0] = self.params.Y0
-        for t in range(1, n_steps):
-            Y[t] = (Y[t-1] + self.params.a * (self.params.b - Y[t-1]) * dt +
-                    self.params.sigma * np.sqrt(dt) * correlated_shocks[t])
-        return Y
+        phi, c, s = self.transition_coefficients(dt)
+
+        x = c + s * np.asarray(correlated_shocks[:n_steps], dtype=float)
+        x[0] = self.params.Y0
+        return lfilter([1.0], [1.0, -phi], x, axis=0)
+
+    def exact_kernel(self) -> tuple[float, float]:
+        return self.params.sigma, self.params.a
+
+    def simulate_exact(self, innovations: np.ndarray, step: float = 1.0) -> np.ndarray:
+        """Точный переход OU на шаге step: Y[k] = b + (Y[k−1] − b)·e^{−a·step} + ε[k]."""
+        phi = np.exp(-self.params.a * step)
+        x = self.params.b * (1 - phi) + np.asarray(innovations, dtype=float)
+        x[0] = self.params.Y0
+        return lfilter([1.0], [1.0, -phi], x, axis=0)
+
+    def expected_path(self, n_years: float, dt: float = 1/252, sample_every: int = 1,
+                      method: str = 'daily') -> np.ndarray:
+        """
+        E[Y] линейной рекурсии Y[t] = phi·Y[t−1] + c + s·Z[t] из Y0:
+        m + (Y0 − m)·phi^t, m = c / (1 − phi) = b (для a = 0 — Y0 + c·t).
+        exact — шаг sample_every · dt по точному закону, daily — шаг dt схемы scheme.
+        """
+        rows = np.arange(0, int(n_years / dt), sample_every)
+        Y0 = self.params.Y0
+        if method == 'exact':
+            t = np.arange(len(rows))
+            return self.params.b + (Y0 - self.params.b) * np.exp(-self.params.a * sample_every * dt * t)
+
+        phi, c, _ = self.transition_coefficients(dt)
+        if np.isclose(phi, 1.0):
+            return Y0 + c * rows
+        m = c / (1 - phi)
+        return m + (Y0 - m) * phi ** rows
@@ -1,6 +1,9 @@
 import numpy as np
+from typing import Literal, Optional
 from tqdm import tqdm
+from models.utils import as_generator
 from .base import SecurityModel
+from .shocks import ShockSource, PseudoRandomShocks
 
 class PortfolioModel:
     def __init__(self, assets: list[SecurityModel], corr_matrix: np.ndarray):
@@ -8,6 +11,7 @@ class PortfolioModel:
         self.corr_matrix = corr_matrix
         self.n_assets = len(assets)
         self.L = np.linalg.cholesky(corr_matrix)
+        self.weights = np.array([a.get_weight() for a in assets])
 
         self.__check_weights__()
 
@@ -17,16 +21,146 @@ class PortfolioModel:
         if not np.isclose(total_weight, 1.0, atol=1e-6):
             raise ValueError(f"Weigts sum should be equal 1, receive: {total_weight}")
 
-    def simulate(self, n_years: int, n_simulations: int = 5, dt: float = 1/252, show_progress: bool = True):
-        n_steps = int(n_years / dt)
-        portfolio_values = np.zeros((n_steps, n_simulations))
+    def simulate(self, n_years: int, n_simulations: int = 5, dt: float = 1/252, show_progress: bool = True,
+                 chunk_size: int = 500, sample_every: int = 1, method: Literal['daily', 'exact'] = 'daily',
+                 rng: Optional[np.random.Generator] = None, shock_source: Optional[ShockSource] = None):
+        """
+        Симулирует доходности портфеля блоками по chunk_size траекторий.
+
+        Динамика всегда считается с шагом dt, но из каждого блока сохраняется
+        только каждое sample_every-е наблюдение (sample_every=252 — годовые точки,
+        как returns_matrix[::252]), поэтому пиковая память ограничена блоком.
+
+        method='exact' — годовые доходности сразу из точного совместного закона
+        GBM/OU (см. sample_exact_from_shocks), без дневного пути; требует
+        годовой сетки: sample_every · dt = 1.
 
-        for sim in tqdm(range(n_simulations)):
-            Z = np.random.normal(size=(self.n_assets, n_steps))
-            Z_corr = self.L @ Z
+        Шоки берутся из rng (numpy.random.Generator, seed или None — свежий поток);
+        shock_source — источник шоков (по умолчанию PseudoRandomShocks, для
+        квази-Монте-Карло — QMCShocks, см. models.securities.shocks).
 
-            for i, asset in enumerate(self.assets):
-                path = asset.simulate_path(Z_corr[i], n_years, dt)
-                portfolio_values[:, sim] += path * asset.get_weight()
+        Возвращает матрицу (ceil(n_steps / sample_every), n_simulations);
+        show_progress включает прогресс-бар по блокам.
+        """
+        n_rows = len(range(0, int(n_years / dt), sample_every))
+        portfolio_values = np.zeros((n_rows, n_simulations))
+
+        for start, stop, paths in self._iter_asset_chunks(n_years, n_simulations, dt, show_progress,
+                                                          chunk_size, sample_every, method, rng, shock_source):
+            portfolio_values[:, start:stop] = np.tensordot(self.weights, paths, axes=(0, 0))
 
         return portfolio_values
+
+    def simulate_assets(self, n_years: int, n_simulations: int = 5, dt: float = 1/252, show_progress: bool = True,
+                        chunk_size: int = 500, sample_every: int = 1, method: Literal['daily', 'exact'] = 'daily',
+                        rng: Optional[np.random.Generator] = None, shock_source: Optional[ShockSource] = None):
+        """
+        Симулирует пути каждого актива (без взвешивания) с теми же параметрами, что simulate.
+
+        Возвращает тензор (n_assets, ceil(n_steps / sample_every), n_simulations):
+        один раз просимулированные активы можно свернуть в сколько угодно
+        портфелей через combine.
+        """
+        n_rows = len(range(0, int(n_years / dt), sample_every))
+        asset_paths = np.zeros((self.n_assets, n_rows, n_simulations))
+
+        for start, stop, paths in self._iter_asset_chunks(n_years, n_simulations, dt, show_progress,
+                                                          chunk_size, sample_every, method, rng, shock_source):
+            asset_paths[:, :, start:stop] = paths
+
+        return asset_paths
+
+    @staticmethod
+    def combine(asset_paths: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        Доходности портфелей из путей активов (n_assets, n_rows, n_sims) одним
+        матричным произведением. weights (n_assets,) → (n_rows, n_sims);
+        weights (n_portfolios, n_assets) → (n_portfolios, n_rows, n_sims).
+        """
+        return np.tensordot(np.asarray(weights, dtype=float), asset_paths, axes=(-1, 0))
+
+    def shock_rows(self, n_years: int, dt: float = 1/252, sample_every: int = 1,
+                   method: Literal['daily', 'exact'] = 'daily') -> int:
+        """
+        Число строк тензора шоков (n_assets, n_rows, n_sims) для assets_from_shocks:
+        n_steps для daily, число выходных точек для exact.
+        """
+        n_steps = int(n_years / dt)
+        if method == 'exact':
+            step = sample_every * dt
+            if not np.isclose(step, 1.0):
+                raise ValueError(f'Exact method supports annual output only (sample_every * dt = 1), receive: {step}')
+            return len(range(0, n_steps, sample_every))
+        if method != 'daily':
+            raise ValueError(f'Invalid method. Expected "daily" or "exact", receive: {method}')
+        return n_steps
+
+    def assets_from_shocks(self, shocks: np.ndarray, n_years: int, dt: float = 1/252, sample_every: int = 1,
+                           method: Literal['daily', 'exact'] = 'daily') -> np.ndarray:
+        """
+        Пути активов (n_assets, ceil(n_steps / sample_every), n_sims) по готовым
+        N(0, 1) шокам формы (n_assets, shock_rows(...), n_sims) — как в simulate_assets.
+        Одни и те же шоки можно подать в портфели с разными параметрами активов.
+        """
+        if method == 'exact':
+            return self.sample_exact_from_shocks(shocks, sample_every * dt)
+        return self.simulate_assets_from_shocks(shocks, n_years, dt)[:, ::sample_every]
+
+    def _iter_asset_chunks(self, n_years, n_simulations, dt, show_progress, chunk_size, sample_every, method, rng,
+                           shock_source=None):
+        n_shock_rows = self.shock_rows(n_years, dt, sample_every, method)
+        draw = (shock_source or PseudoRandomShocks()).sampler(self.n_assets, n_shock_rows, n_simulations,
+                                                              as_generator(rng))
+
+        starts = range(0, n_simulations, chunk_size)
+        for start in tqdm(starts, disable=not show_progress):
+            stop = min(start + chunk_size, n_simulations)
+            yield start, stop, self.assets_from_shocks(draw(stop - start), n_years, dt, sample_every, method)
+
+    def simulate_from_shocks(self, shocks: np.ndarray, n_years: int, dt: float = 1/252) -> np.ndarray:
+        """
+        Пакетная симуляция по готовому тензору независимых N(0, 1) шоков
+        формы (n_assets, n_steps, n_sims). Возвращает матрицу (n_steps, n_sims).
+        """
+        return np.tensordot(self.weights, self.simulate_assets_from_shocks(shocks, n_years, dt), axes=(0, 0))
+
+    def simulate_assets_from_shocks(self, shocks: np.ndarray, n_years: int, dt: float = 1/252) -> np.ndarray:
+        """
+        То же, что simulate_from_shocks, но без взвешивания:
+        возвращает пути каждого актива, тензор (n_assets, n_steps, n_sims).
+        """
+        Z_corr = np.tensordot(self.L, shocks, axes=(1, 0))
+        return np.stack([
+            asset.simulate_paths(Z_corr[i], n_years, dt)
+            for i, asset in enumerate(self.assets)
+        ])
+
+    def exact_covariance(self, step: float = 1.0) -> np.ndarray:
+        """
+        Ковариация инноваций активов за шаг step для точной схемы.
+
+        Инновация актива i — σ_i·∫₀ʰ e^{−a_i(h−s)} dW_i(s) (a = 0 для GBM), откуда
+            Cov_ij = ρ_ij · σ_i · σ_j · (1 − e^{−(a_i + a_j)·h}) / (a_i + a_j)
+        с пределом ρ_ij · σ_i · σ_j · h при a_i + a_j = 0.
+        """
+        kernels = np.array([asset.exact_kernel() for asset in self.assets])
+        sigma, a = kernels[:, 0], kernels[:, 1]
+        a_sum = a[:, None] + a[None, :]
+        safe = np.where(a_sum > 0, a_sum, 1.0)
+        g = np.where(a_sum > 0, -np.expm1(-safe * step) / safe, step)
+        return np.asarray(self.corr_matrix) * np.outer(sigma, sigma) * g
+
+    def sample_exact_from_shocks(self, shocks: np.ndarray, step: float = 1.0) -> np.ndarray:
+        """
+        Точная выборка путей активов на сетке с шагом step (в годах).
+
+        shocks — независимые N(0, 1) формы (n_assets, n_rows, n_sims); строка 0
+        соответствует начальной точке и не используется. Возвращает тензор
+        (n_assets, n_rows, n_sims) — те же строки, что daily-путь с шагом step.
+        """
+        L_exact = np.linalg.cholesky(self.exact_covariance(step))
+        innovations = np.tensordot(L_exact, shocks, axes=(1, 0))
+        return np.stack([
+            asset.simulate_exact(innovations[i], step)
+            for i, asset in enumerate(self.assets)
+        ])
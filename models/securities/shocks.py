@@ -0,0 +1,197 @@
+import warnings
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Callable, Literal, Optional
+from scipy.stats import qmc
+from scipy.special import ndtri
+from models.utils import as_generator
+
+# ── источники шоков ───────────────────────────────────────────────────────────
+# Источник выдаёт независимые N(0, 1) шоки (n_assets, n_rows, n) блоками
+# по n траекторий — так, как их тянет PortfolioModel по chunk_size.
+
+ShockDraw = Callable[[int], np.ndarray]
+
+# скремблированный Halton хранит перестановки по простым основаниям всех координат —
+# для дневной сетки (4 · 3780 координат) это десятки гигабайт
+HALTON_MAX_DIM = 1_000
+
+
+class ShockSource(ABC):
+
+    @abstractmethod
+    def sampler(self, n_assets: int, n_rows: int, n_sims: int,
+                rng: Optional[np.random.Generator] = None) -> ShockDraw:
+        """
+        Генератор шоков для одной симуляции n_sims траекторий:
+        draw(n) -> (n_assets, n_rows, n), последовательные вызовы дают
+        следующие траектории (суммарно n_sims).
+        """
+        ...
+
+
+class PseudoRandomShocks(ShockSource):
+    """Обычные псевдослучайные N(0, 1) из rng — поведение по умолчанию."""
+
+    def sampler(self, n_assets, n_rows, n_sims, rng=None):
+        rng = as_generator(rng)
+        return lambda n: rng.standard_normal(size=(n_assets, n_rows, n))
+
+
+class QMCShocks(ShockSource):
+    """
+    Рандомизированный квази-Монте-Карло: scrambled Sobol / Halton (scipy.stats.qmc).
+
+    Траектория — точка размерности n_assets · n_rows; нормали — обратной функцией
+    распределения. bridge=True — порядок броуновского моста: первые координаты
+    точки задают W(T) всех активов, следующие — середины отрезков и т.д., так что
+    самые равномерные координаты QMC уходят на крупный масштаб пути. Приращения
+    моста снова независимые N(0, 1), поэтому модели активов не меняются.
+    bridge=False — координаты идут по строкам времени.
+
+    n_replicates независимых скремблирований: траектории делятся на n_replicates
+    подряд идущих блоков по n_sims // n_replicates, каждый блок — своя
+    рандомизация. Разброс средних по блокам даёт ошибку RQMC (см. rqmc_error).
+    Для Sobol блок лучше брать степенью двойки (n_sims = n_replicates · 2^k).
+    """
+
+    def __init__(self, engine: Literal['sobol', 'halton'] = 'sobol', bridge: bool = True,
+                 n_replicates: int = 8):
+        if engine not in ('sobol', 'halton'):
+            raise ValueError(f'Invalid engine. Expected "sobol" or "halton", receive: {engine}')
+        if n_replicates < 1:
+            raise ValueError(f'n_replicates should be positive, receive: {n_replicates}')
+        self.engine = engine
+        self.bridge = bridge
+        self.n_replicates = n_replicates
+
+    def _engine(self, d: int, seed: np.random.Generator) -> qmc.QMCEngine:
+        if self.engine == 'sobol':
+            return qmc.Sobol(d, scramble=True, seed=seed)
+        if d > HALTON_MAX_DIM:
+            raise ValueError(f'Halton is impractical for dimension {d} > {HALTON_MAX_DIM}; '
+                             f'use engine="sobol" or method="exact"')
+        return qmc.Halton(d, scramble=True, seed=seed)
+
+    def sampler(self, n_assets, n_rows, n_sims, rng=None):
+        if n_sims % self.n_replicates:
+            raise ValueError(f'n_sims should be divisible by n_replicates={self.n_replicates}, receive: {n_sims}')
+        block = n_sims // self.n_replicates
+        engines = [self._engine(n_assets * n_rows, seed) for seed in as_generator(rng).spawn(self.n_replicates)]
+        drawn = 0
+
+        def draw(n: int) -> np.ndarray:
+            nonlocal drawn
+            parts = []
+            while n > 0:
+                r, offset = divmod(drawn, block)
+                take = min(n, block - offset)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)   # баланс Sobol при n ≠ 2^k
+                    parts.append(engines[r].random(take))
+                drawn += take
+                n -= take
+
+            u = np.concatenate(parts)
+            z = ndtri(np.clip(u, 1e-16, 1 - 1e-16)).reshape(-1, n_rows, n_assets)
+            if self.bridge:
+                z = brownian_bridge_increments(z, axis=1)
+            return np.transpose(z, (2, 1, 0))
+
+        return draw
+
+
+class AntitheticShocks(ShockSource):
+    """
+    Антитетические пары: траектории 2k и 2k + 1 получают шоки Z и −Z,
+    Z — из base (по умолчанию псевдослучайные). n_sims должно быть чётным;
+    средние по парам независимы (см. quality.variance_reduction.antithetic_mean).
+    Границы блоков draw(n) могут разрезать пару — вторая половина выдаётся
+    в начале следующего блока.
+    """
+
+    def __init__(self, base: Optional[ShockSource] = None):
+        self.base = base or PseudoRandomShocks()
+
+    def sampler(self, n_assets, n_rows, n_sims, rng=None):
+        if n_sims % 2:
+            raise ValueError(f'Antithetic sampling requires even n_sims, receive: {n_sims}')
+        base_draw = self.base.sampler(n_assets, n_rows, n_sims // 2, rng)
+        pending = None   # −Z пары, чья первая половина попала в прошлый блок
+
+        def draw(n: int) -> np.ndarray:
+            nonlocal pending
+            parts = []
+            if pending is not None and n > 0:
+                parts.append(pending)
+                pending, n = None, n - 1
+            n_pairs = (n + 1) // 2
+            if n_pairs:
+                z = base_draw(n_pairs)
+                pairs = np.stack([z, -z], axis=-1).reshape(n_assets, n_rows, 2 * n_pairs)
+                if n % 2:
+                    pending = pairs[..., -1:]
+                    pairs = pairs[..., :-1]
+                parts.append(pairs)
+            return np.concatenate(parts, axis=-1)
+
+        return draw
+
+
+# ── броуновский мост ─────────────────────────────────────────────────────────
+
+def _bridge_schedule(n: int) -> list[tuple[int, int, int]]:
+    """Порядок построения моста на сетке 0..n после W(n): (left, mid, right), от крупных отрезков к мелким."""
+    schedule, intervals = [], [(0, n)]
+    while intervals:
+        nxt = []
+        for left, right in intervals:
+            if right - left > 1:
+                mid = (left + right) // 2
+                schedule.append((left, mid, right))
+                nxt += [(left, mid), (mid, right)]
+        intervals = nxt
+    return schedule
+
+
+def brownian_bridge_increments(z: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    Приращения броуновского движения на единичной сетке из n шагов по
+    координатам z (вдоль axis) в порядке моста: z[0] → W(n), z[1] → W(n/2), ...
+    Для z из N(0, 1) приращения — снова независимые N(0, 1).
+    """
+    z = np.moveaxis(np.asarray(z, dtype=float), axis, 0)
+    n = z.shape[0]
+    W = np.zeros((n + 1,) + z.shape[1:])
+    W[n] = np.sqrt(n) * z[0]
+    for k, (left, mid, right) in enumerate(_bridge_schedule(n), start=1):
+        w = (mid - left) / (right - left)
+        W[mid] = (1 - w) * W[left] + w * W[right] + np.sqrt((mid - left) * (right - mid) / (right - left)) * z[k]
+    return np.moveaxis(np.diff(W, axis=0), 0, axis)
+
+
+# ── ошибка RQMC ──────────────────────────────────────────────────────────────
+
+def rqmc_error(values: np.ndarray, n_replicates: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Среднее и стандартная ошибка по траекториям (последняя ось) для выборки
+    QMCShocks: средние n_replicates блоков независимы, SE — их разброс / √R.
+    Для псевдослучайных шоков совпадает по смыслу с обычной SE батч-средних.
+    NaN пропускаются внутри блока.
+    """
+    values = np.asarray(values, dtype=float)
+    means = np.nanmean(values.reshape(values.shape[:-1] + (n_replicates, -1)), axis=-1)
+    return means.mean(axis=-1), means.std(axis=-1, ddof=1) / np.sqrt(n_replicates)
+
+
+def rqmc_replicates(shock_source: Optional[ShockSource]) -> Optional[int]:
+    """
+    Число рандомизаций, если шоки — QMCShocks (в т.ч. внутри AntitheticShocks:
+    пары лежат внутри блоков рандомизаций), иначе None — траектории iid.
+    """
+    source = shock_source
+    while source is not None:
+        if isinstance(source, QMCShocks):
+            return source.n_replicates
+        source = getattr(source, 'base', None)
+    return None
@@ -1,5 +1,5 @@
 import numpy as np
-import pandas as pd
+from models.utils import rolling_prod
 from .base import SecurityModel, StockParams
 
 class StockModel(SecurityModel):
@@ -10,8 +10,35 @@ class StockModel(SecurityModel):
         return self.params.weight
 
     def simulate_path(self, correlated_shocks: np.ndarray, n_years: float, dt: float = 1/252) -> np.ndarray:
+        return self.simulate_paths(correlated_shocks, n_years, dt)
+
+    def simulate_paths(self, correlated_shocks: np.ndarray, n_years: float, dt: float = 1/252) -> np.ndarray:
         n_steps = int(n_years / dt)
         returns = self.params.mu * dt + self.params.sigma * np.sqrt(dt) * correlated_shocks[:n_steps]
-        series = pd.Series(1 + returns)
-        rolling = series.rolling(window=252).apply(lambda x: x.prod()) - 1
-        return np.nan_to_num(rolling.values, nan=0.0)
\ No newline at end of file
+        rolling = rolling_prod(1 + returns, window=252) - 1
+        return np.nan_to_num(rolling, nan=0.0)
+
+    def exact_kernel(self) -> tuple[float, float]:
+        return self.params.sigma, 0.0
+
+    def simulate_exact(self, innovations: np.ndarray, step: float = 1.0) -> np.ndarray:
+        """
+        Доходность GBM за шаг: exp((μ − σ²/2)·step + σW_step) − 1.
+        Строка 0 = 0, как у неполного первого окна в simulate_paths.
+        """
+        returns = np.expm1((self.params.mu - self.params.sigma ** 2 / 2) * step + innovations)
+        returns[0] = 0.0
+        return returns
+
+    def expected_path(self, n_years: float, dt: float = 1/252, sample_every: int = 1,
+                      method: str = 'daily') -> np.ndarray:
+        """
+        daily: окно из 252 независимых шагов → E = (1 + μ·dt)^252 − 1, неполные окна — 0;
+        exact: E[exp((μ − σ²/2)·h + σW_h)] − 1 = e^{μh} − 1, строка 0 — 0.
+        """
+        rows = np.arange(0, int(n_years / dt), sample_every)
+        if method == 'exact':
+            mean = np.full(len(rows), np.expm1(self.params.mu * sample_every * dt))
+            mean[0] = 0.0
+            return mean
+        return np.where(rows >= 251, (1 + self.params.mu * dt) ** 252 - 1, 0.0)
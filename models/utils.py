@@ -0,0 +1,64 @@
+import numpy as np
+
+
+def rolling_prod(values: np.ndarray, window: int, axis: int = 0) -> np.ndarray:
+    """
+    Скользящее произведение по окну window вдоль оси axis за O(n).
+
+    Считается через накопленную сумму log|x|; знак восстанавливается по чётности
+    числа отрицательных множителей, нули и NaN учитываются отдельными счётчиками.
+    Как и pandas rolling(window).apply(prod): неполные окна и окна с NaN → NaN.
+    Работает и для одномерных путей, и для матриц путей (n_steps, n_sims).
+    """
+    x = np.moveaxis(np.asarray(values, dtype=float), axis, 0)
+    n = x.shape[0]
+    out = np.full(x.shape, np.nan)
+    if n < window:
+        return np.moveaxis(out, 0, axis)
+
+    nan_mask = np.isnan(x)
+    zero_mask = x == 0
+    neg_mask = x < 0
+    with np.errstate(divide='ignore'):
+        log_abs = np.where(nan_mask | zero_mask, 0.0, np.log(np.abs(x)))
+
+    def window_sum(arr):
+        csum = np.cumsum(arr, axis=0)
+        res = csum[window - 1:].copy()
+        res[1:] -= csum[:-window]
+        return res
+
+    log_sum = window_sum(log_abs)
+    n_nan = window_sum(nan_mask.astype(np.int64))
+    n_zero = window_sum(zero_mask.astype(np.int64))
+    n_neg = window_sum(neg_mask.astype(np.int64))
+
+    prod = np.exp(log_sum) * np.where(n_neg % 2 == 1, -1.0, 1.0)
+    prod[n_zero > 0] = 0.0
+    prod[n_nan > 0] = np.nan
+    out[window - 1:] = prod
+    return np.moveaxis(out, 0, axis)
+
+
+def as_generator(rng=None) -> np.random.Generator:
+    """
+    Приводит rng к numpy.random.Generator: готовый Generator возвращается как есть,
+    None / int / SeedSequence передаются в np.random.default_rng.
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def spawn_generators(seed, n: int) -> list[np.random.Generator]:
+    """n независимых воспроизводимых потоков из корневого SeedSequence (например, по воркерам)."""
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in root.spawn(n)]
+
+
+def cell_generator(root_seed: int, *key: int) -> np.random.Generator:
+    """
+    Поток для ячейки сетки сценариев, заданной целочисленными координатами key.
+    Зависит только от (root_seed, key), а не от порядка обхода или числа воркеров.
+    """
+    return np.random.default_rng(np.random.SeedSequence(root_seed, spawn_key=tuple(int(k) for k in key)))
@@ -4,15 +4,20 @@ quality/calibration.py
 Научно обоснованный модуль калибровки и верификации стохастической модели NIR.
 
 Применяемые методы:
-  1. GBM акций          — метод моментов для log-доходности: t-тест (E) и χ²-тест (Var)
+  1. GBM акций          — метод моментов для log-доходности: t-тест (E) и χ²-тест (Var);
+                          согласие дневной и точной годовой схем
   2. Vasicek облигации  — аналитические моменты OU-процесса: E[Y_T] и Var[Y_T]
-  3. Корреляции портфеля — сохранение структуры через разложение Холецкого
+                          (дневная и точная схемы)
+  3. Корреляции портфеля — сохранение структуры через разложение Холецкого;
+                          годовые корреляции в дневной и точной схемах
   4. Детерм. зарплата   — точная формула сложного роста (машинная точность)
   5. Безработица: частота   — биномиальный тест для p_exit
   6. Безработица: длительность — критерий Колмогорова–Смирнова против Weibull(k, λ)
   7. Аннуитетная формула — FV калькулятора vs. аналитическая FV аннуитета-дью
   8. Монотонность        — взносы / комиссии / налог / софинансирование
   9. Сходимость МК       — std_error убывает ∝ 1/√N (ЦПТ)
+ 10. Понижение дисперсии — антитетика и контрольная переменная против
+                          аналитического FV аннуитета при GBM-доходностях
 """
 from __future__ import annotations
 
@@ -22,11 +27,14 @@ from dataclasses import dataclass, field
 
 from models.securities.stocks import StockModel, StockParams
 from models.securities.bonds import BondModel, BondParams
+from models.securities.portfolio import PortfolioModel
 from models.macro.salary import DeterministicSalaryModel
 from models.macro.unemployment import WeibullUnemploymentModel
 from models.programs.base import ProgramInput
 from models.programs.iis3 import IIS3Program
 from models.programs.pds import PDSProgram
+from models.securities.shocks import AntitheticShocks
+from quality.variance_reduction import annuity_value, annuity_control, estimate_mean
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -51,7 +59,7 @@ class TestResult:
 
 class CalibrationSuite:
     """
-    Запускает 9 групп тестов, покрывающих все компоненты модели.
+    Запускает 10 групп тестов, покрывающих все компоненты модели.
 
     Parameters
     ----------
@@ -64,13 +72,14 @@ class CalibrationSuite:
         self.n_sims = n_sims
         self.alpha = alpha
         self.seed = seed
+        self.rng = np.random.default_rng(seed)
         self.results: list[TestResult] = []
 
     # ── public API ────────────────────────────────────────────────────────────
 
     def run_all(self) -> list[TestResult]:
         """Запустить все тесты и вернуть список результатов."""
-        np.random.seed(self.seed)
+        self.rng = np.random.default_rng(self.seed)
         self.results = []
 
         self._test_stock_log_moments()
@@ -82,6 +91,7 @@ class CalibrationSuite:
         self._test_program_annuity_formula()
         self._test_program_monotonicity()
         self._test_monte_carlo_convergence()
+        self._test_variance_reduction()
 
         return self.results
 
@@ -121,6 +131,11 @@ class CalibrationSuite:
             ln(1 + R_annual) ~ N(μ − σ²/2, σ²)
 
         Тесты: двусторонний t-тест для E[ln(1+R)] и χ²-тест для Var[ln(1+R)].
+
+        Дополнительно точная годовая схема PortfolioModel (method='exact')
+        проверяется теми же тестами и сравнивается с дневной: t-тест Уэлча
+        для средних и F-тест для дисперсий двух выборок. Уровень значимости
+        делится на число проверок (поправка Бонферрони).
         """
         name = "GBM акций: моменты log-доходности"
         n_steps = int(1.0 / dt)  # 252 шага = 1 год
@@ -128,7 +143,7 @@ class CalibrationSuite:
 
         log_returns = np.empty(self.n_sims)
         for i in range(self.n_sims):
-            Z = np.random.normal(size=n_steps)
+            Z = self.rng.normal(size=n_steps)
             path = model.simulate_path(Z, n_years=1.0, dt=dt)
             log_returns[i] = np.log(1.0 + path[-1])  # последний элемент — первое полное окно
 
@@ -138,25 +153,49 @@ class CalibrationSuite:
         theo_mean = mu - sigma ** 2 / 2.0
         theo_var = sigma ** 2
 
-        # t-тест для среднего
-        _, p_mean = stats.ttest_1samp(finite, popmean=theo_mean)
+        def moment_tests(sample):
+            # t-тест для среднего
+            _, p_m = stats.ttest_1samp(sample, popmean=theo_mean)
+            # χ²-тест для дисперсии
+            k = len(sample)
+            chi2 = (k - 1) * np.var(sample, ddof=1) / theo_var
+            p_v = 2 * min(stats.chi2.cdf(chi2, k - 1), stats.chi2.sf(chi2, k - 1))
+            return float(p_m), float(p_v)
+
+        p_mean, p_var = moment_tests(finite)
+
+        # точная годовая схема: строка 1 — доходность за первый год
+        exact = PortfolioModel([model], np.eye(1)).simulate(
+            n_years=2, n_simulations=self.n_sims, dt=dt, show_progress=False,
+            sample_every=n_steps, method='exact', rng=self.rng,
+        )
+        exact_log = np.log1p(exact[1])
+        p_mean_exact, p_var_exact = moment_tests(exact_log)
 
-        # χ²-тест для дисперсии
-        chi2 = (n - 1) * np.var(finite, ddof=1) / theo_var
-        p_var = 2 * min(stats.chi2.cdf(chi2, n - 1), stats.chi2.sf(chi2, n - 1))
+        # согласованность дневной и точной схем
+        _, p_mean_modes = stats.ttest_ind(finite, exact_log, equal_var=False)
+        f_stat = np.var(finite, ddof=1) / np.var(exact_log, ddof=1)
+        dfn, dfd = n - 1, len(exact_log) - 1
+        p_var_modes = 2 * min(stats.f.cdf(f_stat, dfn, dfd), stats.f.sf(f_stat, dfn, dfd))
 
         rel_err_mean = abs(finite.mean() - theo_mean) / (abs(theo_mean) + 1e-12)
         rel_err_std = abs(np.std(finite, ddof=1) - sigma) / sigma
-        passed = (p_mean > self.alpha) and (p_var > self.alpha)
+        # поправка Бонферрони на множественную проверку
+        p_values = (p_mean, p_var, p_mean_exact, p_var_exact, p_mean_modes, p_var_modes)
+        passed = all(p > self.alpha / len(p_values) for p in p_values)
 
         self._add(TestResult(
             name=name, passed=passed,
             message=(f"err_mean={rel_err_mean:.3%}, err_std={rel_err_std:.3%}, "
-                     f"p_mean={p_mean:.3f}, p_var={p_var:.3f}"),
+                     f"p_mean={p_mean:.3f}, p_var={p_var:.3f}, "
+                     f"exact vs daily: p_mean={p_mean_modes:.3f}, p_var={p_var_modes:.3f}"),
             details=dict(
                 theoretical_mean=theo_mean, simulated_mean=float(finite.mean()),
                 theoretical_std=sigma, simulated_std=float(np.std(finite, ddof=1)),
                 p_mean=float(p_mean), p_var=float(p_var),
+                exact_mean=float(exact_log.mean()), exact_std=float(np.std(exact_log, ddof=1)),
+                p_mean_exact=p_mean_exact, p_var_exact=p_var_exact,
+                p_mean_modes=float(p_mean_modes), p_var_modes=float(p_var_modes),
             ),
         ))
 
@@ -179,7 +218,8 @@ class CalibrationSuite:
             E[Y_T]   = b + (Y₀ − b)·exp(−aT)
             Var[Y_T] = σ²/(2a)·(1 − exp(−2aT))
 
-        Тест: относительная ошибка симуляции vs. теории < rtol на каждом горизонте.
+        Тест: относительная ошибка симуляции vs. теории < rtol на каждом горизонте —
+        и для дневной схемы Эйлера, и для точной годовой схемы (method='exact').
         """
         name = "Vasicek облигации: сходимость моментов"
         max_T = max(horizons)
@@ -191,29 +231,35 @@ class CalibrationSuite:
         snapshots = {T: np.empty(self.n_sims) for T in horizons}
 
         for i in range(self.n_sims):
-            Z = np.random.normal(size=n_steps)
+            Z = self.rng.normal(size=n_steps)
             path = model.simulate_path(Z, n_years=max_T, dt=dt)
             for T in horizons:
                 snapshots[T][i] = path[last_indices[T]]
 
+        # точная схема: годовая сетка, строка T — значение Y_T
+        exact = PortfolioModel([model], np.eye(1)).simulate(
+            n_years=max_T + 1, n_simulations=self.n_sims, dt=dt, show_progress=False,
+            sample_every=int(round(1 / dt)), method='exact', rng=self.rng,
+        )
+
         errors: dict[str, dict] = {}
         all_passed = True
 
         for T in horizons:
-            vals = snapshots[T]
             theo_mean = b + (Y0 - b) * np.exp(-a * T)
             theo_var = (sigma ** 2 / (2 * a)) * (1 - np.exp(-2 * a * T))
 
-            err_mean = abs(vals.mean() - theo_mean) / (abs(theo_mean) + 1e-12)
-            err_var = abs(vals.var(ddof=1) - theo_var) / (abs(theo_var) + 1e-12)
+            for label, vals in (("", snapshots[T]), (" exact", exact[T])):
+                err_mean = abs(vals.mean() - theo_mean) / (abs(theo_mean) + 1e-12)
+                err_var = abs(vals.var(ddof=1) - theo_var) / (abs(theo_var) + 1e-12)
 
-            errors[f"T={T}"] = dict(
-                theo_mean=round(theo_mean, 6), sim_mean=round(float(vals.mean()), 6),
-                theo_var=round(theo_var, 8), sim_var=round(float(vals.var(ddof=1)), 8),
-                rel_err_mean=err_mean, rel_err_var=err_var,
-            )
-            if err_mean > rtol or err_var > rtol:
-                all_passed = False
+                errors[f"T={T}{label}"] = dict(
+                    theo_mean=round(theo_mean, 6), sim_mean=round(float(vals.mean()), 6),
+                    theo_var=round(theo_var, 8), sim_var=round(float(vals.var(ddof=1)), 8),
+                    rel_err_mean=err_mean, rel_err_var=err_var,
+                )
+                if err_mean > rtol or err_var > rtol:
+                    all_passed = False
 
         worst_mean = max(v["rel_err_mean"] for v in errors.values())
         worst_var = max(v["rel_err_var"] for v in errors.values())
@@ -241,6 +287,10 @@ class CalibrationSuite:
         Тест: |ρ_sample − ρ_target| < atol.
         Для n_sims=3000 стандартная ошибка коэф. корр. ≈ (1−ρ²)/√n ≈ 0.006,
         поэтому atol=0.04 соответствует ~6σ-порогу.
+
+        Для пары акция + облигация дополнительно сравниваются годовые корреляции
+        ln(1+R_акции) и Y облигации в дневной и точной (method='exact') схемах
+        с теоретической: ρ·g(a) / √(g(0)·g(2a)), g(x) = (1 − e^{−x}) / x, g(0) = 1.
         """
         name = "Портфель: сохранение корреляций (Холецкий)"
         corr_target = np.array([[1.0, rho], [rho, 1.0]])
@@ -249,18 +299,42 @@ class CalibrationSuite:
         # одна случайная величина на актив × симуляция = среднее по шагам
         shocks = np.empty((self.n_sims, 2))
         for i in range(self.n_sims):
-            Z = np.random.normal(size=(2, n_steps))
+            Z = self.rng.normal(size=(2, n_steps))
             Z_corr = L @ Z
             shocks[i] = Z_corr.mean(axis=1)
 
         sample_rho = float(np.corrcoef(shocks.T)[0, 1])
         err = abs(sample_rho - rho)
-        passed = err < atol
+
+        # годовые корреляции акция/облигация: дневная vs. точная схема
+        a = 0.1
+        portfolio = PortfolioModel(
+            [StockModel(StockParams(weight=0.5, mu=0.07, sigma=0.15)),
+             BondModel(BondParams(weight=0.5, sigma=0.015, a=a, b=0.07, Y0=0.05))],
+            corr_target,
+        )
+        daily = portfolio.simulate_assets_from_shocks(
+            self.rng.normal(size=(2, 2 * n_steps, self.n_sims)), n_years=2, dt=1 / n_steps,
+        )[:, n_steps]
+        exact = portfolio.sample_exact_from_shocks(self.rng.normal(size=(2, 2, self.n_sims)))[:, 1]
+
+        theo_annual = rho * (-np.expm1(-a) / a) / np.sqrt(-np.expm1(-2 * a) / (2 * a))
+        rho_daily = float(np.corrcoef(np.log1p(daily[0]), daily[1])[0, 1])
+        rho_exact = float(np.corrcoef(np.log1p(exact[0]), exact[1])[0, 1])
+        err_daily = abs(rho_daily - theo_annual)
+        err_exact = abs(rho_exact - theo_annual)
+        passed = max(err, err_daily, err_exact) < atol
 
         self._add(TestResult(
             name=name, passed=passed,
-            message=f"ρ_target={rho:.3f}, ρ_sample={sample_rho:.4f}, |err|={err:.4f} (atol={atol})",
-            details=dict(target_rho=rho, sample_rho=sample_rho, abs_error=err),
+            message=(f"ρ_target={rho:.3f}, ρ_sample={sample_rho:.4f}, |err|={err:.4f} (atol={atol}); "
+                     f"annual ρ: theo={theo_annual:.4f}, daily={rho_daily:.4f}, exact={rho_exact:.4f}"),
+            details=dict(
+                target_rho=rho, sample_rho=sample_rho, abs_error=err,
+                annual_target_rho=float(theo_annual),
+                annual_rho_daily=rho_daily, annual_rho_exact=rho_exact,
+                abs_error_daily=err_daily, abs_error_exact=err_exact,
+            ),
         ))
 
     # ── 4. Salary: exact deterministic formula ────────────────────────────────
@@ -321,7 +395,7 @@ class CalibrationSuite:
 
         total_shocks = 0
         for _ in range(self.n_sims):
-            shocks = model.simulate_shocks(n_years)
+            shocks = model.simulate_shocks(n_years, rng=self.rng)
             # shocks[0] = 1.0 (инициализация), shocks[1:] — результаты испытаний
             # binary=0 (shock) → shocks[i] = employment < 1.0 (Weibull duration > 0)
             # binary=1 (employed) → shocks[i] = 1.0
@@ -366,7 +440,7 @@ class CalibrationSuite:
             p_exit=p_exit, weibull_k=weibull_k, weibull_lambda=weibull_lambda
         )
 
-        sample = model._generate_duration(self.n_sims)
+        sample = model._generate_duration(self.n_sims, rng=self.rng)
         ks_stat, p_value = stats.kstest(
             sample,
             "weibull_min",
@@ -535,7 +609,7 @@ class CalibrationSuite:
 
         fv_pool = np.empty(pool_size)
         for i in range(pool_size):
-            rates = list(np.random.normal(r_mean, r_sigma, size=n_years))
+            rates = list(self.rng.normal(r_mean, r_sigma, size=n_years))
             params = ProgramInput(
                 n=n_years, age=30, sex="M",
                 rates=rates,
@@ -572,6 +646,62 @@ class CalibrationSuite:
         ))
 
 
+    # ── 10. Variance reduction: antithetic + control variate ─────────────────
+
+    def _test_variance_reduction(
+        self,
+        mu: float = 0.08,
+        sigma: float = 0.20,
+        n_years: int = 15,
+        c: float = 10_000.0,
+    ) -> None:
+        """
+        Несмещённость и выигрыш оценок quality.variance_reduction.
+
+        Годовые доходности — точная схема GBM (method='exact'): независимы по годам
+        с E[r] = e^μ − 1 = m, поэтому E[FV] = c·(1+m)·((1+m)^n − 1)/m точно.
+        FV оценивается простым средним, антитетическими парами, контрольной
+        переменной annuity_control и их сочетанием.
+
+        Тесты: |Ŷ − FV_analytical| ≤ z·SE для каждой оценки (Бонферрони по 4),
+        vrf > 1 для каждой техники понижения дисперсии.
+        """
+        name = "Понижение дисперсии: антитетика и контрольная переменная"
+        n = self.n_sims - self.n_sims % 2
+        model = StockModel(StockParams(weight=1.0, mu=mu, sigma=sigma))
+        portfolio = PortfolioModel(assets=[model], corr_matrix=np.eye(1))
+
+        m = np.expm1(mu)
+        fv_analytical = c * (1 + m) * ((1 + m) ** n_years - 1) / m
+        z = stats.norm.ppf(1 - self.alpha / (2 * 4))
+
+        checks = {}
+        for antithetic in (False, True):
+            rates = portfolio.simulate(n_years=n_years + 1, n_simulations=n, dt=1 / 252, show_progress=False,
+                                       sample_every=252, method='exact', rng=self.rng,
+                                       shock_source=AntitheticShocks() if antithetic else None)[1:].T
+            fv = c * annuity_value(rates)
+            control, control_mean = annuity_control(rates, np.full(n_years, m))
+            for use_control in (False, True):
+                est = (estimate_mean(fv, control, control_mean, antithetic=antithetic) if use_control
+                       else estimate_mean(fv, antithetic=antithetic))
+                unbiased = abs(est.mean - fv_analytical) <= z * est.se
+                gains = est.method == 'plain' or est.vrf > 1
+                checks[est.method] = dict(mean=est.mean, se=est.se, vrf=est.vrf, passed=bool(unbiased and gains))
+
+        all_passed = all(v['passed'] for v in checks.values())
+        msg = ", ".join(f"{k}: vrf={v['vrf']:.1f}" for k, v in checks.items() if k != 'plain')
+        if not all_passed:
+            failed = [k for k, v in checks.items() if not v['passed']]
+            msg = f"не пройдены: {failed}; " + msg
+
+        self._add(TestResult(
+            name=name, passed=all_passed,
+            message=f"FV_analytical={fv_analytical:,.2f}; {msg}",
+            details=dict(fv_analytical=fv_analytical, **checks),
+        ))
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # Convenience entry point
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1,6 +1,6 @@
 import numpy as np
-from typing import Optional
-from numpy_financial import irr as npf_irr
+from typing import Optional, Sequence
+from dataclasses import dataclass
 
 
 def savings_metric(final_accumulation: float) -> float:
@@ -14,10 +14,7 @@ def roi_metric(final_accumulation: float, total_payments: float) -> float:
 def irr_metric(payments: np.ndarray, final_accumulation: float) -> float:
     n = len(payments) - 1
     cf = np.concatenate([-payments[:n], [final_accumulation]])
-    try:
-        return float(npf_irr(cf))
-    except:
-        return np.nan
+    return float(irr_batch(cf)[0])
 
 def twr_metric(portfolio_path: np.ndarray, payments: np.ndarray) -> float:
     n = len(payments) - 1
@@ -43,4 +40,227 @@ def kz_metric(pension: float, annual_salaries: np.ndarray, n: int) -> float:
 def pension_metric(final_accumulation: float, annuity_months: Optional[float]) -> Optional[float]:
     if annuity_months is None:
         return None
-    return final_accumulation / annuity_months
\ No newline at end of file
+    return final_accumulation / annuity_months
+
+
+# ── пакетный IRR ─────────────────────────────────────────────────────────────
+
+# сетка ставок для поиска отрезков со сменой знака NPV (бисекция); нижние узлы
+# почти у −1 — для потоков с почти полной потерей вложений, шаг 0.05 на
+# [−0.95, 1] — чтобы пары близких корней попадали в разные отрезки
+_IRR_BRACKET_GRID = np.concatenate([
+    [-1 + 1e-12, -1 + 1e-9, -1 + 1e-6, -0.999, -0.99],
+    np.linspace(-0.95, 1.0, 40),
+    [1.5, 2.0, 3.0, 5.0, 10.0, 20.0, 50.0, 100.0],
+])
+
+
+@dataclass
+class IRRDiagnostics:
+    converged: np.ndarray    # bool: ставка найдена с точностью tol
+    iterations: np.ndarray   # число итераций (Ньютон–Галлей + бисекция)
+    method: np.ndarray       # 'halley' | 'bracket' | '' — чем найдена ставка
+    residual: np.ndarray     # |NPV| в найденной ставке
+
+
+def _npv(cf: np.ndarray, rate: np.ndarray, t: np.ndarray) -> np.ndarray:
+    with np.errstate(all='ignore'):
+        return (cf * (1 + rate[:, None]) ** -t).sum(axis=1)
+
+
+def _npv_sign(cf: np.ndarray, rate: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """NPV того же знака: при r < 0 — NPV·(1 + r)^T, без переполнения (1 + r)^−t у r → −1."""
+    power = np.where(rate[:, None] < 0, t[-1] - t, -t)
+    with np.errstate(all='ignore'):
+        return (cf * (1 + rate[:, None]) ** power).sum(axis=1)
+
+
+def irr_batch(cash_flows: np.ndarray, guess: float = 0.1, tol: float = 1e-12, max_iter: int = 50,
+              return_diagnostics: bool = False):
+    """
+    IRR для каждой строки матрицы потоков (n_rows, n_periods) сразу:
+    решает Σ cf[t] / (1 + r)^t = 0 векторными итерациями Галлея от guess.
+
+    Итерации сходятся к корню, ближайшему к guess, а не к нулю. Поэтому строки
+    с несколькими сменами знака в потоках (корней может быть несколько), как и
+    строки, где итерации не сошлись (или ушли за r ≤ −1), пересчитываются
+    бисекцией: на ближайших к r = 0 отрезках сетки со сменой знака NPV слева и
+    справа от нуля, из двух корней берётся ближайший к нулю — как в npf.irr.
+    Сетка — от r = −1 + 1e-12 до 100: корни за её пределами и пара корней
+    внутри одного отрезка не видны; тогда остаётся корень Галлея, если он
+    сошёлся. Строки без смены знака в потоках и без найденного корня → NaN.
+    Для потоков «взносы, затем выплата» корень единственен и совпадает
+    с numpy_financial.irr.
+
+    return_diagnostics=True — дополнительно IRRDiagnostics по строкам.
+    """
+    cf = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    n_rows, n_periods = cf.shape
+    t = np.arange(n_periods, dtype=float)
+
+    rate = np.full(n_rows, float(guess))
+    iterations = np.zeros(n_rows, dtype=int)
+    converged = np.zeros(n_rows, dtype=bool)
+    method = np.full(n_rows, '', dtype='<U7')
+
+    # корень r > −1 возможен только при смене знака в потоках
+    finite = np.isfinite(cf).all(axis=1)
+    solvable = finite & ((cf > 0).any(axis=1) & (cf < 0).any(axis=1))
+    active = solvable.copy()
+    # несколько смен знака — несколько корней: Галлей находит ближайший к guess
+    signs = np.sign(cf)
+    prev = np.maximum.accumulate(np.where(signs != 0, np.arange(n_periods), -1), axis=1)
+    prev_sign = np.take_along_axis(signs, np.maximum(prev[:, :-1], 0), axis=1) * (prev[:, :-1] >= 0)
+    multi_root = (signs[:, 1:] * prev_sign < 0).sum(axis=1) > 1
+
+    with np.errstate(all='ignore'):
+        for _ in range(max_iter):
+            idx = np.flatnonzero(active)
+            if idx.size == 0:
+                break
+            r, c = rate[idx], cf[idx]
+            v = (1 + r[:, None]) ** -t
+            f = (c * v).sum(axis=1)
+            d1 = -(t * c * v).sum(axis=1) / (1 + r)
+            d2 = (t * (t + 1) * c * v).sum(axis=1) / (1 + r) ** 2
+
+            denom = 2 * d1 ** 2 - f * d2
+            step = np.where(denom != 0, 2 * f * d1 / denom, f / d1)
+            new = r - step
+            new = np.where(new > -1, new, (r - 1) / 2)   # не переходим за r = −1
+
+            ok = np.isfinite(new)
+            rate[idx] = np.where(ok, new, rate[idx])
+            iterations[idx] += 1
+            done = ok & (np.abs(step) <= tol * (1 + np.abs(new)))
+            converged[idx[done]] = True
+            method[idx[done]] = 'halley'
+            active[idx[done | ~ok]] = False
+
+    # ── запасной метод: бисекция на отрезках со сменой знака ──
+    fallback = np.flatnonzero(solvable & (~converged | multi_root))
+    if fallback.size:
+        c = cf[fallback]
+        rows_idx = np.arange(len(c))
+        npv_grid = np.column_stack([_npv_sign(c, np.full(len(c), g), t) for g in _IRR_BRACKET_GRID])
+        sign_change = np.sign(npv_grid[:, :-1]) * np.sign(npv_grid[:, 1:]) <= 0
+        # ближайший к нулю отрезок слева (hi ≤ 0) и справа (lo ≥ 0); 0 — узел сетки
+        n_neg = np.searchsorted(_IRR_BRACKET_GRID, 0.0)
+        k_neg = n_neg - 1 - sign_change[:, n_neg - 1::-1].argmax(axis=1)
+        k_pos = n_neg + sign_change[:, n_neg:].argmax(axis=1)
+
+        best = np.full(len(c), np.nan)
+        n_bisect = 0
+        for k in (k_neg, k_pos):
+            found = sign_change[rows_idx, k]
+            lo, hi = _IRR_BRACKET_GRID[k], _IRR_BRACKET_GRID[k + 1]
+            f_lo = npv_grid[rows_idx, k]
+            n = 0
+            while np.any(hi - lo > tol * (1 + np.abs(lo))) and n < 200:
+                m = (lo + hi) / 2
+                f_m = _npv_sign(c, m, t)
+                left = np.sign(f_m) == np.sign(f_lo)
+                lo, f_lo = np.where(left, m, lo), np.where(left, f_m, f_lo)
+                hi = np.where(left, hi, m)
+                n += 1
+            root = np.where(found, (lo + hi) / 2, np.nan)
+            best = np.where(np.isnan(best) | (np.abs(root) < np.abs(best)), root, best)
+            n_bisect += n
+
+        found = ~np.isnan(best)
+        rows = fallback[found]
+        rate[rows] = best[found]
+        iterations[fallback] += n_bisect
+        converged[rows] = True
+        method[rows] = 'bracket'
+
+    rate[~converged] = np.nan
+    if not return_diagnostics:
+        return rate
+
+    residual = np.abs(_npv(cf, np.where(converged, rate, 0.0), t))
+    residual[~converged] = np.nan
+    return rate, IRRDiagnostics(converged=converged, iterations=iterations, method=method, residual=residual)
+
+
+# ── пакетные метрики ─────────────────────────────────────────────────────────
+# Аналоги *_metric для стопок траекторий: ведущие оси (..., n_sims) произвольны,
+# последняя ось путей — годы (n + 1). Возвращают массивы метрик формы (...,).
+
+METRICS = ('savings', 'roi', 'irr', 'twr', 'pension', 'kz')
+
+
+def savings_batch(final_accumulation: np.ndarray) -> np.ndarray:
+    return np.asarray(final_accumulation, dtype=float)
+
+def roi_batch(final_accumulation: np.ndarray, total_payments: np.ndarray) -> np.ndarray:
+    final_accumulation, total_payments = np.broadcast_arrays(np.asarray(final_accumulation, dtype=float),
+                                                             np.asarray(total_payments, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = (final_accumulation - total_payments) / total_payments
+    return np.where(total_payments == 0, np.nan, roi)
+
+def irr_metric_batch(payments: np.ndarray, final_accumulation: np.ndarray) -> np.ndarray:
+    n = payments.shape[-1] - 1
+    final_accumulation = np.asarray(final_accumulation, dtype=float)
+    cash_flows = np.concatenate([-payments[..., :n], final_accumulation[..., None]], axis=-1)
+    return irr_batch(cash_flows.reshape(-1, n + 1)).reshape(final_accumulation.shape)
+
+def twr_batch(portfolio_path: np.ndarray, payments: np.ndarray) -> np.ndarray:
+    n = payments.shape[-1] - 1
+    if n < 1:
+        return np.full(payments.shape[:-1], np.nan)
+
+    beginning = np.array(payments[..., :n], dtype=float)
+    beginning[..., 1:] += portfolio_path[..., :n - 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(beginning != 0, portfolio_path[..., :n] / beginning - 1, 0.0)
+        return np.prod(1 + returns, axis=-1) ** (1 / n) - 1
+
+def kz_batch(pension: Optional[np.ndarray], annual_salaries: np.ndarray, n: int) -> np.ndarray:
+    avg_final_monthly_salary = (annual_salaries[..., -(n+1):-1] / 12).mean(axis=-1)
+    if pension is None:
+        return np.full(np.shape(avg_final_monthly_salary), np.nan)
+    pension = np.asarray(pension, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kz = pension / avg_final_monthly_salary
+    return np.where(avg_final_monthly_salary != 0, kz, np.nan)
+
+def pension_batch(final_accumulation: np.ndarray, annuity_months: Optional[float]) -> Optional[np.ndarray]:
+    if annuity_months is None:
+        return None
+    return np.asarray(final_accumulation, dtype=float) / annuity_months
+
+
+def compute_metrics_batch(final_accumulation: np.ndarray, payments: np.ndarray, portfolio_path: np.ndarray,
+                          annual_salaries: np.ndarray, n: int, annuity_months: Optional[float] = None,
+                          metrics: Optional[Sequence[str]] = None) -> dict[str, np.ndarray]:
+    """
+    Все метрики BaseProgram.compute_metrics одним вызовом по стопке траекторий.
+
+    final_accumulation (..., n_sims); payments, portfolio_path (..., n_sims, n + 1);
+    annual_salaries (n_sims, n + 1) — транслируется на ведущие оси.
+    pension без таблицы дожития — NaN (в скалярной версии None).
+    metrics — подмножество METRICS (по умолчанию все).
+    """
+    keys = METRICS if metrics is None else tuple(metrics)
+    pension = pension_batch(final_accumulation, annuity_months)
+
+    result = {}
+    for key in keys:
+        if key == 'savings':
+            result[key] = savings_batch(final_accumulation)
+        elif key == 'roi':
+            result[key] = roi_batch(final_accumulation, payments[..., :-1].sum(axis=-1))
+        elif key == 'irr':
+            result[key] = irr_metric_batch(payments, final_accumulation)
+        elif key == 'twr':
+            result[key] = twr_batch(portfolio_path, payments)
+        elif key == 'pension':
+            result[key] = np.full(np.shape(final_accumulation), np.nan) if pension is None else pension
+        elif key == 'kz':
+            result[key] = np.broadcast_to(kz_batch(pension, annual_salaries, n), np.shape(final_accumulation)).copy()
+        else:
+            raise ValueError(f'Unknown metric: {key}. Expected one of {METRICS}')
+    return result
+
@@ -0,0 +1,182 @@
+"""
+quality/variance_reduction.py
+
+Оценки средних метрик ячейки с понижением дисперсии.
+
+  antithetic_mean      — среднее по антитетическим парам (2k, 2k + 1),
+                         см. models.securities.shocks.AntitheticShocks
+  control_variate_mean — контрольная переменная с известным средним:
+                         Ŷ = mean(Y − β·(X − E[X])), β = Cov(Y, X) / Var(X)
+  annuity_control      — контрольная переменная по доходностям траектории:
+                         стоимость аннуитета-дью, линеаризованная вокруг
+                         детерминированных ожидаемых ставок (E[X] известно точно)
+  estimate_mean        — обе техники сразу (сначала пары, затем контроль)
+  rqmc_mean            — выборка QMCShocks: SE по разбросу средних независимых
+                         рандомизаций, а не по траекториям как iid
+  combine_strata       — равновзвешенное среднее оценок по ячейкам (стратам);
+                         сводить ячейки с разными средними в одну выборку
+                         нельзя — межъячеечный разброс съедает выигрыш
+
+Оценки считаются по одной ячейке (одно распределение траекторий).
+Каждая оценка возвращает MeanEstimate с фактором понижения дисперсии
+vrf = (Var[Y] / n) / SE² — во сколько раз меньше траекторий нужно для той же
+точности, чем у простого среднего. По измеренному vrf подбирается N_SIMULATIONS.
+"""
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+
+from models.securities.shocks import rqmc_error
+
+
+@dataclass
+class MeanEstimate:
+    mean: float
+    se: float           # стандартная ошибка оценки
+    n: int              # использовано траекторий (без NaN)
+    vrf: float          # (Var[Y] / n) / se² — фактор понижения дисперсии
+    method: str         # 'plain' | 'antithetic' | 'control' | 'antithetic+control' | 'rqmc' | 'rqmc+control'
+    beta: float = np.nan
+
+    def ci(self, z: float = 1.96) -> tuple[float, float]:
+        return self.mean - z * self.se, self.mean + z * self.se
+
+
+def _plain_var(y: np.ndarray) -> float:
+    return float(np.var(y, ddof=1)) if len(y) > 1 else np.nan
+
+
+def _vrf(y: np.ndarray, se: float) -> float:
+    return float(_plain_var(y) / len(y) / se ** 2) if se > 0 else np.nan
+
+
+def plain_mean(values: np.ndarray) -> MeanEstimate:
+    y = np.asarray(values, dtype=float)
+    y = y[~np.isnan(y)]
+    se = float(np.sqrt(_plain_var(y) / len(y))) if len(y) > 1 else np.nan
+    return MeanEstimate(mean=float(y.mean()) if len(y) else np.nan, se=se, n=len(y), vrf=1.0, method='plain')
+
+
+def _pairs(values: np.ndarray) -> np.ndarray:
+    v = np.asarray(values, dtype=float)
+    if len(v) % 2:
+        raise ValueError(f'Antithetic estimate requires even number of paths, receive: {len(v)}')
+    return v.reshape(-1, 2)
+
+
+def antithetic_mean(values: np.ndarray) -> MeanEstimate:
+    """Среднее по парам (2k, 2k + 1); пары с NaN отбрасываются целиком."""
+    pairs = _pairs(values)
+    pairs = pairs[~np.isnan(pairs).any(axis=1)]
+    pair_means = pairs.mean(axis=1)
+    se = float(np.std(pair_means, ddof=1) / np.sqrt(len(pair_means))) if len(pair_means) > 1 else np.nan
+    return MeanEstimate(mean=float(pair_means.mean()) if len(pair_means) else np.nan, se=se,
+                        n=pairs.size, vrf=_vrf(pairs.ravel(), se), method='antithetic')
+
+
+def _control_adjusted(y: np.ndarray, x: np.ndarray, x_mean: float) -> tuple[np.ndarray, float]:
+    var_x = np.var(x, ddof=1)
+    beta = float(np.cov(y, x, ddof=1)[0, 1] / var_x) if var_x > 0 else 0.0
+    return y - beta * (x - x_mean), beta
+
+
+def control_variate_mean(values: np.ndarray, control: np.ndarray, control_mean: float) -> MeanEstimate:
+    """
+    Ŷ = mean(Y − β·(X − E[X])) с оптимальным β по той же выборке
+    (смещение O(1/n) пренебрежимо). vrf ≈ 1 / (1 − ρ²(Y, X)).
+    """
+    y, x = np.asarray(values, dtype=float), np.asarray(control, dtype=float)
+    keep = ~(np.isnan(y) | np.isnan(x))
+    y, x = y[keep], x[keep]
+    adjusted, beta = _control_adjusted(y, x, control_mean)
+    se = float(np.std(adjusted, ddof=1) / np.sqrt(len(y))) if len(y) > 1 else np.nan
+    return MeanEstimate(mean=float(adjusted.mean()) if len(y) else np.nan, se=se, n=len(y),
+                        vrf=_vrf(y, se), method='control', beta=beta)
+
+
+def estimate_mean(values: np.ndarray, control: Optional[np.ndarray] = None, control_mean: Optional[float] = None,
+                  antithetic: bool = False) -> MeanEstimate:
+    """
+    Среднее метрики ячейки выбранным способом: antithetic — усреднение пар
+    (траектории 2k, 2k + 1), control — контрольная переменная с известным
+    средним control_mean; вместе — контроль применяется к средним пар.
+    """
+    if control is None:
+        return antithetic_mean(values) if antithetic else plain_mean(values)
+    if not antithetic:
+        return control_variate_mean(values, control, control_mean)
+
+    y_pairs, x_pairs = _pairs(values), _pairs(control)
+    keep = ~(np.isnan(y_pairs).any(axis=1) | np.isnan(x_pairs).any(axis=1))
+    y_pairs, x_pairs = y_pairs[keep], x_pairs[keep]
+    adjusted, beta = _control_adjusted(y_pairs.mean(axis=1), x_pairs.mean(axis=1), control_mean)
+    se = float(np.std(adjusted, ddof=1) / np.sqrt(len(adjusted))) if len(adjusted) > 1 else np.nan
+    return MeanEstimate(mean=float(adjusted.mean()) if len(adjusted) else np.nan, se=se, n=y_pairs.size,
+                        vrf=_vrf(y_pairs.ravel(), se), method='antithetic+control', beta=beta)
+
+
+def rqmc_mean(values: np.ndarray, n_replicates: int, control: Optional[np.ndarray] = None,
+              control_mean: Optional[float] = None) -> MeanEstimate:
+    """
+    Среднее по выборке RQMC (models.securities.shocks.QMCShocks, траектории —
+    n_replicates подряд идущих блоков рандомизаций): SE — rqmc_error, по
+    разбросу средних блоков. С control — сначала контроль с β по всей выборке.
+    vrf — относительно iid-среднего того же числа траекторий (выигрыш RQMC
+    вместе с контролем).
+    """
+    y = np.asarray(values, dtype=float)
+    method, beta = 'rqmc', np.nan
+    if control is not None:
+        x = np.asarray(control, dtype=float)
+        keep = ~(np.isnan(y) | np.isnan(x))
+        _, beta = _control_adjusted(y[keep], x[keep], control_mean)
+        y = np.where(keep, y - beta * (x - control_mean), np.nan)
+        method = 'rqmc+control'
+    mean, se = rqmc_error(y, n_replicates)
+    finite = np.asarray(values, dtype=float)
+    finite = finite[~np.isnan(finite)]
+    return MeanEstimate(mean=float(mean), se=float(se), n=len(finite), vrf=_vrf(finite, float(se)),
+                        method=method, beta=beta)
+
+
+def combine_strata(estimates: list[MeanEstimate]) -> MeanEstimate:
+    """
+    Среднее по ячейкам с равными весами: SE² = Σ se_i² / k²; vrf — отношение
+    той же суммы для простых средних ячеек (vrf_i · se_i²) к Σ se_i².
+    """
+    k = len(estimates)
+    se2 = np.array([e.se ** 2 for e in estimates])
+    plain_se2 = np.array([e.vrf * e.se ** 2 for e in estimates])
+    return MeanEstimate(mean=float(np.mean([e.mean for e in estimates])), se=float(np.sqrt(se2.sum()) / k),
+                        n=sum(e.n for e in estimates), vrf=float(plain_se2.sum() / se2.sum()),
+                        method=estimates[0].method if estimates else 'plain')
+
+
+# ── контрольная переменная: аннуитет по доходностям траектории ───────────────
+
+def annuity_value(rates: np.ndarray) -> np.ndarray:
+    """
+    Стоимость аннуитета-дью с единичными взносами в начале каждого года:
+    A = Σ_i Π_{k ≥ i} (1 + r[k]). rates (..., n) → (...). При постоянной
+    ставке r — c·(1 + r)·((1 + r)^n − 1) / r с c = 1.
+    """
+    growth = np.cumprod((1 + np.asarray(rates, dtype=float))[..., ::-1], axis=-1)
+    return growth.sum(axis=-1)
+
+
+def annuity_control(rates: np.ndarray, expected_rates: np.ndarray) -> tuple[np.ndarray, float]:
+    """
+    Контрольная переменная для ROI / IRR / КЗ траекторий rates (n_sims, n):
+        X = A(m) + ∇A(m) · (r − m),   m = expected_rates (n,) — аналитические E[r]
+    (см. SecurityModel.expected_path). X линейна по r, поэтому E[X] = A(m)
+    точно — детерминированная стоимость аннуитета при ожидаемых ставках,
+    — а с метриками X коррелирует почти как сама A(r).
+    Возвращает (X (n_sims,), E[X]).
+    """
+    m = np.asarray(expected_rates, dtype=float)
+    tail = np.cumprod((1 + m)[::-1])[::-1]      # Π_{k ≥ i} (1 + m[k])
+    gradient = np.cumsum(tail) / (1 + m)        # ∂A/∂r[k] = Σ_{i ≤ k} Π_{j ≥ i, j ≠ k} (1 + m[j])
+    base = float(tail.sum())
+    return base + (np.asarray(rates, dtype=float) - m) @ gradient, base
@@ -1,12 +1,35 @@
+"""
+Калибровочные данные сценариев
+------------------------------
+  indexes, structure, life_table                      — исторические индексы, структуры
+                                                        портфелей НПФ, таблица дожития
+  unemployment_p, unemployment_k, unemployment_lambda — параметры безработицы
+
+Данные загружаются при первом обращении (__getattr__ модуля), а не при импорте
+пакета: `import scenarios`, models.securities и модули, которым нужны только
+CFG / YIELD_COL, данных не читают. `from scenarios import life_table, ...`
+(сценарии H1–H4, main.py) и scenarios.portfolios (indexes, structure для
+CORR_4X4 и портфелей) — это обращение, и группа загружается при их импорте,
+в т.ч. в каждом воркере пула.
+Поэтому результат загрузчика кэшируется на диск (temp_data/cache, pickle) с
+ключом из CACHE_VERSION, версий pandas / numpy и sha256 исходных файлов: при
+повторном запуске разбор Excel, CSV, SAV и оценка Вейбулла пропускаются.
+Изменился файл данных или версия библиотек — кэш пересчитывается; изменился
+загрузчик — поднять CACHE_VERSION. Нечитаемый кэш тоже пересчитывается.
+"""
+
 import pandas as pd
 import numpy as np
 
+import hashlib
 import json
+import pickle
+import threading
 from pathlib import Path
-import pyreadstat
-from scipy.stats import weibull_min
 import os
 
+from models.utils import rolling_prod
+
 PROJECT_PATH = Path(__file__).parent
 CFG_PATH = PROJECT_PATH.joinpath('cfg.json')
 
@@ -21,6 +44,9 @@ YIELD_COL = CFG["YIELD_COL"]
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 
+CACHE_DIR = os.path.join(current_dir, 'temp_data', 'cache')
+CACHE_VERSION = 1   # поднять при изменении загрузчиков ниже
+
 def process_data(df, security_type):
     df_cpy = df.copy()
     df_cpy[DATE_COL] = pd.to_datetime(df_cpy[DATE_COL], format='%d.%m.%Y')
@@ -35,7 +61,7 @@ def process_data(df, security_type):
 
         df_cpy['CLOSE'] = df_cpy['CLOSE'].str.replace(',', '.').astype(float)
         df_cpy['R_t'] = df_cpy['CLOSE'] / df_cpy['CLOSE'].shift(1) - 1
-        df_cpy[YIELD_COL] = (1 + df_cpy['R_t']).rolling(window=252).apply(lambda x: x.prod()) - 1
+        df_cpy[YIELD_COL] = rolling_prod(1 + df_cpy['R_t'].values, window=252) - 1
 
     else:
         raise ValueError(f'Invalid security type. Key word ("bond" or "stock") should be in security type param. Your input - {security_type}')
@@ -43,45 +69,121 @@ def process_data(df, security_type):
     df_cpy = df_cpy[(df_cpy[DATE_COL] >= '03.05.2012') & (df_cpy[DATE_COL] <= '31.05.2023')].reset_index(drop=True) #crutch
     return df_cpy
 
-# структура портфелей
-file_path = os.path.join(project_root, 'data', 'structure.xlsx')
-structure = pd.read_excel(file_path).set_index('id')
-# добавим усредненную стратегию
-common_structure = pd.DataFrame(structure.mean() / structure.mean().sum()).T
-structure = pd.concat([structure, common_structure])
 
-# индексы
-for ind, security_type in zip(INDEXES, SECURITY_TYPES):
+def _data_path(*parts) -> str:
+    return os.path.join(project_root, 'data', *parts)
 
-    file_path = os.path.join(project_root, 'data', 'indexes', f'{ind}.csv')
-    load_data = pd.read_csv(file_path, delimiter=';', encoding='cp1251')
-    processed_data = process_data(df=load_data, security_type=security_type)
 
-    if ind == INDEXES[0]:
-        indexes = processed_data.copy()
-        first_security_type = security_type
-    else:
-        indexes_cpy = indexes.copy()
-        if ind == INDEXES[-1]:
-            suffixes = (f'_{first_security_type}', f'_{security_type}')
-        else:
-            suffixes = ('', f'_{security_type}')
-
-        indexes = indexes_cpy.merge(processed_data, on=DATE_COL, suffixes=suffixes)
+# ── загрузчики ────────────────────────────────────────────────────────────────
 
-# пожизненные выплаты
+def _load_structure() -> dict:
+    # структура портфелей
+    structure = pd.read_excel(_data_path('structure.xlsx')).set_index('id')
+    # добавим усредненную стратегию
+    common_structure = pd.DataFrame(structure.mean() / structure.mean().sum()).T
+    return {'structure': pd.concat([structure, common_structure])}
 
-file_path = os.path.join(project_root, 'data', 'life_duration.csv')
-life_table = pd.read_csv(file_path, index_col='age')
 
-# параметры для безработицы
+def _load_indexes() -> dict:
+    # индексы
+    for ind, security_type in zip(INDEXES, SECURITY_TYPES):
 
-file_path = os.path.join(project_root, 'data', 'unemployment.xlsx')
-df = pd.read_excel(file_path)['Численность выбывших работников в процентах к списочной численности работников\n']
-unemployment_p = ((df/100 + 1).prod())**(1/len(df)) - 1
+        load_data = pd.read_csv(_data_path('indexes', f'{ind}.csv'), delimiter=';', encoding='cp1251')
+        processed_data = process_data(df=load_data, security_type=security_type)
 
-file_path = os.path.join(project_root, 'data', 'ZAN 2024_сайт.sav')
-df, meta = pyreadstat.read_sav(file_path)
-unempl_data = df[(df['NAS_VOZR'] >= 18) & (df['BZ_PSK'] > 0)]['BZ_PSK'].to_list()
-params = weibull_min.fit(unempl_data, floc=0)
-unemployment_k, unemployment_lambda = params[0], params[2]
\ No newline at end of file
+        if ind == INDEXES[0]:
+            indexes = processed_data.copy()
+            first_security_type = security_type
+        else:
+            indexes_cpy = indexes.copy()
+            if ind == INDEXES[-1]:
+                suffixes = (f'_{first_security_type}', f'_{security_type}')
+            else:
+                suffixes = ('', f'_{security_type}')
+
+            indexes = indexes_cpy.merge(processed_data, on=DATE_COL, suffixes=suffixes)
+    return {'indexes': indexes}
+
+
+def _load_life_table() -> dict:
+    # пожизненные выплаты
+    return {'life_table': pd.read_csv(_data_path('life_duration.csv'), index_col='age')}
+
+
+def _load_unemployment() -> dict:
+    # параметры для безработицы; pyreadstat и scipy.stats импортируются только здесь
+    import pyreadstat
+    from scipy.stats import weibull_min
+
+    df = pd.read_excel(_data_path('unemployment.xlsx'))['Численность выбывших работников в процентах к списочной численности работников\n']
+    unemployment_p = ((df/100 + 1).prod())**(1/len(df)) - 1
+
+    df, meta = pyreadstat.read_sav(_data_path('ZAN 2024_сайт.sav'))
+    unempl_data = df[(df['NAS_VOZR'] >= 18) & (df['BZ_PSK'] > 0)]['BZ_PSK'].to_list()
+    params = weibull_min.fit(unempl_data, floc=0)
+    return {'unemployment_p': unemployment_p, 'unemployment_k': params[0], 'unemployment_lambda': params[2]}
+
+
+# группа кэша → (загрузчик, исходные файлы ключа)
+_SOURCES = {
+    'structure':    (_load_structure,    [_data_path('structure.xlsx')]),
+    'indexes':      (_load_indexes,      [CFG_PATH.as_posix()] + [_data_path('indexes', f'{ind}.csv') for ind in INDEXES]),
+    'life_table':   (_load_life_table,   [_data_path('life_duration.csv')]),
+    'unemployment': (_load_unemployment, [_data_path('unemployment.xlsx'), _data_path('ZAN 2024_сайт.sav')]),
+}
+# ленивый атрибут модуля → группа кэша
+_LAZY = {
+    'structure':           'structure',
+    'indexes':             'indexes',
+    'life_table':          'life_table',
+    'unemployment_p':      'unemployment',
+    'unemployment_k':      'unemployment',
+    'unemployment_lambda': 'unemployment',
+}
+_LOCK = threading.Lock()
+
+
+def _cache_key(group: str) -> str:
+    digest = hashlib.sha256(f'{CACHE_VERSION}|{group}|{pd.__version__}|{np.__version__}'.encode())
+    for path in _SOURCES[group][1]:
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode())
+            digest.update(hashlib.file_digest(f, 'sha256').digest())
+    return digest.hexdigest()[:16]
+
+
+def _load_cached(group: str) -> dict:
+    """Значения группы из кэша; при промахе — загрузчик и запись кэша (атомарно, старые версии удаляются)."""
+    loader, _ = _SOURCES[group]
+    path = os.path.join(CACHE_DIR, f'{group}-{_cache_key(group)}.pkl')
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass   # битый или несовместимый кэш (другие pandas / numpy) — пересчитываем
+
+    values = loader()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    for old in Path(CACHE_DIR).glob(f'{group}-*.pkl'):
+        if old.as_posix() != Path(path).as_posix():
+            old.unlink(missing_ok=True)
+    return values
+
+
+def __getattr__(name):
+    group = _LAZY.get(name)
+    if group is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _LOCK:
+        if name not in globals():
+            globals().update(_load_cached(group))
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
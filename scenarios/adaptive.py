@@ -0,0 +1,134 @@
+"""
+Адаптивная остановка Монте-Карло по ячейке сетки
+-------------------------------------------------
+Ячейка симулируется блоками по batch_size траекторий, пока полуширина
+доверительного интервала каждой целевой статистики не станет ≤ tol или
+не будет достигнут потолок max_sims. Узкие ячейки (низкая волатильность,
+детерминированная зарплата) останавливаются после первых блоков, широкие
+добирают до потолка.
+
+Траектории — префикс общих массивов ячейки (столбцы общей матрицы
+доходностей рыночного сценария): потолок max_sims равен её ширине, а
+остановившаяся ячейка просто использует первые n_sims столбцов. Для
+QMCShocks префикс покрывает лишь первые рандомизации, а iid-интервалы
+правил к RQMC-точкам неприменимы — адаптивный режим рассчитан на
+псевдослучайные и антитетические шоки (batch_size чётный); сочетание с
+QMCShocks отклоняет check_shock_source.
+
+Правила остановки
+  mean_rule(key, tol)    — E[values[key]] (ROI и т.п.): z·SD/√n
+  median_rule(key, tol)  — медиана values[key] (КЗ): интервал по порядковым
+                           статистикам, без предположений о распределении
+  winner_rule(...)       — решение «победитель» по разности средних: решено,
+                           когда интервал разности не накрывает 0, либо
+                           полуширина ≤ tol (победители неразличимы на tol)
+
+Использование
+  def simulate(start, stop) -> dict[str, np.ndarray]:   # траектории [start, stop)
+      ...
+  values, n_sims = run_adaptive(simulate, [mean_rule('roi', 0.005)],
+                                batch_size=500, max_sims=5000)
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from models.securities.shocks import QMCShocks, ShockSource
+
+
+@dataclass
+class StopRule:
+    name: str
+    statistic: Callable[[dict], tuple[float, float]]   # values -> (оценка, полуширина ДИ)
+    tol: float
+    decision: bool = False   # True — достаточно и того, что ДИ не накрывает 0
+
+    def satisfied(self, values: dict) -> bool:
+        estimate, half_width = self.statistic(values)
+        if np.isnan(half_width):
+            return False
+        return half_width <= self.tol or (self.decision and abs(estimate) > half_width)
+
+
+def _finite(values: np.ndarray) -> np.ndarray:
+    v = np.asarray(values, dtype=float)
+    return v[np.isfinite(v)]
+
+
+def mean_half_width(values: np.ndarray, z: float = 1.96) -> tuple[float, float]:
+    v = _finite(values)
+    if len(v) < 2:
+        return np.nan, np.nan
+    return float(v.mean()), float(z * v.std(ddof=1) / np.sqrt(len(v)))
+
+
+def median_half_width(values: np.ndarray, z: float = 1.96) -> tuple[float, float]:
+    """Медиана и полуширина интервала [x_(k), x_(j)], k, j = n/2 ∓ z·√n/2."""
+    v = np.sort(_finite(values))
+    n = len(v)
+    if n < 2:
+        return np.nan, np.nan
+    k = max(int(np.floor(n / 2 - z * np.sqrt(n) / 2)), 0)
+    j = min(int(np.ceil(n / 2 + z * np.sqrt(n) / 2)), n - 1)
+    return float(np.median(v)), float((v[j] - v[k]) / 2)
+
+
+def mean_rule(key: str, tol: float, z: float = 1.96) -> StopRule:
+    return StopRule(name=f'mean_{key}', statistic=lambda values: mean_half_width(values[key], z), tol=tol)
+
+
+def median_rule(key: str, tol: float, z: float = 1.96) -> StopRule:
+    return StopRule(name=f'median_{key}', statistic=lambda values: median_half_width(values[key], z), tol=tol)
+
+
+def winner_rule(key: str, challengers: Sequence[str], tol: float, z: float = 1.96) -> StopRule:
+    """
+    values[key] против лучшего по среднему из values[c], c ∈ challengers:
+    оценка — E[key − лучший], полуширина — по попарным разностям траекторий.
+    """
+    def statistic(values):
+        best = max(challengers, key=lambda c: np.nanmean(values[c]))
+        return mean_half_width(np.asarray(values[key]) - np.asarray(values[best]), z)
+
+    return StopRule(name=f'winner_{key}', statistic=statistic, tol=tol, decision=True)
+
+
+def check_shock_source(shock_source: Optional[ShockSource]) -> None:
+    """ValueError, если шоки рынка — QMCShocks (в т.ч. внутри AntitheticShocks)."""
+    source = shock_source
+    while source is not None:
+        if isinstance(source, QMCShocks):
+            raise ValueError(f'Adaptive stopping requires pseudo-random or antithetic shocks, receive: {type(shock_source).__name__}')
+        source = getattr(source, 'base', None)
+
+
+def run_adaptive(
+    simulate: Callable[[int, int], dict],
+    rules: Sequence[StopRule],
+    batch_size: int,
+    max_sims: int,
+    min_sims: Optional[int] = None,
+) -> tuple[dict[str, np.ndarray], int]:
+    """
+    Симулирует траектории блоками [start, start + batch_size) до выполнения
+    всех rules (не раньше min_sims, по умолчанию — один блок) или max_sims.
+
+    simulate(start, stop) -> {key: массив (..., stop − start)} — траектории
+    по последней оси. Возвращает склеенные массивы и число траекторий n_sims.
+    Без rules — один проход на max_sims (поведение без адаптации).
+    """
+    if not rules:
+        return simulate(0, max_sims), max_sims
+
+    min_sims = batch_size if min_sims is None else min_sims
+    parts: list[dict] = []
+    stop = 0
+    while stop < max_sims:
+        start, stop = stop, min(stop + batch_size, max_sims)
+        parts.append(simulate(start, stop))
+        values = {key: np.concatenate([p[key] for p in parts], axis=-1) for key in parts[0]}
+        if stop >= min_sims and all(rule.satisfied(values) for rule in rules):
+            break
+    return values, stop
@@ -0,0 +1,115 @@
+"""
+Контрольные точки сетки сценариев
+---------------------------------
+Готовые ячейки сохраняются на диск по мере расчёта, так что упавший прогон
+при перезапуске досчитывает только недостающие ячейки.
+
+Каталог контрольной точки
+  manifest.json   — отпечаток конфигурации прогона (параметры + ячейки сетки)
+                    и метки ячеек по их идентификаторам
+  cells/<id>.pkl  — результат cell_fn ячейки; пишется воркером сразу после
+                    расчёта, атомарно (временный файл + os.replace)
+
+Результат ячейки должен быть небольшим (сводка, онлайн-агрегаты): сырые
+траектории воркер пишет кусками по ячейкам (scenarios.results.write_cell_part),
+а в контрольную точку попадает только CellPart с путями к ним.
+
+Идентификатор ячейки — индексы её ключа key (market × transition × ... ),
+например '0-2-1-0-3'. Ячейка готова, если есть её файл. Если отпечаток не
+совпадает (изменились параметры или сетка), старые результаты удаляются.
+
+Потоки ячеек из models.utils.cell_generator зависят только от SEED и key,
+поэтому досчитанные ячейки совпадают с теми, что дал бы непрерывный прогон.
+
+Использование
+  ckpt = Checkpoint(os.path.join(TEMP_DIR, 'checkpoints', 'h2h3'),
+                    config={'N_SIMULATIONS': N_SIMULATIONS, 'SEED': SEED, ...}, cells=cells)
+  for result in iter_cells(run_cell, cells, ..., checkpoint=ckpt):
+      ...
+  ckpt.clear()   # итоговые файлы записаны — контрольная точка больше не нужна
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import warnings
+from typing import Any, Optional
+
+
+def _describe(obj) -> Any:
+    """JSON-описание объектов конфигурации (источники шоков и т.п.) без адресов памяти."""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__dict__'):
+        return {'type': type(obj).__name__, **{k: v for k, v in vars(obj).items() if not k.startswith('_')}}
+    return repr(obj)
+
+
+def fingerprint(config: dict) -> str:
+    payload = json.dumps(config, sort_keys=True, default=_describe, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Checkpoint:
+    """
+    Результаты готовых ячеек сетки на диске. Передаётся в iter_cells(checkpoint=...):
+    готовые ячейки читаются с диска, остальные считаются и сохраняются воркерами.
+    """
+
+    def __init__(self, directory: str, config: dict, cells: Optional[list] = None):
+        self.directory = directory
+        self.cells_dir = os.path.join(directory, 'cells')
+        manifest_path = os.path.join(directory, 'manifest.json')
+        cells = cells or []
+        key = fingerprint({'config': config, 'cells': [self._labels(c) for c in cells]})
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('fingerprint') != key:
+                warnings.warn(f'Checkpoint config changed, discarding {directory}')
+                self.clear()
+
+        os.makedirs(self.cells_dir, exist_ok=True)
+        manifest = {
+            'fingerprint': key,
+            'config':      json.loads(json.dumps(config, default=_describe)),
+            'cells':       {self.cell_id(c): self._labels(c) for c in cells},
+        }
+        tmp = f'{manifest_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp, manifest_path)
+
+    @staticmethod
+    def cell_id(cell: dict) -> str:
+        return '-'.join(str(i) for i in cell['key'])
+
+    @staticmethod
+    def _labels(cell: dict) -> dict:
+        return {k: v for k, v in cell.items() if k != 'key'}
+
+    def _path(self, cell: dict) -> str:
+        return os.path.join(self.cells_dir, f'{self.cell_id(cell)}.pkl')
+
+    def done(self, cell: dict) -> bool:
+        return os.path.exists(self._path(cell))
+
+    def save(self, cell: dict, result) -> None:
+        path = self._path(cell)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load(self, cell: dict):
+        with open(self._path(cell), 'rb') as f:
+            return pickle.load(f)
+
+    def n_done(self, cells: list) -> int:
+        return sum(self.done(c) for c in cells)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
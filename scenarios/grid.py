@@ -0,0 +1,139 @@
+"""
+Декларативная сетка сценариев и план её выполнения
+--------------------------------------------------
+Вместо вложенных циклов по MARKET_SCENARIOS × TRANSITION_SCENARIOS × ...
+сетка задаётся осями, функцией ячейки и запрашиваемыми метриками:
+
+  GRID = GridSpec(
+      axes=[Axis('market_scenario', list(MARKET_SCENARIOS)),
+            Axis('transition_scenario', TRANSITION_SCENARIOS, value_field='p_transition'),
+            Axis('salary', SALARY_RANGE), ...],
+      cell_fn=run_cell,                      # (cell, shared[, metrics]) -> результат ячейки
+      metrics=('roi', 'irr'),                # () — cell_fn без аргумента metrics
+  )
+  cells = GRID.cells()                       # первая ось — внешний цикл; key — индексы по осям
+  execution = plan(GRID, cells, n_workers=8)
+  for result in execution.run(shared=portfolio_returns(...), checkpoint=ckpt):
+      ...
+
+Ключ ячейки key (индексы значений по осям) задаёт её поток случайных чисел
+(models.utils.cell_generator) и идентификатор контрольной точки — порядок
+осей фиксирует воспроизводимость.
+
+План выполнения
+  • общая для ячеек работа выносится из цикла: доходности портфелей по всем
+    рыночным сценариям считаются один раз (scenarios.portfolios.portfolio_returns)
+    и публикуются воркерам через shared memory;
+  • ячейки раздаются воркерам подряд идущими пачками по chunksize — соседние
+    ячейки (тот же рынок, сценарий занятости, возраст) попадают в один процесс
+    и переиспользуют его кэши таблиц роста зарплат (models.macro.salary);
+  • backend: 'serial' — в текущем процессе, 'thread' — пул потоков (без копий
+    и shared memory; numpy отпускает GIL в крупных операциях), 'process' —
+    пул процессов (scenarios.parallel).
+Шоки занятости и зарплат остаются внутри ячейки: они тянутся из её потока,
+иначе результат ячейки зависел бы от соседей и от контрольной точки.
+"""
+
+import itertools
+import os
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Iterator, Literal, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+from scenarios.checkpoint import Checkpoint
+from scenarios.parallel import iter_cells
+
+Backend = Literal['serial', 'thread', 'process']
+
+# пачек на воркер: меньше — меньше пересылок, больше — ровнее загрузка
+CHUNKS_PER_WORKER = 4
+
+
+@dataclass
+class Axis:
+    name: str                                    # поле ячейки с меткой значения
+    values: Union[Sequence, Mapping]             # метки или {метка: значение}
+    value_field: Optional[str] = None            # поле для значения из Mapping (p_transition и т.п.)
+
+    def items(self) -> list[tuple]:
+        if isinstance(self.values, Mapping):
+            return list(self.values.items())
+        return [(v, None) for v in self.values]
+
+    def fields(self, label, value) -> dict:
+        out = {self.name: label}
+        if self.value_field is not None:
+            out[self.value_field] = value
+        return out
+
+
+@dataclass
+class GridSpec:
+    axes: Sequence[Axis]
+    cell_fn: Callable                            # функция уровня модуля: (cell, shared[, metrics])
+    metrics: Sequence[str] = ()                  # передаются в cell_fn(..., metrics=...), если заданы
+    derive: Optional[Callable[[dict], dict]] = None   # производные поля ячейки (зарплата группы и т.п.)
+
+    def cells(self) -> list[dict]:
+        """Ячейки в порядке вложенных циклов по axes; key — индексы значений по осям."""
+        cells = []
+        for combo in itertools.product(*(list(enumerate(axis.items())) for axis in self.axes)):
+            cell = {'key': tuple(idx for idx, _ in combo)}
+            for axis, (_, (label, value)) in zip(self.axes, combo):
+                cell.update(axis.fields(label, value))
+            if self.derive is not None:
+                cell.update(self.derive(cell))
+            cells.append(cell)
+        return cells
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(axis.items()) for axis in self.axes)
+
+
+@dataclass
+class ExecutionPlan:
+    spec: GridSpec
+    cells: list[dict]
+    backend: Backend
+    n_workers: int
+    chunksize: int
+
+    def run(self, shared: Optional[dict[str, np.ndarray]] = None, checkpoint: Optional[Checkpoint] = None,
+            desc: Optional[str] = None) -> Iterator:
+        """Результаты cell_fn по ячейкам в порядке cells (см. scenarios.parallel.iter_cells)."""
+        cell_fn = self.spec.cell_fn
+        if self.spec.metrics:
+            cell_fn = partial(cell_fn, metrics=tuple(self.spec.metrics))
+        return iter_cells(cell_fn, self.cells, shared=shared, n_workers=self.n_workers, chunksize=self.chunksize,
+                          desc=desc, checkpoint=checkpoint, backend=self.backend)
+
+    def __str__(self) -> str:
+        return (f'{len(self.cells)} ячеек {self.spec.shape}, backend={self.backend}, '
+                f'n_workers={self.n_workers}, chunksize={self.chunksize}')
+
+
+def plan(
+    spec: GridSpec,
+    cells: Optional[list[dict]] = None,
+    n_workers: Optional[int] = None,
+    backend: Optional[Backend] = None,
+) -> ExecutionPlan:
+    """
+    План выполнения сетки: backend (по умолчанию 'process', при одном воркере
+    или одной ячейке — 'serial'), число воркеров (не больше числа ячеек) и размер
+    пачки ячеек на воркер: ≈ CHUNKS_PER_WORKER пачек на процесс.
+    """
+    cells = spec.cells() if cells is None else cells
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    n_workers = max(min(n_workers, len(cells)), 1)
+    backend = backend or ('serial' if n_workers <= 1 else 'process')
+    if backend not in ('serial', 'thread', 'process'):
+        raise ValueError(f'Invalid backend. Expected "serial", "thread" or "process", receive: {backend}')
+    if backend == 'serial':
+        n_workers = 1
+
+    chunksize = max(len(cells) // (n_workers * CHUNKS_PER_WORKER), 1) if backend == 'process' else 1
+    return ExecutionPlan(spec=spec, cells=cells, backend=backend, n_workers=n_workers, chunksize=chunksize)
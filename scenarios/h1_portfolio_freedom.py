@@ -33,19 +33,27 @@
 
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
+from typing import Optional
 
 from models.securities.portfolio import PortfolioModel
-from models.programs.base import ProgramInput
-from models.programs.pds import PDSProgram
-from models.programs.iis3 import IIS3Program
+from models.securities.shocks import AntitheticShocks, rqmc_replicates
+from models.programs.batch import BatchProgramInput
+from models.programs.pds import PDSBatchProgram
+from models.programs.iis3 import IIS3BatchProgram
 from models.macro.salary import StochasticSalaryModel
 from models.macro.unemployment import WeibullUnemploymentModel
 
-from scenarios import (indexes, structure, life_table, YIELD_COL,
-                       unemployment_k, unemployment_p, unemployment_lambda)
+from scenarios import life_table, unemployment_k, unemployment_p, unemployment_lambda
 from models.securities import get_security_params
-from scenarios.market_scenarios import MARKET_SCENARIOS, build_portfolio_for_scenario
+from scenarios.market_scenarios import MARKET_SCENARIOS
+from scenarios.portfolios import PORTFOLIOS, portfolio_returns
+from scenarios.grid import Axis, GridSpec, plan
+from scenarios.results import CellPart, write_cell_part, clear_parts, part_name
+from scenarios.checkpoint import Checkpoint
+from scenarios.online_stats import OnlineStats
+from scenarios.adaptive import run_adaptive, check_shock_source, mean_rule, median_rule
+from models.utils import cell_generator
+from quality.variance_reduction import MeanEstimate, annuity_control, estimate_mean, rqmc_mean, combine_strata
 import os
 
 TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_data')
@@ -55,6 +63,24 @@ N_SIMULATIONS = 5000
 N_YEARS       = 15
 PAYMENT_RATE  = 0.06          # 6 % от зарплаты
 TAX_RATE      = 0.13
+SEED          = 42            # корневой seed: потоки ячеек через cell_generator
+N_WORKERS     = os.cpu_count()  # процессы пула; 1 — последовательно
+BACKEND       = None          # None — по плану (процессы); 'thread' | 'serial' (см. scenarios.grid)
+MARKET_CRN    = True          # общие шоки рынка для всех рыночных сценариев (CRN)
+SHOCK_SOURCE  = None          # None — псевдослучайные; models.securities.shocks.QMCShocks() — RQMC (N_SIMULATIONS кратно n_replicates)
+ANTITHETIC    = False         # антитетические пары шоков рынка (sim_id 2k, 2k + 1)
+
+# адаптивная остановка: ячейка добирает траектории блоками по BATCH_SIMS, пока
+# полуширина 95 % ДИ среднего ROI и медианы КЗ не станет ≤ допуска;
+# N_SIMULATIONS — потолок (ширина общей матрицы доходностей)
+ADAPTIVE      = False
+BATCH_SIMS    = 500
+ROI_TOL       = 0.02
+KZ_TOL        = 0.001
+
+SAVE_RAW      = True          # сырые траектории h1_portfolio_freedom (нужны analysis); таблицы считаются онлайн
+CHECKPOINT    = True          # готовые ячейки — на диск (temp_data/checkpoints); перезапуск досчитывает недостающие
+GROUP_KEYS    = ('market_scenario', 'transition_scenario', 'portfolio')
 
 SALARY_RANGE = [50_000, 100_000, 150_000, 200_000]
 AGE_RANGE    = [20, 40, 60]
@@ -69,134 +95,189 @@ TRANSITION_SCENARIOS = {
     'mid_transit': 0.15,
 }
 
-# ── порядок активов должен совпадать с порядком YIELD-колонок в indexes ───────
-ASSET_ORDER  = ['stock', 'gov_bond', 'corp_bond', 'mun_bond']
-YIELD_COLS   = [f'{YIELD_COL}_{a}' for a in ASSET_ORDER]
-CORR_4X4     = indexes[YIELD_COLS].corr().values
-
-pds_avg = structure.iloc[-1]
-_bond_total = pds_avg[['gov_bond', 'corp_bond', 'mun_bond']].sum()
-BOND_RATIOS = {
-    'gov_bond':  pds_avg['gov_bond']  / _bond_total,
-    'corp_bond': pds_avg['corp_bond'] / _bond_total,
-    'mun_bond':  pds_avg['mun_bond']  / _bond_total,
+# сырые траектории (SAVE_RAW): кусок на ячейку пишет воркер, в контрольную
+# точку попадает только путь к нему (scenarios.results.write_cell_part)
+RAW_BASE = os.path.join(TEMP_DIR, 'h1_portfolio_freedom')
+RAW_CATEGORIES = {
+    'market_scenario':     list(MARKET_SCENARIOS),
+    'transition_scenario': list(TRANSITION_SCENARIOS),
+    'program':             ['pds', 'iis3'],
+    'portfolio':           list(PORTFOLIOS),
+    'sex':                 SEX_RANGE,
 }
 
+def run_cell(cell: dict, shared: dict) -> tuple[OnlineStats, dict[str, MeanEstimate], int, Optional[CellPart]]:
+    """
+    Одна ячейка сетки: market × transition × salary × age × sex × portfolio.
+    Прогоняет программу пакетно по столбцам общей матрицы доходностей ячейки:
+    при ADAPTIVE — блоками по BATCH_SIMS до точности ROI_TOL / KZ_TOL
+    (см. scenarios.adaptive), иначе — сразу по всем N_SIMULATIONS.
+    Возвращает онлайн-агрегаты TWR / IRR / КЗ (ключи GROUP_KEYS), оценки средних
+    ROI / IRR / КЗ с понижением дисперсии, число траекторий и, при SAVE_RAW,
+    кусок сырых траекторий в RAW_BASE: признаки ячейки — скаляры, метрики — по траекториям.
+    """
+    returns_matrix = shared[f"{cell['market_scenario']}|{cell['portfolio']}"]
+    mean_rates = shared[f"{cell['market_scenario']}|{cell['portfolio']}|mean"]
+    is_pds = cell['portfolio'].startswith('pds')
+    unemployment_model = WeibullUnemploymentModel(
+        p_exit=cell['p_transition'], weibull_k=unemployment_k, weibull_lambda=unemployment_lambda
+    )
+    salary_model = StochasticSalaryModel(initial_age=cell['age'])
+    rng = cell_generator(SEED, *cell['key'])
 
-def build_iis3_structure(stock_share: float) -> dict:
-    bond_share = 1.0 - stock_share
-    return {
-        'stock':     stock_share,
-        'gov_bond':  bond_share * BOND_RATIOS['gov_bond'],
-        'corp_bond': bond_share * BOND_RATIOS['corp_bond'],
-        'mun_bond':  bond_share * BOND_RATIOS['mun_bond'],
-    }
+    def simulate(start: int, stop: int) -> dict:
+        rates = returns_matrix[:, start:stop].T
+        params = BatchProgramInput(
+            n=returns_matrix.shape[0], age=cell['age'], sex=cell['sex'],
+            rates=rates,
+            payment_mode='relative',
+            payment_rate=PAYMENT_RATE,
+            initial_salary=cell['salary'],
+            tax_deduction_rate=TAX_RATE,
+            salary_model=salary_model,
+            unemployment_model=unemployment_model,
+            rng=rng,
+        )
+        prog = (PDSBatchProgram(params=params, life_table=life_table)
+                if is_pds
+                else IIS3BatchProgram(params=params, life_table=life_table))
+        prog.run()
+        control, control_mean = annuity_control(rates, mean_rates)
+        return {**prog.compute_metrics(), 'annuity_cv': control - control_mean}   # контроль с E = 0
 
+    rules = [mean_rule('roi', ROI_TOL), median_rule('kz', KZ_TOL)] if ADAPTIVE else []
+    metrics, n_sims = run_adaptive(simulate, rules, batch_size=BATCH_SIMS, max_sims=returns_matrix.shape[1])
 
-PORTFOLIOS = {
-    'pds_avg':    structure.iloc[-1][ASSET_ORDER].to_dict(),
-    'iis3_20/80': build_iis3_structure(0.20),
-    'iis3_50/50': build_iis3_structure(0.50),
-    'iis3_80/20': build_iis3_structure(0.80),
-}
+    stats = OnlineStats(keys=GROUP_KEYS)
+    stats.update(tuple(cell[k] for k in GROUP_KEYS), {m: metrics[m] for m in ('twr', 'irr', 'kz')})
+    # контроль — аннуитет по доходностям траектории, плюс пары sim_id при ANTITHETIC;
+    # RQMC-точки не iid — SE по разбросу рандомизаций (пары лежат внутри них)
+    n_replicates = rqmc_replicates(SHOCK_SOURCE)
+    if n_replicates is None:
+        estimates = {m: estimate_mean(metrics[m], metrics['annuity_cv'], 0.0, antithetic=ANTITHETIC)
+                     for m in ('roi', 'irr', 'kz')}
+    else:
+        estimates = {m: rqmc_mean(metrics[m], n_replicates, metrics['annuity_cv'], 0.0)
+                     for m in ('roi', 'irr', 'kz')}
+    if not SAVE_RAW:
+        return stats, estimates, n_sims, None
+
+    return stats, estimates, n_sims, write_cell_part(RAW_BASE, cell['key'], categories=RAW_CATEGORIES, columns={
+        'market_scenario':     cell['market_scenario'],
+        'transition_scenario': cell['transition_scenario'],
+        'p_transition':        cell['p_transition'],
+        'program':   'pds'  if is_pds else 'iis3',
+        'portfolio': cell['portfolio'],
+        'salary':    cell['salary'],
+        'age':       cell['age'],
+        'sex':       cell['sex'],
+        'n_sims':    n_sims,
+        'sim_id':    np.arange(n_sims),
+        **metrics,
+    })
+
+
+GRID = GridSpec(
+    axes=[
+        Axis('market_scenario', list(MARKET_SCENARIOS)),
+        Axis('transition_scenario', TRANSITION_SCENARIOS, value_field='p_transition'),
+        Axis('salary', SALARY_RANGE),
+        Axis('age', AGE_RANGE),
+        Axis('sex', SEX_RANGE),
+        Axis('portfolio', list(PORTFOLIOS)),
+    ],
+    cell_fn=run_cell,
+)
 
 
 if __name__ == '__main__':
 
-    rows = []
-
-    for market_scenario in MARKET_SCENARIOS:
-        print(f"Симулирую портфели [{market_scenario}]...")
-        simulated_returns = {}
-        for label, struct_dict in PORTFOLIOS.items():
-            simulated_returns[label] = build_portfolio_for_scenario(
-                scenario=market_scenario,
-                indexes=indexes,
-                structure=struct_dict,
-                corr_matrix=CORR_4X4,
-                n_years=N_YEARS,
-                n_simulations=N_SIMULATIONS,
-                yield_col=YIELD_COL,
-                show_progress=False,
-            )
-
-        for transit_label, p_transit in TRANSITION_SCENARIOS.items():
-            unemployment_model = WeibullUnemploymentModel(
-                p_exit=p_transit, weibull_k=unemployment_k, weibull_lambda=unemployment_lambda
-            )
-
-            for salary in tqdm(SALARY_RANGE,
-                               desc=f'salary [{market_scenario}/{transit_label}]'):
-                for age in AGE_RANGE:
-                    salary_model = StochasticSalaryModel(initial_age=age)
-                    for sex in SEX_RANGE:
-                        for portfolio_label, returns_matrix in simulated_returns.items():
-                            is_pds = portfolio_label.startswith('pds')
-
-                            for i in range(N_SIMULATIONS):
-                                rates = list(returns_matrix[:, i][::252])
-                                n     = len(rates)
-
-                                params = ProgramInput(
-                                    n=n, age=age, sex=sex,
-                                    rates=rates,
-                                    payment_mode='relative',
-                                    payment_rate=PAYMENT_RATE,
-                                    initial_salary=salary,
-                                    tax_deduction_rate=TAX_RATE,
-                                    salary_model=salary_model,
-                                    unemployment_model=unemployment_model,
-                                )
-
-                                prog = (PDSProgram(params=params, life_table=life_table)
-                                        if is_pds
-                                        else IIS3Program(params=params, life_table=life_table))
-                                prog.run()
-                                metrics = prog.compute_metrics()
-
-                                rows.append({
-                                    'market_scenario':     market_scenario,
-                                    'transition_scenario': transit_label,
-                                    'p_transition':        p_transit,
-                                    'program':   'pds'  if is_pds else 'iis3',
-                                    'portfolio': portfolio_label,
-                                    'salary':    salary,
-                                    'age':       age,
-                                    'sex':       sex,
-                                    'sim_id':    i,
-                                    **metrics,
-                                })
-
-    df = pd.DataFrame(rows)
-    df.to_csv(os.path.join(TEMP_DIR, 'h1_portfolio_freedom.csv'), index=False)
-    print(f"Сохранено: {TEMP_DIR}/h1_portfolio_freedom.csv  ({len(df)} строк)")
+    if ADAPTIVE:
+        check_shock_source(SHOCK_SOURCE)   # префиксы RQMC-выборки и iid-интервалы несовместимы
+
+    # ── доходности: один прогон активов на все рыночные сценарии ─────────────
+    print("Симулирую портфели по рыночным сценариям...")
+    shared_returns = portfolio_returns(
+        PORTFOLIOS, n_years=N_YEARS, n_simulations=N_SIMULATIONS, rng=cell_generator(SEED, 0),
+        crn=MARKET_CRN, shock_source=AntitheticShocks(SHOCK_SOURCE) if ANTITHETIC else SHOCK_SOURCE,
+        expected=True,
+    )
+
+    # ── сетка ячеек: market × transition × salary × age × sex × portfolio ─────
+    cells = GRID.cells()
+    execution = plan(GRID, cells, n_workers=N_WORKERS, backend=BACKEND)
+    print(f"План: {execution}")
+
+    # таблицы копятся онлайн (scenarios.online_stats), оценки средних — по ячейкам;
+    # траектории при SAVE_RAW воркер пишет кусками по ячейкам (scenarios.results)
+    stats = OnlineStats(keys=GROUP_KEYS)
+    cell_estimates, used = [], {pf: [] for pf in PORTFOLIOS}
+    ckpt = Checkpoint(os.path.join(TEMP_DIR, 'checkpoints', 'h1'), cells=cells, config={
+        'N_SIMULATIONS': N_SIMULATIONS, 'N_YEARS': N_YEARS, 'PAYMENT_RATE': PAYMENT_RATE, 'TAX_RATE': TAX_RATE,
+        'SEED': SEED, 'MARKET_CRN': MARKET_CRN, 'SHOCK_SOURCE': SHOCK_SOURCE, 'ANTITHETIC': ANTITHETIC,
+        'ADAPTIVE': ADAPTIVE, 'BATCH_SIMS': BATCH_SIMS, 'ROI_TOL': ROI_TOL, 'KZ_TOL': KZ_TOL,
+        'SAVE_RAW': SAVE_RAW, 'MARKET_SCENARIOS': MARKET_SCENARIOS, 'PORTFOLIOS': PORTFOLIOS,
+    }) if CHECKPOINT else None
+    if ckpt is not None and ckpt.n_done(cells):
+        print(f"Контрольная точка: готово {ckpt.n_done(cells)} из {len(cells)} ячеек")
+    # куски готовых ячеек контрольной точки остаются, прочие — от прошлых прогонов
+    if SAVE_RAW:
+        clear_parts(RAW_BASE, keep=[part_name(c['key']) for c in cells if ckpt is not None and ckpt.done(c)])
+    n_raw = 0
+    results = execution.run(shared=shared_returns, checkpoint=ckpt, desc='H1 cells')
+    for cell, (cell_stats, estimates, n_sims, part) in zip(cells, results):
+        stats.merge(cell_stats)
+        cell_estimates.append((cell, estimates))
+        used[cell['portfolio']].append(n_sims)
+        if part is not None:
+            n_raw += part.n_rows
+    if SAVE_RAW:
+        print(f"Сохранено: {RAW_BASE}  ({n_raw} строк)")
+    if ADAPTIVE:
+        used = pd.DataFrame({pf: pd.Series(n).describe()[['min', 'mean', 'max']] for pf, n in used.items()}).T
+        print(f"Траекторий на ячейку (потолок {N_SIMULATIONS}):\n{used.to_string()}")
+
+    # ── средние с понижением дисперсии (базовый сценарий) ────────────────────
+    # оценки по ячейкам salary × age × sex (см. run_cell), затем среднее
+    # по ячейкам. vrf — во сколько раз меньше траекторий нужно для той же
+    # точности, чем у простого среднего; при QMCShocks SE и vrf — по разбросу
+    # рандомизаций (quality.variance_reduction.rqmc_mean)
+    print("\n=== Средние ± SE и фактор понижения дисперсии (базовый рыночный + трудовой сценарий) ===")
+    for metric in ['roi', 'irr', 'kz']:
+        print(f"\n  {metric.upper()}:")
+        for pf in PORTFOLIOS:
+            est = combine_strata([
+                estimates[metric] for cell, estimates in cell_estimates
+                if (cell['market_scenario'], cell['transition_scenario'], cell['portfolio']) == ('baseline', 'baseline', pf)
+            ])
+            print(f"  {pf:15} {est.mean:>8.4f} ± {est.se:.4f}   vrf={est.vrf:>6.1f}")
 
     # ── описательная статистика по перцентилям (базовый сценарий) ────────────
     pctiles = [5, 25, 50, 75, 95]
     print("\n=== Описательная статистика (базовый рыночный + базовый трудовой сценарий) ===")
-    base = df[(df['market_scenario'] == 'baseline') &
-              (df['transition_scenario'] == 'baseline')]
     for metric in ['twr', 'irr', 'kz']:
         print(f"\n  {metric.upper()}:")
         print(f"  {'Портфель':15} " + " ".join(f"p{p:>3}" for p in pctiles) + "   mean    std")
         for pf in PORTFOLIOS:
-            vals = base.loc[base['portfolio'] == pf, metric].dropna()
-            if len(vals) == 0:
+            agg = stats.get(('baseline', 'baseline', pf), metric)
+            if agg.moments.n == 0:
                 continue
-            pcts = np.percentile(vals, pctiles)
+            pcts = agg.sketch.percentile(pctiles)
             print(f"  {pf:15} " + " ".join(f"{v:>6.1%}" for v in pcts)
-                  + f"  {vals.mean():>6.1%}  {vals.std():>6.1%}")
+                  + f"  {agg.moments.mean:>6.1%}  {agg.moments.std:>6.1%}")
 
     # ── описательная статистика по перцентилям ────────────────────────────────
     pctiles = [5, 25, 50, 75, 95]
     print("\n=== Описательная статистика (базовый сценарий безработицы) ===")
-    base = df[df['transition_scenario'] == 'baseline']
+    by_transition = stats.collapse(('transition_scenario', 'portfolio'))
     for metric in ['twr', 'irr', 'kz']:
         print(f"\n  {metric.upper()}:")
         print(f"  {'Портфель':15} " + " ".join(f"p{p:>3}" for p in pctiles) + "   mean    std")
         for pf in PORTFOLIOS:
-            vals = base.loc[base['portfolio'] == pf, metric].dropna()
-            pcts = np.percentile(vals, pctiles)
+            agg = by_transition.get(('baseline', pf), metric)
+            pcts = agg.sketch.percentile(pctiles)
             print(f"  {pf:15} " + " ".join(f"{v:>6.1%}" for v in pcts)
-                  + f"  {vals.mean():>6.1%}  {vals.std():>6.1%}")
+                  + f"  {agg.moments.mean:>6.1%}  {agg.moments.std:>6.1%}")
 
+    if ckpt is not None:
+        ckpt.clear()
@@ -13,6 +13,8 @@ H3: Механизм государственного софинансирова
 -------------------
 Переменная развёртки: payment_rate ∈ [0.5 %, 24 %], шаг 0.5 % → 47 значений
 Контроль: salary (покрывает все 3 тира со-фин.) × n_simulations
+Все ставки одной ячейки считаются одним проходом (sweep_payment_rates) на общих
+траекториях зарплат, шоков и доходностей — кривая advantage(r) без шума между ставками.
 
 Ключевая идея идентификации
   - Для H2/H3 необходимо изолировать эффект со-финансирования от эффекта портфеля.
@@ -34,20 +36,26 @@ H3: Механизм государственного софинансирова
 
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 from scipy.signal import argrelextrema
+from typing import Optional
 
 from models.securities.portfolio import PortfolioModel
-from models.programs.base import ProgramInput
-from models.programs.pds import PDSProgram
-from models.programs.iis3 import IIS3Program
+from models.programs.batch import BatchProgramInput
+from models.programs.pds import PDSBatchProgram
+from models.programs.iis3 import IIS3BatchProgram
 from models.macro.salary import StochasticSalaryModel
 from models.macro.unemployment import WeibullUnemploymentModel
 
-from scenarios import (indexes, structure, life_table, YIELD_COL,
-                       unemployment_k, unemployment_p, unemployment_lambda)
+from scenarios import life_table, unemployment_k, unemployment_p, unemployment_lambda
 from models.securities import get_security_params
-from scenarios.market_scenarios import MARKET_SCENARIOS, build_portfolio_for_scenario
+from scenarios.market_scenarios import MARKET_SCENARIOS
+from scenarios.portfolios import PDS_STRUCT, build_iis3_structure, portfolio_returns
+from scenarios.grid import Axis, GridSpec, plan
+from scenarios.results import CellPart, write_cell_part, clear_parts, part_name
+from scenarios.checkpoint import Checkpoint
+from scenarios.online_stats import OnlineStats
+from scenarios.rate_search import RateSampler, MeanCurve, find_plateau_edge, find_first_crossing
+from models.utils import cell_generator
 import os
 
 TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_data')
@@ -56,32 +64,44 @@ TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_data')
 N_SIMULATIONS = 5000
 N_YEARS       = 15
 TAX_RATE      = 0.13
+SEED          = 42            # корневой seed: потоки ячеек через cell_generator
+N_WORKERS     = os.cpu_count()  # процессы пула; 1 — последовательно
+BACKEND       = None          # None — по плану (процессы); 'thread' | 'serial' (см. scenarios.grid)
+MARKET_CRN    = True          # общие шоки рынка для всех рыночных сценариев (CRN)
+SHOCK_SOURCE  = None          # None — псевдослучайные; models.securities.shocks.QMCShocks() — RQMC (N_SIMULATIONS кратно n_replicates)
 AGE_RANGE     = [20, 40, 60]
 SEX_RANGE     = ['M', 'F']
 
 PAYMENT_RATES = np.round(np.arange(0.5, 24.5, 0.5) / 100, 4)   # 48 значений
+SWEEP_METRICS = ('roi', 'irr', 'twr', 'savings', 'kz')         # grid: метрики развёртки (roi обязателен)
+
+# 'grid' — все PAYMENT_RATES; 'adaptive' — поиск точек до RATE_TOL
+# на отрезке [PAYMENT_RATES[0], PAYMENT_RATES[-1]] (см. scenarios.rate_search)
+SEARCH_MODE   = 'grid'
+SAVE_RAW      = True          # grid: сырые траектории h2h3_raw (нужны analysis); сводка считается онлайн
+CHECKPOINT    = True          # готовые ячейки — на диск (temp_data/checkpoints); перезапуск досчитывает недостающие
+SHARED_SHOCKS = True          # одна история занятости на sim_id для ПДС и ИИС-3
+RATE_TOL      = 1e-4
+CI_Z          = 1.96
 SALARY_RANGE  = [50_000, 100_000, 150_000, 200_000]
 
-ASSET_ORDER = ['stock', 'gov_bond', 'corp_bond', 'mun_bond']
-YIELD_COLS  = [f'{YIELD_COL}_{a}' for a in ASSET_ORDER]
-CORR_4X4    = indexes[YIELD_COLS].corr().values
+TRANSITION_SCENARIOS = {
+    'baseline':    unemployment_p,
+    'low_transit': 0.10,
+    'mid_transit': 0.15,
+}
 
-pds_avg = structure.iloc[-1]
-_bond_total = pds_avg[['gov_bond', 'corp_bond', 'mun_bond']].sum()
-BOND_RATIOS = {
-    'gov_bond':  pds_avg['gov_bond']  / _bond_total,
-    'corp_bond': pds_avg['corp_bond'] / _bond_total,
-    'mun_bond':  pds_avg['mun_bond']  / _bond_total,
+# сырые траектории (SAVE_RAW): кусок на ячейку пишет воркер, в контрольную
+# точку попадает только путь к нему (scenarios.results.write_cell_part)
+RAW_BASE = os.path.join(TEMP_DIR, 'h2h3_raw')
+RAW_CATEGORIES = {
+    'market_scenario':     list(MARKET_SCENARIOS),
+    'transition_scenario': list(TRANSITION_SCENARIOS),
+    'sex':                 SEX_RANGE,
 }
 
 # ИИС-3: сбалансированный 50/50 с расщеплением облигаций как у НПФ
-IIS3_STRUCT = {
-    'stock':     0.50,
-    'gov_bond':  0.50 * BOND_RATIOS['gov_bond'],
-    'corp_bond': 0.50 * BOND_RATIOS['corp_bond'],
-    'mun_bond':  0.50 * BOND_RATIOS['mun_bond'],
-}
-PDS_STRUCT = structure.iloc[-1][ASSET_ORDER].to_dict()
+IIS3_STRUCT = build_iis3_structure(0.50)
 
 
 def analytical_threshold(salary: float) -> float:
@@ -116,146 +136,224 @@ def find_inflection_points(rates: np.ndarray, advantage: np.ndarray) -> dict:
     return result
 
 
-if __name__ == '__main__':
+def cell_programs(cell: dict, shared: dict) -> tuple[PDSBatchProgram, IIS3BatchProgram]:
+    """
+    Пакетные программы ПДС и ИИС-3 ячейки на общих доходностях рыночного сценария.
+    При SHARED_SHOCKS обе ветки видят одну матрицу шоков занятости (одна история
+    занятости на sim_id) — разность ROI ПДС − ИИС-3 не несёт шума занятости;
+    иначе каждая ветка тянет свои шоки.
+    """
+    base_returns = shared[f"{cell['market_scenario']}|pds"]
+    unemployment_model = WeibullUnemploymentModel(
+        p_exit=cell['p_transition'], weibull_k=unemployment_k, weibull_lambda=unemployment_lambda
+    )
+    salary_model = StochasticSalaryModel(initial_age=cell['age'])
+    rng = cell_generator(SEED, *cell['key'])
+    n_years, n_sims = base_returns.shape
+
+    base_params = dict(
+        n=n_years, age=cell['age'], sex=cell['sex'],
+        rates=base_returns.T,
+        payment_mode='relative',
+        payment_rate=float(PAYMENT_RATES[0]),  # сетка ставок задаётся в sweep_payment_rates
+        initial_salary=cell['salary'],
+        tax_deduction_rate=TAX_RATE,
+        salary_model=salary_model,
+        rng=rng,
+    )
+    if SHARED_SHOCKS:
+        base_params['shocks'] = unemployment_model.simulate_shocks_matrix(n_years, n_sims, rng=rng)
+    else:
+        base_params['unemployment_model'] = unemployment_model
+
+    return (PDSBatchProgram(params=BatchProgramInput(**base_params), life_table=life_table),
+            IIS3BatchProgram(params=BatchProgramInput(**base_params), life_table=life_table))
+
+
+def summarize_cell(cell: dict, stats: OnlineStats) -> dict:
+    """
+    Строка итоговой таблицы ячейки по онлайн-агрегатам (ключ — payment_rate):
+    характерные точки кривых E[ROI_ПДС](r) − E[ROI_ИИС-3](r) и E[ROI_ПДС](r),
+    перцентили ROI при ставке максимального преимущества ПДС.
+    """
+    rates_arr     = np.array([float(r) for r in PAYMENT_RATES])
+    roi_pds_arr   = np.array([stats.mean((r,), 'roi_pds') for r in rates_arr])
+    advantage_roi = roi_pds_arr - np.array([stats.mean((r,), 'roi_iis') for r in rates_arr])
+
+    inflection = find_inflection_points(rates_arr, advantage_roi)
+
+    d_roi_pds = np.diff(roi_pds_arr)
+    h3_marginal_roi_decline_rate = None
+    for j, d in enumerate(d_roi_pds):
+        if d < 0:
+            h3_marginal_roi_decline_rate = float(rates_arr[j])
+            break
 
-    TRANSITION_SCENARIOS = {
-        'baseline':    unemployment_p,
-        'low_transit': 0.10,
-        'mid_transit': 0.15,
+    peak_rate = inflection['pds_max_advantage_rate']
+    pctiles   = [5, 25, 50, 75, 95]
+    pds_pct   = dict(zip((f'roi_pds_p{p}' for p in pctiles),
+                         np.round(stats.percentile((peak_rate,), 'roi_pds', pctiles), 4)))
+    iis_pct   = dict(zip((f'roi_iis_p{p}' for p in pctiles),
+                         np.round(stats.percentile((peak_rate,), 'roi_iis', pctiles), 4)))
+
+    return {
+        'market_scenario':                     cell['market_scenario'],
+        'transition_scenario':                 cell['transition_scenario'],
+        'age':                                 cell['age'],
+        'sex':                                 cell['sex'],
+        'salary':                              cell['salary'],
+        'analytical_cofin_cap_rate':           round(analytical_threshold(cell['salary']), 4),
+        'h2_pds_max_advantage_rate':           round(inflection['pds_max_advantage_rate'], 4),
+        'h2_pds_max_advantage_value':          round(inflection['pds_max_advantage_value'], 4),
+        'h2_pds_iis_indifference_rate':        inflection['pds_iis_indifference_rate'],
+        'h3_marginal_roi_decline_rate':        h3_marginal_roi_decline_rate,
+        'max_roi_pds':                         round(float(roi_pds_arr.max()), 4),
+        'min_roi_pds':                         round(float(roi_pds_arr.min()), 4),
+        **pds_pct,
+        **iis_pct,
     }
 
-    # ── основной цикл: market_scenario × transition_scenario × age × sex × salary × payment_rate ──
-    rows = []
-    for market_scenario in MARKET_SCENARIOS:
-        print(f"Симулирую общий портфель [{market_scenario}]...")
-        base_returns = build_portfolio_for_scenario(
-            scenario=market_scenario,
-            indexes=indexes,
-            structure=PDS_STRUCT,
-            corr_matrix=CORR_4X4,
-            n_years=N_YEARS,
-            n_simulations=N_SIMULATIONS,
-            yield_col=YIELD_COL,
-            show_progress=False,
-        )
-
-        for transit_label, p_transit in TRANSITION_SCENARIOS.items():
-            unemployment_model = WeibullUnemploymentModel(
-                p_exit=p_transit, weibull_k=unemployment_k, weibull_lambda=unemployment_lambda
-            )
-
-            for age in AGE_RANGE:
-                salary_model = StochasticSalaryModel(initial_age=age)
-                for sex in SEX_RANGE:
-                    for salary in tqdm(SALARY_RANGE, desc=f'salary [{market_scenario}/{transit_label}/{age}/{sex}]'):
-                        for payment_rate in PAYMENT_RATES:
-                            for i in range(N_SIMULATIONS):
-                                rates_vec = list(base_returns[:, i][::252])
-                                n = len(rates_vec)
-
-                                base_params = dict(
-                                    n=n, age=age, sex=sex,
-                                    rates=rates_vec,
-                                    payment_mode='relative',
-                                    payment_rate=float(payment_rate),
-                                    initial_salary=salary,
-                                    tax_deduction_rate=TAX_RATE,
-                                    salary_model=salary_model,
-                                    unemployment_model=unemployment_model,
-                                )
-
-                                pds_prog = PDSProgram(
-                                    params=ProgramInput(**base_params), life_table=life_table
-                                )
-                                pds_prog.run()
-                                m_pds = pds_prog.compute_metrics()
-
-                                iis_prog = IIS3Program(
-                                    params=ProgramInput(**base_params), life_table=life_table
-                                )
-                                iis_prog.run()
-                                m_iis = iis_prog.compute_metrics()
-
-                                rows.append({
-                                    'market_scenario':     market_scenario,
-                                    'transition_scenario': transit_label,
-                                    'p_transition':        p_transit,
-                                    'age':                 age,
-                                    'sex':                 sex,
-                                    'salary':              salary,
-                                    'payment_rate':        float(payment_rate),
-                                    'sim_id':              i,
-                                    'roi_pds':             m_pds['roi'],
-                                    'irr_pds':             m_pds['irr'],
-                                    'twr_pds':             m_pds['twr'],
-                                    'savings_pds':         m_pds['savings'],
-                                    'kz_pds':              m_pds['kz'],
-                                    'roi_iis':             m_iis['roi'],
-                                    'irr_iis':             m_iis['irr'],
-                                    'twr_iis':             m_iis['twr'],
-                                    'savings_iis':         m_iis['savings'],
-                                    'kz_iis':              m_iis['kz'],
-                                })
-
-    df = pd.DataFrame(rows)
-    df.to_csv(os.path.join(TEMP_DIR, 'h2h3_raw.csv'), index=False)
-    print(f"Сырые данные: {TEMP_DIR}/h2h3_raw.csv  ({len(df)} строк)")
-
-    # ── постобработка: характерные точки по каждому сценарию и зарплате ───────
-    summary_rows = []
-    for market_scenario in MARKET_SCENARIOS:
-        for transit_label in TRANSITION_SCENARIOS:
-            for age in AGE_RANGE:
-                for sex in SEX_RANGE:
-                    df_sc = df[(df['market_scenario'] == market_scenario) &
-                               (df['transition_scenario'] == transit_label) &
-                               (df['age'] == age) & (df['sex'] == sex)]
-                    for salary in SALARY_RANGE:
-                        sub = df_sc[df_sc['salary'] == salary]
-                        agg = sub.groupby('payment_rate')[['roi_pds', 'roi_iis', 'irr_pds', 'irr_iis']].mean()
-                        agg = agg.reset_index().sort_values('payment_rate')
-
-                        rates_arr     = agg['payment_rate'].values
-                        advantage_roi = (agg['roi_pds'] - agg['roi_iis']).values
-                        roi_pds_arr   = agg['roi_pds'].values
-
-                        inflection = find_inflection_points(rates_arr, advantage_roi)
-
-                        d_roi_pds = np.diff(roi_pds_arr)
-                        h3_marginal_roi_decline_rate = None
-                        for j, d in enumerate(d_roi_pds):
-                            if d < 0:
-                                h3_marginal_roi_decline_rate = float(rates_arr[j])
-                                break
-
-                        theo_thresh = analytical_threshold(salary)
-
-                        peak_rate = inflection['pds_max_advantage_rate']
-                        sub_peak  = sub[np.isclose(sub['payment_rate'], peak_rate, atol=1e-5)]
-                        pctiles   = [5, 25, 50, 75, 95]
-                        pds_pct   = {f'roi_pds_p{p}': round(float(np.percentile(sub_peak['roi_pds'].dropna(), p)), 4)
-                                     for p in pctiles}
-                        iis_pct   = {f'roi_iis_p{p}': round(float(np.percentile(sub_peak['roi_iis'].dropna(), p)), 4)
-                                     for p in pctiles}
-
-                        summary_rows.append({
-                            'market_scenario':                     market_scenario,
-                            'transition_scenario':                 transit_label,
-                            'age':                                 age,
-                            'sex':                                 sex,
-                            'salary':                              salary,
-                            'analytical_cofin_cap_rate':           round(theo_thresh, 4),
-                            'h2_pds_max_advantage_rate':           round(inflection['pds_max_advantage_rate'], 4),
-                            'h2_pds_max_advantage_value':          round(inflection['pds_max_advantage_value'], 4),
-                            'h2_pds_iis_indifference_rate':        inflection['pds_iis_indifference_rate'],
-                            'h3_marginal_roi_decline_rate':        h3_marginal_roi_decline_rate,
-                            'max_roi_pds':                         round(float(roi_pds_arr.max()), 4),
-                            'min_roi_pds':                         round(float(roi_pds_arr.min()), 4),
-                            **pds_pct,
-                            **iis_pct,
-                        })
-
-    summary = pd.DataFrame(summary_rows)
+
+def run_cell(cell: dict, shared: dict, metrics: tuple[str, ...] = SWEEP_METRICS) -> tuple[dict, Optional[CellPart]]:
+    """
+    Одна ячейка сетки: market × transition × age × sex × salary; вся сетка
+    PAYMENT_RATES считается за один проход sweep_payment_rates на общих
+    для всех ставок зарплатах и шоках.
+    ПДС и ИИС-3 прогоняются пакетно на одних и тех же столбцах матрицы доходностей
+    (и, при SHARED_SHOCKS, на одних историях занятости).
+    Возвращает строку итоговой таблицы (summarize_cell по онлайн-агрегатам ставок)
+    и, при SAVE_RAW, кусок сырых траекторий metrics в RAW_BASE (строки — payment_rate × sim_id).
+    """
+    if 'roi' not in metrics:
+        raise ValueError(f'Metrics should include "roi", receive: {metrics}')
+    pds_prog, iis_prog = cell_programs(cell, shared)
+    m_pds = pds_prog.sweep_payment_rates(PAYMENT_RATES, metrics=metrics)
+    m_iis = iis_prog.sweep_payment_rates(PAYMENT_RATES, metrics=metrics)
+
+    stats = OnlineStats(keys=('payment_rate',), quantiles=('roi_pds', 'roi_iis'))
+    for i, rate in enumerate(PAYMENT_RATES):
+        stats.update((float(rate),), {
+            f'{m}_{branch}': values[m][i]
+            for m in ('roi', 'irr') if m in metrics
+            for branch, values in (('pds', m_pds), ('iis', m_iis))
+        })
+    summary = summarize_cell(cell, stats)
+    if not SAVE_RAW:
+        return summary, None
+
+    n_rates, n_sims = m_pds['roi'].shape
+    return summary, write_cell_part(RAW_BASE, cell['key'], categories=RAW_CATEGORIES, columns={
+        'market_scenario':     cell['market_scenario'],
+        'transition_scenario': cell['transition_scenario'],
+        'p_transition':        cell['p_transition'],
+        'age':                 cell['age'],
+        'sex':                 cell['sex'],
+        'salary':              cell['salary'],
+        'payment_rate':        np.repeat(PAYMENT_RATES.astype(float), n_sims),
+        'sim_id':              np.tile(np.arange(n_sims), n_rates),
+        **{f'{m}_pds': m_pds[m].ravel() for m in metrics},
+        **{f'{m}_iis': m_iis[m].ravel() for m in metrics},
+    })
+
+
+def run_cell_adaptive(cell: dict, shared: dict) -> list[dict]:
+    """
+    Та же ячейка, что run_cell, но без сетки: характерные точки ищутся
+    адаптивно (scenarios.rate_search) на общих траекториях ПДС и ИИС-3 —
+    оцениваются только нужные ставки и только ROI.
+    Возвращает одну строку итоговой таблицы с доверительными границами.
+    """
+    pds_prog, iis_prog = cell_programs(cell, shared)
+
+    sampler = RateSampler(lambda rates: {
+        'roi_pds': pds_prog.sweep_payment_rates(rates, metrics=('roi',))['roi'],
+        'roi_iis': iis_prog.sweep_payment_rates(rates, metrics=('roi',))['roi'],
+    })
+    advantage = MeanCurve(sampler, lambda v: v['roi_pds'] - v['roi_iis'])
+    roi_pds = MeanCurve(sampler, lambda v: v['roi_pds'])
+
+    lo, hi = float(PAYMENT_RATES[0]), float(PAYMENT_RATES[-1])
+    h2_peak = find_plateau_edge(advantage, lo, hi, tol=RATE_TOL, z=CI_Z)
+    h2_even = find_first_crossing(advantage, lo, hi, tol=RATE_TOL, z=CI_Z)
+    h3_decl = find_plateau_edge(roi_pds, lo, hi, tol=RATE_TOL, z=CI_Z)
+
+    return [{
+        'market_scenario':                     cell['market_scenario'],
+        'transition_scenario':                 cell['transition_scenario'],
+        'age':                                 cell['age'],
+        'sex':                                 cell['sex'],
+        'salary':                              cell['salary'],
+        'analytical_cofin_cap_rate':           round(analytical_threshold(cell['salary']), 4),
+        'h2_pds_max_advantage_rate':           h2_peak.rate,
+        'h2_pds_max_advantage_lower':          h2_peak.lower,
+        'h2_pds_max_advantage_upper':          h2_peak.upper,
+        'h2_pds_max_advantage_value':          h2_peak.value,
+        'h2_pds_iis_indifference_rate':        h2_even.rate,
+        'h2_pds_iis_indifference_lower':       h2_even.lower,
+        'h2_pds_iis_indifference_upper':       h2_even.upper,
+        'h3_marginal_roi_decline_rate':        h3_decl.rate,
+        'h3_marginal_roi_decline_lower':       h3_decl.lower,
+        'h3_marginal_roi_decline_upper':       h3_decl.upper,
+        'n_rate_evals':                        sampler.n_evals,
+    }]
+
+
+# adaptive — без сетки ставок и метрик развёртки (только ROI в точках поиска)
+GRID = GridSpec(
+    axes=[
+        Axis('market_scenario', list(MARKET_SCENARIOS)),
+        Axis('transition_scenario', TRANSITION_SCENARIOS, value_field='p_transition'),
+        Axis('age', AGE_RANGE),
+        Axis('sex', SEX_RANGE),
+        Axis('salary', SALARY_RANGE),
+    ],
+    cell_fn=run_cell_adaptive if SEARCH_MODE == 'adaptive' else run_cell,
+    metrics=() if SEARCH_MODE == 'adaptive' else SWEEP_METRICS,
+)
+
+
+if __name__ == '__main__':
+
+    # ── доходности: общий портфель на рыночный сценарий ──────────────────────
+    print("Симулирую общий портфель по рыночным сценариям...")
+    shared_returns = portfolio_returns(
+        {'pds': PDS_STRUCT}, n_years=N_YEARS, n_simulations=N_SIMULATIONS, rng=cell_generator(SEED, 0),
+        crn=MARKET_CRN, shock_source=SHOCK_SOURCE,
+    )
+
+    # ── сетка ячеек: market_scenario × transition_scenario × age × sex × salary ──
+    # (payment_rate развёртывается внутри ячейки)
+    cells = GRID.cells()
+    execution = plan(GRID, cells, n_workers=N_WORKERS, backend=BACKEND)
+    print(f"План: {execution}")
+
+    ckpt = Checkpoint(os.path.join(TEMP_DIR, 'checkpoints', 'h2h3'), cells=cells, config={
+        'N_SIMULATIONS': N_SIMULATIONS, 'N_YEARS': N_YEARS, 'TAX_RATE': TAX_RATE, 'SEED': SEED,
+        'MARKET_CRN': MARKET_CRN, 'SHOCK_SOURCE': SHOCK_SOURCE, 'PAYMENT_RATES': PAYMENT_RATES,
+        'SEARCH_MODE': SEARCH_MODE, 'SAVE_RAW': SAVE_RAW, 'SHARED_SHOCKS': SHARED_SHOCKS,
+        'SWEEP_METRICS': SWEEP_METRICS, 'RATE_TOL': RATE_TOL, 'CI_Z': CI_Z, 'MARKET_SCENARIOS': MARKET_SCENARIOS,
+    }) if CHECKPOINT else None
+    if ckpt is not None and ckpt.n_done(cells):
+        print(f"Контрольная точка: готово {ckpt.n_done(cells)} из {len(cells)} ячеек")
+
+    if SEARCH_MODE == 'adaptive':
+        results = execution.run(shared=shared_returns, checkpoint=ckpt, desc='H2H3 cells (adaptive)')
+        summary = pd.DataFrame([row for cell_rows in results for row in cell_rows])
+    else:
+        # сводка по ячейке считается в воркере по онлайн-агрегатам (scenarios.online_stats);
+        # траектории при SAVE_RAW воркер пишет кусками по ячейкам (scenarios.results);
+        # куски готовых ячеек контрольной точки остаются, прочие — от прошлых прогонов
+        if SAVE_RAW:
+            clear_parts(RAW_BASE, keep=[part_name(c['key']) for c in cells if ckpt is not None and ckpt.done(c)])
+        summary_rows, n_raw = [], 0
+        for row, part in execution.run(shared=shared_returns, checkpoint=ckpt, desc='H2H3 cells'):
+            summary_rows.append(row)
+            if part is not None:
+                n_raw += part.n_rows
+        if SAVE_RAW:
+            print(f"Сырые данные: {RAW_BASE}  ({n_raw} строк)")
+        summary = pd.DataFrame(summary_rows)
+
     summary.to_csv(os.path.join(TEMP_DIR, 'h2h3_inflection_points.csv'), index=False)
     print("\nХарактерные точки по сценариям:")
     print(summary[['market_scenario', 'transition_scenario', 'age', 'sex', 'salary',
@@ -263,3 +361,6 @@ if __name__ == '__main__':
                    'h2_pds_max_advantage_rate', 'h2_pds_iis_indifference_rate',
                    'h3_marginal_roi_decline_rate']].to_string(index=False))
     print(f"\nСохранено: {TEMP_DIR}/h2h3_inflection_points.csv")
+
+    if ckpt is not None:
+        ckpt.clear()
@@ -30,20 +30,27 @@
 
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 import pyreadstat
+from functools import partial
+from typing import Optional
 
 from models.securities.portfolio import PortfolioModel
-from models.programs.base import ProgramInput
-from models.programs.pds import PDSProgram
-from models.programs.iis3 import IIS3Program
+from models.programs.batch import BatchProgramInput
+from models.programs.pds import PDSBatchProgram
+from models.programs.iis3 import IIS3BatchProgram
 from models.macro.salary import StochasticSalaryModel
 from models.macro.unemployment import WeibullUnemploymentModel
 
-from scenarios import (indexes, structure, life_table, YIELD_COL,
-                       unemployment_k, unemployment_p, unemployment_lambda)
+from scenarios import life_table, unemployment_k, unemployment_p, unemployment_lambda
 from models.securities import get_security_params
-from scenarios.market_scenarios import MARKET_SCENARIOS, build_portfolio_for_scenario
+from scenarios.market_scenarios import MARKET_SCENARIOS
+from scenarios.portfolios import PORTFOLIOS, portfolio_returns
+from scenarios.grid import Axis, GridSpec, plan
+from scenarios.results import CellPart, write_cell_part, clear_parts, part_name
+from scenarios.checkpoint import Checkpoint
+from scenarios.online_stats import OnlineStats
+from scenarios.adaptive import run_adaptive, check_shock_source, winner_rule
+from models.utils import cell_generator
 import os
 
 TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_data')
@@ -52,6 +59,22 @@ TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_data')
 N_SIMULATIONS = 5000
 N_YEARS       = 15
 TAX_RATE      = 0.13
+SEED          = 42            # корневой seed: потоки ячеек через cell_generator
+N_WORKERS     = os.cpu_count()  # процессы пула; 1 — последовательно
+BACKEND       = None          # None — по плану (процессы); 'thread' | 'serial' (см. scenarios.grid)
+MARKET_CRN    = True          # общие шоки рынка для всех рыночных сценариев (CRN)
+SHOCK_SOURCE  = None          # None — псевдослучайные; models.securities.shocks.QMCShocks() — RQMC (N_SIMULATIONS кратно n_replicates)
+
+# адаптивная остановка: ячейка добирает траектории блоками по BATCH_SIMS, пока
+# 95 % ДИ разности E[benefit] ПДС и лучшего ИИС-3 не отделится от 0 либо не
+# сузится до ±WINNER_TOL; N_SIMULATIONS — потолок
+ADAPTIVE      = False
+BATCH_SIMS    = 500
+WINNER_TOL    = 0.01
+
+SAVE_RAW      = True          # сырые траектории h4_raw (нужны analysis); карта победителей считается онлайн
+CHECKPOINT    = True          # готовые ячейки — на диск (temp_data/checkpoints); перезапуск досчитывает недостающие
+GROUP_KEYS    = ('market_scenario', 'transition_scenario', 'payment_scenario', 'age_group', 'sex', 'portfolio')
 
 
 def analytical_cap_rate(salary: float) -> float:
@@ -76,34 +99,6 @@ PAYMENT_SCENARIOS = {
     '2x_cap_rate': lambda salary: min(analytical_cap_rate(salary) * 2, 0.24),
 }
 
-ASSET_ORDER = ['stock', 'gov_bond', 'corp_bond', 'mun_bond']
-YIELD_COLS  = [f'{YIELD_COL}_{a}' for a in ASSET_ORDER]
-CORR_4X4    = indexes[YIELD_COLS].corr().values
-
-pds_avg = structure.iloc[-1]
-_bond_total = pds_avg[['gov_bond', 'corp_bond', 'mun_bond']].sum()
-BOND_RATIOS = {
-    'gov_bond':  pds_avg['gov_bond']  / _bond_total,
-    'corp_bond': pds_avg['corp_bond'] / _bond_total,
-    'mun_bond':  pds_avg['mun_bond']  / _bond_total,
-}
-
-def build_iis3_structure(stock_share: float) -> dict:
-    bond_share = 1.0 - stock_share
-    return {
-        'stock':     stock_share,
-        'gov_bond':  bond_share * BOND_RATIOS['gov_bond'],
-        'corp_bond': bond_share * BOND_RATIOS['corp_bond'],
-        'mun_bond':  bond_share * BOND_RATIOS['mun_bond'],
-    }
-
-PORTFOLIOS = {
-    'pds_avg':    structure.iloc[-1][ASSET_ORDER].to_dict(),
-    'iis3_20/80': build_iis3_structure(0.20),
-    'iis3_50/50': build_iis3_structure(0.50),
-    'iis3_80/20': build_iis3_structure(0.80),
-}
-
 # ── демографическая сетка (из demogr_salaries_agg.csv, данные 2021) ───────────
 # Представительный возраст = середина 5-летнего интервала
 AGE_GROUPS = {
@@ -118,6 +113,19 @@ AGE_GROUPS = {
 }
 SEX_RANGE = ['M', 'F']
 
+# сырые траектории (SAVE_RAW): кусок на ячейку пишет воркер, в контрольную
+# точку попадает только путь к нему (scenarios.results.write_cell_part)
+RAW_BASE = os.path.join(TEMP_DIR, 'h4_raw')
+RAW_CATEGORIES = {
+    'market_scenario':     list(MARKET_SCENARIOS),
+    'transition_scenario': list(TRANSITION_SCENARIOS),
+    'payment_scenario':    list(PAYMENT_SCENARIOS),
+    'age_group':           list(AGE_GROUPS),
+    'sex':                 SEX_RANGE,
+    'program':             ['pds', 'iis3'],
+    'portfolio':           list(PORTFOLIOS),
+}
+
 # ── загрузка представительных зарплат ────────────────────────────────────────
 # Индексация зарплат 2021 → 2026 по данным Росстат (накопленная инфляция ×1.6004)
 _INFLATION_2021_TO_2026 = (1+0.0519)*(1+0.0874)*(1+0.1176)*(1+0.0744)*(1+0.0992)*(1+0.0601)
@@ -133,6 +141,16 @@ def load_representative_salaries() -> dict:
     return salaries
 
 
+def demographic_fields(cell: dict, salaries: dict) -> dict:
+    """Производные поля ячейки: представительный возраст, зарплата группы и ставка взноса."""
+    salary = salaries[cell['age_group']]
+    return {
+        'rep_age':      AGE_GROUPS[cell['age_group']]['rep_age'],
+        'salary':       salary,
+        'payment_rate': PAYMENT_SCENARIOS[cell['payment_scenario']](salary),
+    }
+
+
 # ── загрузка весов ЗАН для оценки численности вкладчиков ─────────────────────
 def load_zan_weights() -> pd.DataFrame:
     """
@@ -166,110 +184,179 @@ def load_zan_weights() -> pd.DataFrame:
     return pop
 
 
+def _program_batch(cell: dict, portfolio: str, rates: np.ndarray, rng: np.random.Generator) -> dict:
+    """Метрики одной программы ячейки по траекториям rates (n_sims, n)."""
+    is_pds = portfolio.startswith('pds')
+    age = cell['rep_age']
+    params = BatchProgramInput(
+        n=rates.shape[1], age=age, sex=cell['sex'],
+        rates=rates,
+        payment_mode='relative',
+        payment_rate=cell['payment_rate'],
+        initial_salary=cell['salary'],
+        tax_deduction_rate=TAX_RATE,
+        salary_model=StochasticSalaryModel(initial_age=age),
+        unemployment_model=WeibullUnemploymentModel(
+            p_exit=cell['p_transition'], weibull_k=unemployment_k, weibull_lambda=unemployment_lambda
+        ),
+        rng=rng,
+    )
+
+    prog = (PDSBatchProgram(params=params, life_table=life_table)
+            if is_pds
+            else IIS3BatchProgram(params=params, life_table=None))
+    prog.run()
+    m = prog.compute_metrics()
+
+    # Единая метрика: накопления / среднегодовая зарплата
+    avg_final_annual = prog.annual_salaries[:, :params.n].mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        benefit_metric = np.where(avg_final_annual > 0, m['savings'] / avg_final_annual, np.nan)
+
+    first_pension = prog.first_pension
+    return {
+        'kz':            m['kz'],
+        'benefit':       benefit_metric,
+        'first_pension': np.full(len(rates), np.nan) if first_pension is None else first_pension,
+        'irr':           m['irr'],
+        'roi':           m['roi'],
+        'savings':       m['savings'],
+    }
+
+
+def run_cell(cell: dict, shared: dict) -> tuple[OnlineStats, int, Optional[CellPart]]:
+    """
+    Одна ячейка сетки: market × transition × payment × age_group × sex, все
+    портфели PORTFOLIOS на общих столбцах матриц доходностей (у каждого
+    портфеля свой поток зарплат и занятости, ключ key + (p_idx,)).
+    При ADAPTIVE траектории добираются блоками по BATCH_SIMS, пока решение
+    «ПДС против лучшего ИИС-3» по E[benefit] не станет определённым
+    (см. scenarios.adaptive.winner_rule), иначе — сразу N_SIMULATIONS.
+    Возвращает онлайн-агрегаты benefit по портфелям (ключи GROUP_KEYS), число
+    траекторий и, при SAVE_RAW, кусок сырых траекторий в RAW_BASE (наборы столбцов по портфелям).
+    """
+    streams = {label: cell_generator(SEED, *cell['key'], p_idx) for p_idx, label in enumerate(PORTFOLIOS)}
+    n_sims_max = shared[f"{cell['market_scenario']}|pds_avg"].shape[1]
+
+    def simulate(start: int, stop: int) -> dict:
+        values = {}
+        for label, rng in streams.items():
+            rates = shared[f"{cell['market_scenario']}|{label}"][:, start:stop].T
+            for key, arr in _program_batch(cell, label, rates, rng).items():
+                values[f'{key}|{label}'] = arr
+        return values
+
+    iis3_labels = [f'benefit|{label}' for label in PORTFOLIOS if label.startswith('iis3')]
+    rules = [winner_rule('benefit|pds_avg', iis3_labels, WINNER_TOL)] if ADAPTIVE else []
+    values, n_sims = run_adaptive(simulate, rules, batch_size=BATCH_SIMS, max_sims=n_sims_max)
+
+    stats = OnlineStats(keys=GROUP_KEYS)
+    for label in PORTFOLIOS:
+        stats.update(tuple(cell[k] for k in GROUP_KEYS[:-1]) + (label,), {'benefit': values[f'benefit|{label}']})
+    if not SAVE_RAW:
+        return stats, n_sims, None
+
+    parts = []
+    for label in PORTFOLIOS:
+        is_pds = label.startswith('pds')
+        parts.append({
+            'market_scenario':     cell['market_scenario'],
+            'transition_scenario': cell['transition_scenario'],
+            'p_transition':        cell['p_transition'],
+            'payment_scenario':    cell['payment_scenario'],
+            'age_group':   cell['age_group'],
+            'rep_age':     cell['rep_age'],
+            'sex':         cell['sex'],
+            'salary':      round(cell['salary']),
+            'payment_rate': round(cell['payment_rate'], 4),
+            'program':     'pds' if is_pds else 'iis3',
+            'portfolio':   label,
+            'n_sims':      n_sims,
+            'sim_id':      np.arange(n_sims),
+            'kz':          values[f'kz|{label}'],
+            'benefit':     values[f'benefit|{label}'],
+            'first_pension': values[f'first_pension|{label}'] if is_pds else None,
+            'irr':         values[f'irr|{label}'],
+            'roi':         values[f'roi|{label}'],
+            'savings':     values[f'savings|{label}'],
+        })
+    return stats, n_sims, write_cell_part(RAW_BASE, cell['key'], parts, categories=RAW_CATEGORIES)
+
+
 if __name__ == '__main__':
 
+    if ADAPTIVE:
+        check_shock_source(SHOCK_SOURCE)   # префиксы RQMC-выборки и iid-интервалы несовместимы
+
     print("Загружаю данные...")
     rep_salaries = load_representative_salaries()
     zan_weights  = load_zan_weights()
 
-    # ── основной цикл по рыночным и трудовым сценариям ────────────────────────
-    rows = []
-    for market_scenario in MARKET_SCENARIOS:
-        print(f"Симулирую портфели [{market_scenario}]...")
-        simulated_returns = {}
-        for label, struct_dict in PORTFOLIOS.items():
-            simulated_returns[label] = build_portfolio_for_scenario(
-                scenario=market_scenario,
-                indexes=indexes,
-                structure=struct_dict,
-                corr_matrix=CORR_4X4,
-                n_years=N_YEARS,
-                n_simulations=N_SIMULATIONS,
-                yield_col=YIELD_COL,
-                show_progress=False,
-            )
-
-        for transit_label, p_transit in TRANSITION_SCENARIOS.items():
-            unemployment_model = WeibullUnemploymentModel(
-                p_exit=p_transit, weibull_k=unemployment_k, weibull_lambda=unemployment_lambda
-            )
-
-            for payment_scenario, rate_fn in PAYMENT_SCENARIOS.items():
-                for age_group, info in tqdm(AGE_GROUPS.items(),
-                                            desc=f'age_group [{market_scenario}/{transit_label}/{payment_scenario}]'):
-                    age          = info['rep_age']
-                    salary       = rep_salaries[age_group]
-                    payment_rate = rate_fn(salary)
-                    salary_model = StochasticSalaryModel(initial_age=age)
-
-                    for sex in SEX_RANGE:
-                        for portfolio_label, returns_matrix in simulated_returns.items():
-                            is_pds = portfolio_label.startswith('pds')
-
-                            for i in range(N_SIMULATIONS):
-                                rates = list(returns_matrix[:, i][::252])
-                                n     = len(rates)
-
-                                params = ProgramInput(
-                                    n=n, age=age, sex=sex,
-                                    rates=rates,
-                                    payment_mode='relative',
-                                    payment_rate=payment_rate,
-                                    initial_salary=salary,
-                                    tax_deduction_rate=TAX_RATE,
-                                    salary_model=salary_model,
-                                    unemployment_model=unemployment_model,
-                                )
-
-                                prog = (PDSProgram(params=params, life_table=life_table)
-                                        if is_pds
-                                        else IIS3Program(params=params, life_table=None))
-                                prog.run()
-                                m = prog.compute_metrics()
-
-                                # Единая метрика: накопления / среднегодовая зарплата
-                                avg_final_annual = (prog.annual_salaries[-(params.n+1):-1]).mean()
-                                benefit_metric = (m['savings'] / avg_final_annual
-                                                  if avg_final_annual > 0 else np.nan)
-
-                                rows.append({
-                                    'market_scenario':     market_scenario,
-                                    'transition_scenario': transit_label,
-                                    'p_transition':        p_transit,
-                                    'payment_scenario':    payment_scenario,
-                                    'age_group':   age_group,
-                                    'rep_age':     age,
-                                    'sex':         sex,
-                                    'salary':      round(salary),
-                                    'payment_rate': round(payment_rate, 4),
-                                    'program':     'pds' if is_pds else 'iis3',
-                                    'portfolio':   portfolio_label,
-                                    'sim_id':      i,
-                                    'kz':          m['kz'],
-                                    'benefit':     benefit_metric,
-                                    'first_pension': prog.first_pension,
-                                    'irr':         m['irr'],
-                                    'roi':         m['roi'],
-                                    'savings':     m['savings'],
-                                })
-
-    df = pd.DataFrame(rows)
-    df.to_csv(os.path.join(TEMP_DIR, 'h4_raw.csv'), index=False)
-    print(f"Сырые данные: {TEMP_DIR}/h4_raw.csv  ({len(df)} строк)")
+    # ── доходности: один прогон активов на все рыночные сценарии ─────────────
+    print("Симулирую портфели по рыночным сценариям...")
+    shared_returns = portfolio_returns(
+        PORTFOLIOS, n_years=N_YEARS, n_simulations=N_SIMULATIONS, rng=cell_generator(SEED, 0),
+        crn=MARKET_CRN, shock_source=SHOCK_SOURCE,
+    )
+
+    # ── сетка ячеек: market × transition × payment × age_group × sex ──────────
+    # (портфели развёртываются внутри ячейки — решение о победителе по ячейке)
+    grid = GridSpec(
+        axes=[
+            Axis('market_scenario', list(MARKET_SCENARIOS)),
+            Axis('transition_scenario', TRANSITION_SCENARIOS, value_field='p_transition'),
+            Axis('payment_scenario', list(PAYMENT_SCENARIOS)),
+            Axis('age_group', list(AGE_GROUPS)),
+            Axis('sex', SEX_RANGE),
+        ],
+        cell_fn=run_cell,
+        derive=partial(demographic_fields, salaries=rep_salaries),
+    )
+    cells = grid.cells()
+    execution = plan(grid, cells, n_workers=N_WORKERS, backend=BACKEND)
+    print(f"План: {execution}")
+
+    # средние и перцентили benefit копятся онлайн (scenarios.online_stats);
+    # траектории при SAVE_RAW воркер пишет кусками по ячейкам (scenarios.results)
+    ckpt = Checkpoint(os.path.join(TEMP_DIR, 'checkpoints', 'h4'), cells=cells, config={
+        'N_SIMULATIONS': N_SIMULATIONS, 'N_YEARS': N_YEARS, 'TAX_RATE': TAX_RATE, 'SEED': SEED,
+        'MARKET_CRN': MARKET_CRN, 'SHOCK_SOURCE': SHOCK_SOURCE, 'ADAPTIVE': ADAPTIVE, 'BATCH_SIMS': BATCH_SIMS,
+        'WINNER_TOL': WINNER_TOL, 'SAVE_RAW': SAVE_RAW, 'MARKET_SCENARIOS': MARKET_SCENARIOS,
+        'PORTFOLIOS': PORTFOLIOS,
+    }) if CHECKPOINT else None
+    if ckpt is not None and ckpt.n_done(cells):
+        print(f"Контрольная точка: готово {ckpt.n_done(cells)} из {len(cells)} ячеек")
+    # куски готовых ячеек контрольной точки остаются, прочие — от прошлых прогонов
+    if SAVE_RAW:
+        clear_parts(RAW_BASE, keep=[part_name(c['key']) for c in cells if ckpt is not None and ckpt.done(c)])
+
+    stats, used, n_raw = OnlineStats(keys=GROUP_KEYS), [], 0
+    for cell_stats, n_sims, part in execution.run(shared=shared_returns, checkpoint=ckpt, desc='H4 cells'):
+        stats.merge(cell_stats)
+        used.append(n_sims)
+        if part is not None:
+            n_raw += part.n_rows
+    if SAVE_RAW:
+        print(f"Сырые данные: {RAW_BASE}  ({n_raw} строк)")
+    if ADAPTIVE:
+        print(f"Траекторий на ячейку: min {min(used)}, mean {np.mean(used):.0f}, max {max(used)} "
+              f"(потолок {N_SIMULATIONS})")
 
     # ── карта победителей по каждому сценарию ставки взноса ─────────────────
     pctiles = [5, 25, 50, 75, 95]
+    benefit = stats.table(metrics=['benefit'], percentiles=pctiles)
     winner_maps = []
     pop_summaries = []
 
     for pay_sc in PAYMENT_SCENARIOS:
-        base = df[(df['market_scenario'] == 'baseline') &
-                  (df['transition_scenario'] == 'baseline') &
-                  (df['payment_scenario'] == pay_sc)]
+        base = benefit[(benefit['market_scenario'] == 'baseline') &
+                       (benefit['transition_scenario'] == 'baseline') &
+                       (benefit['payment_scenario'] == pay_sc)]
 
         mean_benefit = (
-            base.groupby(['age_group', 'sex', 'portfolio'])['benefit']
-            .mean().reset_index().rename(columns={'benefit': 'mean_benefit'})
+            base[['age_group', 'sex', 'portfolio', 'benefit_mean']]
+            .sort_values(['age_group', 'sex', 'portfolio'])
+            .rename(columns={'benefit_mean': 'mean_benefit'})
         )
         iis3_ben   = mean_benefit[mean_benefit['portfolio'].str.startswith('iis3')]
         iis3_best = (iis3_ben.groupby(['age_group', 'sex'])['mean_benefit']
@@ -284,10 +371,8 @@ if __name__ == '__main__':
 
         pds_pct = (
             base[base['portfolio'] == 'pds_avg']
-            .groupby(['age_group', 'sex'])['benefit']
-            .agg(**{f'benefit_pds_p{p}': (lambda x, _p=p: np.percentile(x.dropna(), _p))
-                    for p in pctiles})
-            .reset_index()
+            [['age_group', 'sex'] + [f'benefit_p{p}' for p in pctiles]]
+            .rename(columns={f'benefit_p{p}': f'benefit_pds_p{p}' for p in pctiles})
         )
         wm = wm.merge(pds_pct, on=['age_group', 'sex'], how='left')
         wm = wm.merge(
@@ -313,4 +398,7 @@ if __name__ == '__main__':
 
     print("\n=== Оценка численности потенциальных вкладчиков ===")
     print(pop_summary.to_string(index=False))
-    print("\nСохранено: temp_data/h4_raw.csv, h4_winner_map.csv, h4_population_summary.csv")
+    print(f"\nСохранено: {TEMP_DIR}/h4_winner_map.csv, h4_population_summary.csv")
+
+    if ckpt is not None:
+        ckpt.clear()
@@ -13,8 +13,27 @@
   from scenarios.market_scenarios import MARKET_SCENARIOS, build_portfolio_for_scenario
   returns = build_portfolio_for_scenario(
       scenario='stress', indexes=indexes, structure=struct_dict,
-      corr_matrix=CORR_4X4, n_years=15, n_simulations=300
+      corr_matrix=CORR_4X4, n_years=15, n_simulations=300, sample_every=252
   )
+
+  # один прогон активов на сценарий → любое число портфелей
+  asset_paths = simulate_scenario_assets(
+      scenario='stress', indexes=indexes, asset_order=ASSET_ORDER,
+      corr_matrix=CORR_4X4, n_years=15, n_simulations=300, sample_every=252
+  )
+  returns_by_portfolio = combine_portfolios(asset_paths, PORTFOLIOS, ASSET_ORDER)
+
+  # общие случайные числа (CRN): один тензор шоков на sim_id для всех сценариев
+  paths_by_scenario = simulate_market_assets(
+      scenarios=MARKET_SCENARIOS, indexes=indexes, asset_order=ASSET_ORDER,
+      corr_matrix=CORR_4X4, n_years=15, n_simulations=300, sample_every=252, crn=True
+  )
+
+Сценарные сдвиги (stock_mu_shift, stock_sigma_mult, bond_b_shift, bond_sigma_mult)
+входят в модели активов аффинно по шокам: дневная доходность акции μ·dt + σ·√dt·Z,
+приращение облигации a(b − Y)dt + σ·√dt·Z. В режиме CRN шоки Z тянутся один раз
+и все сценарии (и все портфели из combine_portfolios) отличаются только этим
+аффинным преобразованием — разности между сценариями не несут шума выборки.
 """
 
 import numpy as np
@@ -22,6 +41,9 @@ import pandas as pd
 from models.securities.stocks import StockModel, StockParams
 from models.securities.bonds import BondModel, BondParams
 from models.securities.portfolio import PortfolioModel
+from models.securities.shocks import ShockSource, PseudoRandomShocks
+from models.utils import as_generator
+from tqdm import tqdm
 
 # ── Множители для сдвига параметров относительно базового ─────────────────────
 # Каждый сценарий задаётся как словарь множителей/сдвигов:
@@ -55,31 +77,22 @@ MARKET_SCENARIOS: dict[str, dict] = {
 }
 
 
-def build_portfolio_for_scenario(
+def build_securities_for_scenario(
     scenario: str,
     indexes: pd.DataFrame,
     structure: dict,
-    corr_matrix: np.ndarray,
-    n_years: int,
-    n_simulations: int,
     yield_col: str = 'YIELD',
     a: float = 0.1,
     b: float = 0.07,
-    dt: float = 1 / 252,
-    show_progress: bool = False,
-) -> np.ndarray:
+) -> list:
     """
-    Строит портфель с параметрами, сдвинутыми согласно сценарию, и симулирует доходности.
-
-    Возвращает матрицу (n_steps, n_simulations) — как PortfolioModel.simulate().
+    Модели активов структуры {asset_type: weight} с параметрами, сдвинутыми согласно сценарию.
+    Порядок активов совпадает с порядком ключей structure.
     """
     sc = MARKET_SCENARIOS[scenario]
     securities = []
 
     for asset_type, weight in structure.items():
-        if weight == 0:
-            continue
-
         if 'stock' in asset_type:
             mu_base   = indexes['R_t'].mean() * 252
             sigma_base = indexes['R_t'].std() * np.sqrt(252)
@@ -103,10 +116,220 @@ def build_portfolio_for_scenario(
             )
             securities.append(BondModel(params))
 
+    return securities
+
+
+def build_assets_for_scenario(
+    scenario: str,
+    indexes: pd.DataFrame,
+    asset_order: list[str],
+    yield_col: str = 'YIELD',
+    a: float = 0.1,
+    b: float = 0.07,
+) -> list:
+    """
+    Модели активов asset_order для симуляции без портфеля (simulate_assets).
+    Веса — заглушка поровну: нужны только для проверки суммы весов в
+    PortfolioModel, пути активов от них не зависят.
+    """
+    equal = {asset_type: 1 / len(asset_order) for asset_type in asset_order}
+    return build_securities_for_scenario(scenario, indexes, equal, yield_col=yield_col, a=a, b=b)
+
+
+def build_portfolio_for_scenario(
+    scenario: str,
+    indexes: pd.DataFrame,
+    structure: dict,
+    corr_matrix: np.ndarray,
+    n_years: int,
+    n_simulations: int,
+    yield_col: str = 'YIELD',
+    a: float = 0.1,
+    b: float = 0.07,
+    dt: float = 1 / 252,
+    show_progress: bool = False,
+    sample_every: int = 1,
+    method: str = 'daily',
+    rng: np.random.Generator = None,
+    shock_source: ShockSource = None,
+) -> np.ndarray:
+    """
+    Строит портфель с параметрами, сдвинутыми согласно сценарию, и симулирует доходности.
+
+    Возвращает матрицу (n_steps, n_simulations) — как PortfolioModel.simulate();
+    при sample_every > 1 — только каждое sample_every-е наблюдение.
+    method='exact' — годовые точки из точного закона GBM/OU (см. PortfolioModel.simulate).
+    rng — numpy.random.Generator для шоков (None — свежий поток);
+    shock_source — источник шоков (None — псевдослучайные, см. models.securities.shocks).
+    """
+    active = {asset_type: weight for asset_type, weight in structure.items() if weight != 0}
+    securities = build_securities_for_scenario(scenario, indexes, active, yield_col=yield_col, a=a, b=b)
+
     portfolio = PortfolioModel(assets=securities, corr_matrix=corr_matrix)
     return portfolio.simulate(
         n_years=n_years,
         n_simulations=n_simulations,
         dt=dt,
         show_progress=show_progress,
+        sample_every=sample_every,
+        method=method,
+        rng=rng,
+        shock_source=shock_source,
     )
+
+
+def simulate_scenario_assets(
+    scenario: str,
+    indexes: pd.DataFrame,
+    asset_order: list[str],
+    corr_matrix: np.ndarray,
+    n_years: int,
+    n_simulations: int,
+    yield_col: str = 'YIELD',
+    a: float = 0.1,
+    b: float = 0.07,
+    dt: float = 1 / 252,
+    show_progress: bool = False,
+    sample_every: int = 1,
+    method: str = 'daily',
+    rng: np.random.Generator = None,
+    shock_source: ShockSource = None,
+) -> np.ndarray:
+    """
+    Симулирует каждый актив asset_order один раз для сценария (без взвешивания).
+
+    Возвращает тензор (n_assets, n_rows, n_simulations); доходности любого
+    набора портфелей получаются из него через combine_portfolios.
+    corr_matrix должна быть упорядочена так же, как asset_order.
+    rng — numpy.random.Generator для шоков (None — свежий поток);
+    shock_source — источник шоков (None — псевдослучайные).
+    """
+    securities = build_assets_for_scenario(scenario, indexes, asset_order, yield_col=yield_col, a=a, b=b)
+
+    portfolio = PortfolioModel(assets=securities, corr_matrix=corr_matrix)
+    return portfolio.simulate_assets(
+        n_years=n_years,
+        n_simulations=n_simulations,
+        dt=dt,
+        show_progress=show_progress,
+        sample_every=sample_every,
+        method=method,
+        rng=rng,
+        shock_source=shock_source,
+    )
+
+
+def simulate_market_assets(
+    scenarios,
+    indexes: pd.DataFrame,
+    asset_order: list[str],
+    corr_matrix: np.ndarray,
+    n_years: int,
+    n_simulations: int,
+    yield_col: str = 'YIELD',
+    a: float = 0.1,
+    b: float = 0.07,
+    dt: float = 1 / 252,
+    show_progress: bool = False,
+    chunk_size: int = 500,
+    sample_every: int = 1,
+    method: str = 'daily',
+    crn: bool = True,
+    rng: np.random.Generator = None,
+    shock_source: ShockSource = None,
+) -> dict[str, np.ndarray]:
+    """
+    Пути активов asset_order для нескольких рыночных сценариев.
+
+    crn=True — общие случайные числа: блок шоков (n_assets, n_rows, chunk_size)
+    тянется один раз и подаётся в модели всех сценариев, т.е. sim_id j во всех
+    сценариях видит один и тот же рынок с точностью до сдвигов параметров.
+    crn=False — каждый сценарий получает свои шоки из rng (последовательно).
+    shock_source — источник шоков (None — псевдослучайные; QMCShocks — квази-МК).
+
+    Возвращает {scenario: тензор (n_assets, n_rows, n_simulations)}, как
+    simulate_scenario_assets; scenarios — список имён или MARKET_SCENARIOS.
+    """
+    rng = as_generator(rng)
+    portfolios = {
+        scenario: PortfolioModel(
+            assets=build_assets_for_scenario(scenario, indexes, asset_order, yield_col=yield_col, a=a, b=b),
+            corr_matrix=corr_matrix,
+        )
+        for scenario in scenarios
+    }
+
+    if not crn:
+        return {
+            scenario: portfolio.simulate_assets(
+                n_years=n_years, n_simulations=n_simulations, dt=dt, show_progress=show_progress,
+                chunk_size=chunk_size, sample_every=sample_every, method=method, rng=rng,
+                shock_source=shock_source,
+            )
+            for scenario, portfolio in portfolios.items()
+        }
+
+    n_assets = len(asset_order)
+    n_rows = len(range(0, int(n_years / dt), sample_every))
+    n_shock_rows = next(iter(portfolios.values())).shock_rows(n_years, dt, sample_every, method)
+    asset_paths = {scenario: np.zeros((n_assets, n_rows, n_simulations)) for scenario in portfolios}
+    draw = (shock_source or PseudoRandomShocks()).sampler(n_assets, n_shock_rows, n_simulations, rng)
+
+    for start in tqdm(range(0, n_simulations, chunk_size), disable=not show_progress):
+        stop = min(start + chunk_size, n_simulations)
+        Z = draw(stop - start)
+        for scenario, portfolio in portfolios.items():
+            asset_paths[scenario][:, :, start:stop] = portfolio.assets_from_shocks(Z, n_years, dt, sample_every, method)
+
+    return asset_paths
+
+
+def expected_market_assets(
+    scenarios,
+    indexes: pd.DataFrame,
+    asset_order: list[str],
+    n_years: int,
+    yield_col: str = 'YIELD',
+    a: float = 0.1,
+    b: float = 0.07,
+    dt: float = 1 / 252,
+    sample_every: int = 1,
+    method: str = 'daily',
+) -> dict[str, np.ndarray]:
+    """
+    Аналитические E[путь] активов asset_order по сценариям в строках
+    simulate_market_assets: {scenario: (n_assets, n_rows)}. Ожидаемые доходности
+    портфелей — combine_portfolios от этих матриц (доходность портфеля линейна
+    по активам). Известные средние для контрольных переменных
+    (см. quality.variance_reduction.annuity_control).
+    """
+    return {
+        scenario: np.stack([
+            asset.expected_path(n_years, dt=dt, sample_every=sample_every, method=method)
+            for asset in build_assets_for_scenario(scenario, indexes, asset_order, yield_col=yield_col, a=a, b=b)
+        ])
+        for scenario in scenarios
+    }
+
+
+def portfolio_weight_matrix(structures, asset_order: list[str]) -> tuple[list, np.ndarray]:
+    """
+    Матрица весов (n_portfolios, n_assets) из {label: {asset_type: weight}}
+    или из DataFrame структур (строки — портфели, как data/structure.xlsx).
+    Отсутствующие активы и NaN получают вес 0.
+    """
+    if isinstance(structures, pd.DataFrame):
+        frame = structures.reindex(columns=asset_order)
+    else:
+        frame = pd.DataFrame.from_dict(structures, orient='index').reindex(columns=asset_order)
+    return list(frame.index), frame.fillna(0.0).to_numpy(dtype=float)
+
+
+def combine_portfolios(asset_paths: np.ndarray, structures, asset_order: list[str]) -> dict:
+    """
+    Доходности всех портфелей structures из общего тензора путей активов
+    одним матричным произведением. Возвращает {label: (n_rows, n_simulations)}.
+    """
+    labels, weights = portfolio_weight_matrix(structures, asset_order)
+    returns = PortfolioModel.combine(asset_paths, weights)
+    return dict(zip(labels, returns))
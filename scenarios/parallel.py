@@ -0,0 +1,149 @@
+"""
+Параллельное выполнение ячеек сетки сценариев
+---------------------------------------------
+Ячейки (market × transition × ... × portfolio) шардируются по пулу процессов
+ProcessPoolExecutor. Общие для всех ячеек массивы (матрицы доходностей)
+публикуются один раз через multiprocessing.shared_memory и доступны воркерам
+только на чтение — они не пиклятся в каждую задачу. backend='thread' — пул
+потоков над теми же массивами без копий.
+
+Результаты возвращаются в порядке cells независимо от числа воркеров; вместе
+с потоками ячеек из models.utils.cell_generator это даёт одинаковый результат
+при любом n_workers.
+
+Использование
+  def run_cell(cell: dict, shared: dict) -> list[dict]:
+      returns = shared[cell['returns_key']]
+      ...
+
+  results = run_cells(run_cell, cells, shared={'baseline|pds_avg': matrix}, n_workers=8)
+
+  # потоково — результат ячейки обрабатывается сразу и не копится в списке;
+  # сырые траектории воркер пишет сам (scenarios.results.write_cell_part)
+  for row, part in iter_cells(run_cell, cells, shared=..., n_workers=8):
+      summary_rows.append(row)
+
+С checkpoint (scenarios.checkpoint.Checkpoint) готовые ячейки читаются с
+диска, а остальные сохраняются воркером сразу после расчёта.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from scenarios.checkpoint import Checkpoint
+
+# массивы, подключённые в воркере (заполняется инициализатором пула)
+_SHARED: dict[str, np.ndarray] = {}
+_SEGMENTS: list[shared_memory.SharedMemory] = []
+
+
+def _publish(arrays: dict[str, np.ndarray]) -> tuple[list, dict]:
+    segments, specs = [], {}
+    for key, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        segments.append(shm)
+        specs[key] = (shm.name, arr.shape, arr.dtype.str)
+    return segments, specs
+
+
+def _attach(specs: dict) -> None:
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        view.setflags(write=False)
+        _SEGMENTS.append(shm)
+        _SHARED[key] = view
+
+
+def _run(cell_fn: Callable, cell, shared: dict, checkpoint: Optional[Checkpoint] = None):
+    result = cell_fn(cell, shared)
+    if checkpoint is not None:
+        checkpoint.save(cell, result)
+    return result
+
+
+def _call(cell_fn: Callable, cell, checkpoint: Optional[Checkpoint] = None):
+    return _run(cell_fn, cell, _SHARED, checkpoint)
+
+
+def _in_order(cells: list, done: list[bool], computed: Iterator, checkpoint: Optional[Checkpoint]) -> Iterator:
+    # готовые ячейки — с диска, остальные — по мере расчёта, всё в порядке cells
+    for cell, is_done in zip(cells, done):
+        yield checkpoint.load(cell) if is_done else next(computed)
+
+
+def iter_cells(
+    cell_fn: Callable,
+    cells: list,
+    shared: Optional[dict[str, np.ndarray]] = None,
+    n_workers: Optional[int] = None,
+    chunksize: int = 1,
+    desc: Optional[str] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    backend: str = 'process',
+) -> Iterator:
+    """
+    Выполняет cell_fn(cell, shared) для каждой ячейки и выдаёт результаты по
+    одному в порядке cells — вызывающий код может сразу записать их и отпустить.
+
+    cell_fn должна быть функцией уровня модуля (передаётся воркерам по имени).
+    n_workers ≤ 1 — последовательное выполнение в текущем процессе;
+    None — по числу ядер.
+    checkpoint — Checkpoint: считаются только ячейки без сохранённого результата.
+    backend — 'process' (пул процессов, shared memory), 'thread' (пул потоков
+    над теми же массивами) или 'serial'.
+    """
+    shared = shared or {}
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    done = [checkpoint is not None and checkpoint.done(cell) for cell in cells]
+    pending = [cell for cell, is_done in zip(cells, done) if not is_done]
+
+    if backend not in ('serial', 'thread', 'process'):
+        raise ValueError(f'Invalid backend. Expected "serial", "thread" or "process", receive: {backend}')
+
+    if backend != 'process' or n_workers <= 1 or len(pending) <= 1:
+        read_only = {}
+        for key, arr in shared.items():
+            view = np.asarray(arr).view()
+            view.setflags(write=False)
+            read_only[key] = view
+        if backend == 'thread' and n_workers > 1:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                results = pool.map(lambda cell: _run(cell_fn, cell, read_only, checkpoint), pending)
+                yield from _in_order(cells, done, iter(tqdm(results, total=len(pending), desc=desc)), checkpoint)
+            return
+        computed = (_run(cell_fn, cell, read_only, checkpoint) for cell in tqdm(pending, desc=desc))
+        yield from _in_order(cells, done, computed, checkpoint)
+        return
+
+    segments, specs = _publish(shared)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach, initargs=(specs,)) as pool:
+            results = pool.map(_call, [cell_fn] * len(pending), pending, [checkpoint] * len(pending),
+                               chunksize=chunksize)
+            yield from _in_order(cells, done, iter(tqdm(results, total=len(pending), desc=desc)), checkpoint)
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+
+def run_cells(
+    cell_fn: Callable,
+    cells: list,
+    shared: Optional[dict[str, np.ndarray]] = None,
+    n_workers: Optional[int] = None,
+    chunksize: int = 1,
+    desc: Optional[str] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    backend: str = 'process',
+) -> list:
+    """Все результаты iter_cells списком (в порядке cells)."""
+    return list(iter_cells(cell_fn, cells, shared, n_workers, chunksize, desc, checkpoint, backend))
@@ -0,0 +1,103 @@
+"""
+Общие активы и портфели сценариев H1–H4
+---------------------------------------
+  ASSET_ORDER, CORR_4X4   — порядок активов и их корреляции (исторические индексы)
+  BOND_RATIOS             — расщепление облигационной части как у среднего НПФ
+  build_iis3_structure    — ИИС-3 с долей акций stock_share
+  PDS_STRUCT, PORTFOLIOS  — средний портфель НПФ и ПДС + три аллокации ИИС-3
+  portfolio_returns       — доходности портфелей по рыночным сценариям: один
+                            прогон активов на все сценарии и портфели — общая
+                            для всех ячеек сетки работа (scenarios.grid)
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from scenarios import indexes, structure, YIELD_COL
+from scenarios.market_scenarios import (MARKET_SCENARIOS, simulate_market_assets, expected_market_assets,
+                                       combine_portfolios)
+from models.securities.shocks import ShockSource
+
+ASSET_ORDER = ['stock', 'gov_bond', 'corp_bond', 'mun_bond']
+YIELD_COLS  = [f'{YIELD_COL}_{a}' for a in ASSET_ORDER]
+CORR_4X4    = indexes[YIELD_COLS].corr().values
+
+pds_avg = structure.iloc[-1]
+_bond_total = pds_avg[['gov_bond', 'corp_bond', 'mun_bond']].sum()
+BOND_RATIOS = {
+    'gov_bond':  pds_avg['gov_bond']  / _bond_total,
+    'corp_bond': pds_avg['corp_bond'] / _bond_total,
+    'mun_bond':  pds_avg['mun_bond']  / _bond_total,
+}
+
+
+def build_iis3_structure(stock_share: float) -> dict:
+    bond_share = 1.0 - stock_share
+    return {
+        'stock':     stock_share,
+        'gov_bond':  bond_share * BOND_RATIOS['gov_bond'],
+        'corp_bond': bond_share * BOND_RATIOS['corp_bond'],
+        'mun_bond':  bond_share * BOND_RATIOS['mun_bond'],
+    }
+
+
+PDS_STRUCT = pds_avg[ASSET_ORDER].to_dict()
+
+PORTFOLIOS = {
+    'pds_avg':    PDS_STRUCT,
+    'iis3_20/80': build_iis3_structure(0.20),
+    'iis3_50/50': build_iis3_structure(0.50),
+    'iis3_80/20': build_iis3_structure(0.80),
+}
+
+
+def portfolio_returns(
+    portfolios: dict,
+    n_years: int,
+    n_simulations: int,
+    rng: np.random.Generator,
+    scenarios=MARKET_SCENARIOS,
+    crn: bool = True,
+    shock_source: Optional[ShockSource] = None,
+    expected: bool = False,
+    sample_every: int = 252,
+) -> dict[str, np.ndarray]:
+    """
+    Матрицы доходностей (n_years, n_simulations) портфелей portfolios по рыночным
+    сценариям: ключ '{сценарий}|{портфель}'. expected=True — ещё аналитические
+    ожидаемые ставки (n_years,) под ключом '{сценарий}|{портфель}|mean'
+    (для контрольных переменных). Результат — shared для scenarios.parallel.
+    """
+    scenario_assets = simulate_market_assets(
+        scenarios=scenarios,
+        indexes=indexes,
+        asset_order=ASSET_ORDER,
+        corr_matrix=CORR_4X4,
+        n_years=n_years,
+        n_simulations=n_simulations,
+        yield_col=YIELD_COL,
+        show_progress=False,
+        sample_every=sample_every,
+        crn=crn,
+        rng=rng,
+        shock_source=shock_source,
+    )
+    shared = {}
+    for market_scenario, asset_paths in scenario_assets.items():
+        for label, matrix in combine_portfolios(asset_paths, portfolios, ASSET_ORDER).items():
+            shared[f'{market_scenario}|{label}'] = matrix
+
+    if expected:
+        expected_assets = expected_market_assets(
+            scenarios=scenarios,
+            indexes=indexes,
+            asset_order=ASSET_ORDER,
+            n_years=n_years,
+            yield_col=YIELD_COL,
+            sample_every=sample_every,
+        )
+        for market_scenario, mean_paths in expected_assets.items():
+            for label, mean_rates in combine_portfolios(mean_paths, portfolios, ASSET_ORDER).items():
+                shared[f'{market_scenario}|{label}|mean'] = mean_rates
+    return shared
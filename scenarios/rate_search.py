@@ -0,0 +1,197 @@
+"""
+Адаптивный поиск характерных ставок взноса
+------------------------------------------
+Вместо плотной сетки PAYMENT_RATES характерные точки кривых E[stat](r)
+ищутся брекетингом и бисекцией / золотым сечением до заданной точности tol.
+Все ставки оцениваются на одних и тех же траекториях (общие случайные числа):
+sample_fn досчитывает лишь новые ставки, а разности между ставками
+почти не шумят, что и даёт узкие доверительные границы.
+
+  find_plateau_edge   — правый край максимума кривой: ставка, после которой
+                        E[stat] начинает убывать (H2: максимум преимущества
+                        ПДС; H3: начало снижения ROI ПДС);
+  find_first_crossing — первая ставка, где E[stat] переходит с ≥ 0 на < 0
+                        (H2: безразличие ПДС и ИИС-3).
+
+Доверительные границы [lower, upper] — ставки, статистически неотличимые
+от найденной точки на уровне z (по парным разностям для края максимума,
+по |E[stat]| ≤ z·SE для пересечения нуля).
+
+Использование
+  sampler = RateSampler(lambda rates: {'adv': ...})   # (k, n_sims) на каждую статистику
+  curve   = MeanCurve(sampler, lambda s: s['adv'])
+  edge    = find_plateau_edge(curve, 0.005, 0.24, tol=1e-4)
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+GOLDEN = (np.sqrt(5) - 1) / 2
+
+
+class RateSampler:
+    """
+    Кэш значений по ставкам: fn(rates (k,)) -> dict статистик формы (k, n_sims).
+    fn обязана использовать одни и те же траектории для всех ставок.
+    """
+
+    def __init__(self, fn: Callable[[np.ndarray], dict]):
+        self.fn = fn
+        self._cache: dict[float, dict] = {}
+
+    @property
+    def n_evals(self) -> int:
+        return len(self._cache)
+
+    def prefetch(self, rates) -> None:
+        """Оценивает одним вызовом fn все ещё не посчитанные ставки."""
+        missing = sorted({float(r) for r in np.atleast_1d(rates)} - self._cache.keys())
+        if not missing:
+            return
+        values = self.fn(np.array(missing))
+        for j, r in enumerate(missing):
+            self._cache[r] = {key: arr[j] for key, arr in values.items()}
+
+    def __call__(self, rate: float) -> dict:
+        self.prefetch([rate])
+        return self._cache[float(rate)]
+
+
+class MeanCurve:
+    """E[statistic](r) и его стандартная ошибка по симуляциям; NaN-симуляции отбрасываются."""
+
+    def __init__(self, sampler: RateSampler, statistic: Callable[[dict], np.ndarray]):
+        self.sampler = sampler
+        self.statistic = statistic
+
+    def values(self, rate: float) -> np.ndarray:
+        return np.asarray(self.statistic(self.sampler(rate)), dtype=float)
+
+    def mean(self, rate: float) -> float:
+        return float(np.nanmean(self.values(rate)))
+
+    def se(self, rate: float) -> float:
+        v = self.values(rate)
+        v = v[~np.isnan(v)]
+        return float(v.std(ddof=1) / np.sqrt(len(v))) if len(v) > 1 else np.nan
+
+    def se_diff(self, rate_a: float, rate_b: float) -> float:
+        """SE разности средних в двух ставках по парным (CRN) разностям."""
+        d = self.values(rate_a) - self.values(rate_b)
+        d = d[~np.isnan(d)]
+        return float(d.std(ddof=1) / np.sqrt(len(d))) if len(d) > 1 else np.nan
+
+
+@dataclass
+class RateEstimate:
+    rate: Optional[float]     # найденная ставка (None — точки нет на [lo, hi])
+    lower: Optional[float]    # доверительные границы
+    upper: Optional[float]
+    value: float              # E[stat] в найденной точке
+    n_evals: int              # ставок оценено к этому моменту
+
+
+def _bisect(predicate: Callable[[float], bool], a: float, b: float, tol: float) -> tuple[float, float]:
+    """Сужает [a, b] с predicate(a) = True, predicate(b) = False до длины ≤ tol."""
+    while b - a > tol:
+        m = (a + b) / 2
+        if predicate(m):
+            a = m
+        else:
+            b = m
+    return a, b
+
+
+def _golden_max(f: Callable[[float], float], a: float, b: float, tol: float) -> float:
+    c, d = b - GOLDEN * (b - a), a + GOLDEN * (b - a)
+    fc, fd = f(c), f(d)
+    while b - a > tol:
+        if fc >= fd:
+            b, d, fd = d, c, fc
+            c = b - GOLDEN * (b - a)
+            fc = f(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + GOLDEN * (b - a)
+            fd = f(d)
+    return c if fc >= fd else d
+
+
+def find_plateau_edge(curve: MeanCurve, lo: float, hi: float, tol: float = 1e-4,
+                      atol: float = 1e-9, z: float = 1.96, n_bracket: int = 9) -> RateEstimate:
+    """
+    Правый край максимума унимодальной кривой E[stat](r) на [lo, hi].
+
+    Брекетинг по n_bracket точкам, золотое сечение до вершины, затем бисекция
+    по условию E[stat](r) ≥ max − atol: на плато (до первого упора
+    софинансирования в лимит) argmax не единственен, и содержательная точка —
+    ставка, где кривая начинает убывать.
+    Границы — ставки, где max − E[stat](r) ещё ≤ z · SE парной разности.
+    """
+    grid = np.linspace(lo, hi, n_bracket)
+    curve.sampler.prefetch(grid)
+    means = np.array([curve.mean(r) for r in grid])
+    i = int(np.nanargmax(means))
+    peak = _golden_max(curve.mean, grid[max(i - 1, 0)], grid[min(i + 1, n_bracket - 1)], tol)
+
+    evaluated = list(grid) + [peak]
+    r_star = max(evaluated, key=curve.mean)
+    best = curve.mean(r_star)
+
+    def on_plateau(r):
+        return curve.mean(r) >= best - atol
+
+    if on_plateau(hi):
+        edge = hi
+    else:
+        a, _ = _bisect(on_plateau, r_star, hi, tol)
+        edge = a
+
+    def indistinguishable(r):
+        return best - curve.mean(r) <= z * curve.se_diff(r_star, r) + atol
+
+    upper = hi if indistinguishable(hi) else _bisect(indistinguishable, edge, hi, tol)[0]
+    if indistinguishable(lo):
+        lower = lo
+    else:
+        lower = _bisect(lambda r: not indistinguishable(r), lo, r_star, tol)[1]
+
+    return RateEstimate(rate=float(edge), lower=float(lower), upper=float(upper),
+                        value=curve.mean(edge), n_evals=curve.sampler.n_evals)
+
+
+def find_first_crossing(curve: MeanCurve, lo: float, hi: float, tol: float = 1e-4,
+                        z: float = 1.96, n_bracket: int = 12) -> RateEstimate:
+    """
+    Первая ставка на [lo, hi], где E[stat] переходит с ≥ 0 на < 0.
+
+    Брекетинг по n_bracket точкам, затем бисекция до tol. Границы — пересечения
+    нуля кривыми E[stat] − z·SE и E[stat] + z·SE вокруг найденной точки.
+    """
+    grid = np.linspace(lo, hi, n_bracket)
+    curve.sampler.prefetch(grid)
+    means = np.array([curve.mean(r) for r in grid])
+
+    idx = next((k for k in range(n_bracket - 1) if means[k] >= 0 and means[k + 1] < 0), None)
+    if idx is None:
+        return RateEstimate(rate=None, lower=None, upper=None, value=np.nan, n_evals=curve.sampler.n_evals)
+
+    a, b = _bisect(lambda r: curve.mean(r) >= 0, grid[idx], grid[idx + 1], tol)
+    rate = (a + b) / 2
+
+    def above_lower(r):
+        return curve.mean(r) - z * curve.se(r) >= 0
+
+    def above_upper(r):
+        return curve.mean(r) + z * curve.se(r) >= 0
+
+    left = [r for r in grid if r <= a and above_lower(r)]
+    lower = _bisect(above_lower, left[-1], b, tol)[0] if left else lo
+
+    right = [r for r in grid if r >= b and not above_upper(r)]
+    upper = _bisect(above_upper, a, right[0], tol)[1] if right else hi
+
+    return RateEstimate(rate=float(rate), lower=float(min(lower, rate)), upper=float(max(upper, rate)),
+                        value=curve.mean(rate), n_evals=curve.sampler.n_evals)
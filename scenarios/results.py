@@ -0,0 +1,311 @@
+"""
+Потоковая запись результатов сетки сценариев
+--------------------------------------------
+Вместо списка словарей / DataFrame на все траектории результаты ячеек
+дописываются в ColumnSink: типизированные столбцы заранее выделенного
+буфера на chunk_rows строк, строковые признаки (market_scenario, sex,
+portfolio, ...) — коды категорий. Заполненный буфер сбрасывается на диск
+куском, так что память не зависит от числа траекторий.
+
+Формат на диске
+  pyarrow установлен — один файл <base>.parquet, кусок = row group,
+                       категории — dictionary-столбцы;
+  иначе              — каталог <base>/ с part-00000.npz, part-00001.npz, ...
+                       (коды категорий + массив меток __categories__<col>).
+  ColumnSink(part=...) — кусок одной ячейки в каталоге <base>/:
+                       part-<part>-00000.npz, ... или part-<part>.parquet.
+
+Куски ячеек (write_cell_part) пишет воркер сразу после расчёта ячейки, а в
+контрольную точку (scenarios.checkpoint) попадает только CellPart — пути и
+число строк. Сырые данные не дублируются в контрольной точке, а при
+перезапуске куски готовых ячеек остаются на месте (clear_parts удаляет
+остальные). Имя куска — индексы key с нулями, поэтому сортировка файлов
+совпадает с порядком ячеек.
+
+Использование
+  with ColumnSink(os.path.join(TEMP_DIR, 'h1_portfolio_freedom'),
+                  categories={'sex': ['M', 'F'], ...}) as sink:
+      for columns in iter_cells(run_cell, cells, ...):
+          sink.append(columns)          # {col: скаляр | массив (n,)}
+  df = read_results(sink.path, columns=['portfolio', 'roi'])
+
+  # в cell_fn воркера:
+  part = write_cell_part(RAW_BASE, cell['key'], columns, categories=RAW_CATEGORIES)
+"""
+
+import glob
+import os
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:   # запасной формат — .npz
+    pa = pq = None
+
+HAS_ARROW = pa is not None
+CATEGORY_PREFIX = '__categories__'
+
+
+def _code_dtype(n_categories: int) -> np.dtype:
+    return np.dtype(np.int8) if n_categories < 2 ** 7 else np.dtype(np.int16) if n_categories < 2 ** 15 \
+        else np.dtype(np.int32)
+
+
+class ColumnSink:
+    """
+    Буфер результатов с периодическим сбросом на диск.
+
+    base         — путь без расширения; итоговый путь — self.path
+    categories   — {столбец: список меток}; значения кодируются по позиции
+                   в списке, неизвестная метка — ValueError
+    chunk_rows   — размер буфера (строк) и куска на диске
+    part         — имя куска ячейки: пишутся только файлы part-<part>-* в
+                   каталоге base, чужие куски не удаляются (self.path — каталог)
+    Типы остальных столбцов берутся из первого append и расширяются
+    (np.result_type), если позже приходят более широкие: int → float и т.п.;
+    None → NaN (float). Строковые значения — только в столбцах categories.
+    """
+
+    def __init__(self, base: str, categories: Optional[Mapping[str, Sequence[str]]] = None,
+                 chunk_rows: int = 1_000_000, fmt: Optional[str] = None, part: Optional[str] = None):
+        fmt = fmt or ('parquet' if HAS_ARROW else 'npz')
+        if fmt not in ('parquet', 'npz'):
+            raise ValueError(f'Invalid format. Expected "parquet" or "npz", receive: {fmt}')
+        if fmt == 'parquet' and not HAS_ARROW:
+            raise ValueError('Parquet output requires pyarrow')
+
+        self.fmt = fmt
+        self.part = part
+        self._dir = base
+        self._prefix = 'part' if part is None else f'part-{part}'
+        if part is None:
+            self.path = f'{base}.parquet' if fmt == 'parquet' else base
+            self._parquet_path = self.path
+        else:
+            self.path = base
+            self._parquet_path = os.path.join(base, f'{self._prefix}.parquet')
+        self.files: list[str] = []
+        self.categories = {col: [str(c) for c in labels] for col, labels in (categories or {}).items()}
+        self._codes = {col: {label: i for i, label in enumerate(labels)} for col, labels in self.categories.items()}
+        self.chunk_rows = chunk_rows
+
+        self._buffers: Optional[dict[str, np.ndarray]] = None
+        self._filled = 0
+        self._n_chunks = 0
+        self.n_rows = 0
+        self._writer = None
+
+        if fmt == 'npz' or part is not None:
+            os.makedirs(base, exist_ok=True)
+        if fmt == 'npz':
+            pattern = 'part-*.npz' if part is None else f'{self._prefix}-*.npz'
+            for old in glob.glob(os.path.join(base, pattern)):
+                os.remove(old)
+        elif os.path.exists(self._parquet_path):
+            os.remove(self._parquet_path)
+
+    # ── запись ────────────────────────────────────────────────────────────────
+
+    def _column(self, col: str, value, n: int) -> np.ndarray:
+        if col in self._codes:
+            uniques, inverse = np.unique(np.atleast_1d(np.asarray(value, dtype=str)), return_inverse=True)
+            try:
+                lookup = np.array([self._codes[col][label] for label in uniques], dtype=_code_dtype(len(self._codes[col])))
+            except KeyError as e:
+                raise ValueError(f'Unknown category {e} in column "{col}". Expected one of {self.categories[col]}')
+            return np.broadcast_to(lookup[inverse], (n,))
+        if value is None:
+            return np.full(n, np.nan)
+        arr = np.asarray(value)
+        if arr.dtype.kind in 'USO':
+            try:
+                arr = arr.astype(float)     # None среди чисел → NaN
+            except (TypeError, ValueError):
+                raise ValueError(f'String column "{col}" should be listed in categories, receive: {value!r}')
+        return np.broadcast_to(arr, (n,))
+
+    def append(self, columns: Mapping) -> None:
+        """Дописывает строки {col: скаляр | массив (n,)}; скаляры транслируются на n строк."""
+        n = max((len(v) for v in columns.values() if np.ndim(v) == 1), default=1)
+        arrays = {col: self._column(col, columns[col], n) for col in columns}
+
+        if self._buffers is None:
+            self._buffers = {col: np.empty(self.chunk_rows, dtype=arr.dtype) for col, arr in arrays.items()}
+        elif arrays.keys() != self._buffers.keys():
+            raise ValueError(f'Columns mismatch: expected {list(self._buffers)}, receive: {list(arrays)}')
+        else:
+            for col, arr in arrays.items():
+                dtype = np.result_type(self._buffers[col].dtype, arr.dtype)
+                if dtype != self._buffers[col].dtype:
+                    self._buffers[col] = self._buffers[col].astype(dtype)
+
+        start = 0
+        while start < n:
+            take = min(n - start, self.chunk_rows - self._filled)
+            for col, arr in arrays.items():
+                self._buffers[col][self._filled:self._filled + take] = arr[start:start + take]
+            self._filled += take
+            start += take
+            if self._filled == self.chunk_rows:
+                self.flush()
+
+    def flush(self) -> None:
+        """Сбрасывает заполненную часть буфера на диск отдельным куском."""
+        if not self._filled:
+            return
+        chunk = {col: buf[:self._filled] for col, buf in self._buffers.items()}
+        if self.fmt == 'parquet':
+            self._write_parquet(chunk)
+        else:
+            extra = {f'{CATEGORY_PREFIX}{col}': np.array(labels) for col, labels in self.categories.items()
+                     if col in chunk}
+            path = os.path.join(self._dir, f'{self._prefix}-{self._n_chunks:05d}.npz')
+            with open(f'{path}.tmp', 'wb') as f:
+                np.savez(f, **chunk, **extra)
+            os.replace(f'{path}.tmp', path)
+            self.files.append(path)
+        self.n_rows += self._filled
+        self._n_chunks += 1
+        self._filled = 0
+
+    def _write_parquet(self, chunk: dict) -> None:
+        fields = {}
+        for col, arr in chunk.items():
+            if col in self.categories:
+                fields[col] = pa.DictionaryArray.from_arrays(pa.array(arr), pa.array(self.categories[col]))
+            else:
+                fields[col] = pa.array(arr)
+        table = pa.table(fields)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(f'{self._parquet_path}.tmp', table.schema)
+        elif not table.schema.equals(self._writer.schema):
+            # схема файла фиксируется первым куском — расширять типы можно только до него
+            raise ValueError(f'Column types changed after the first Parquet chunk: '
+                             f'expected {self._writer.schema}, receive: {table.schema}')
+        self._writer.write_table(table)
+
+    def close(self) -> str:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.replace(f'{self._parquet_path}.tmp', self._parquet_path)
+            self.files.append(self._parquet_path)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ── куски ячеек ──────────────────────────────────────────────────────────────
+
+@dataclass
+class CellPart:
+    files: list[str]      # файлы куска ячейки
+    n_rows: int
+
+
+def part_name(key: Sequence[int]) -> str:
+    """Имя куска ячейки: индексы key с нулями — сортировка имён совпадает с порядком ячеек."""
+    return '-'.join(f'{i:04d}' for i in key)
+
+
+def write_cell_part(base: str, key: Sequence[int], columns: Union[Mapping, Sequence[Mapping]],
+                    categories: Optional[Mapping[str, Sequence[str]]] = None, fmt: Optional[str] = None) -> CellPart:
+    """Сырые столбцы ячейки (один или несколько наборов append) — отдельным куском в каталоге base."""
+    with ColumnSink(base, categories, fmt=fmt, part=part_name(key)) as sink:
+        for part_columns in ([columns] if isinstance(columns, Mapping) else columns):
+            sink.append(part_columns)
+    return CellPart(files=sink.files, n_rows=sink.n_rows)
+
+
+def clear_parts(base: str, keep: Iterable[str] = ()) -> None:
+    """
+    Удаляет результаты ColumnSink(base) прошлых прогонов, кроме кусков ячеек
+    keep (имена part_name) — готовых ячеек контрольной точки.
+    """
+    keep = set(keep)
+    if os.path.isfile(f'{base}.parquet'):
+        os.remove(f'{base}.parquet')
+    for path in glob.glob(os.path.join(base, 'part-*')):
+        stem = os.path.basename(path).split('.', 1)[0][len('part-'):]
+        cell = stem if path.endswith('.parquet') else stem.rsplit('-', 1)[0]
+        if path.endswith('.tmp') or cell not in keep:
+            os.remove(path)
+
+
+# ── чтение ───────────────────────────────────────────────────────────────────
+
+def find_results(base: str) -> Optional[str]:
+    """Путь к результатам ColumnSink(base) — <base>.parquet или каталог <base>/; None, если их нет."""
+    for path in (f'{base}.parquet', base):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _resolve(base: str) -> str:
+    path = find_results(base)
+    if path is None:
+        raise FileNotFoundError(f'No results at {base} (.parquet or .npz directory)')
+    return path
+
+
+def iter_result_chunks(base: str, columns: Optional[Sequence[str]] = None,
+                       categorical: bool = True) -> Iterator[pd.DataFrame]:
+    """
+    Куски результатов по одному (row group / part-*.npz) — для обработки без
+    загрузки целиком. categorical=False — метки строками вместо pandas.Categorical.
+    """
+    path = _resolve(base)
+    if os.path.isfile(path):
+        yield from _iter_parquet(path, columns, categorical)
+        return
+
+    parts = glob.glob(os.path.join(path, 'part-*.npz')) + glob.glob(os.path.join(path, 'part-*.parquet'))
+    for part in sorted(parts):
+        if part.endswith('.parquet'):
+            yield from _iter_parquet(part, columns, categorical)
+            continue
+        with np.load(part) as data:
+            names = [k for k in data.files if not k.startswith(CATEGORY_PREFIX)]
+            frame = {}
+            for col in (columns or names):
+                if f'{CATEGORY_PREFIX}{col}' in data.files:
+                    frame[col] = pd.Categorical.from_codes(data[col], categories=data[f'{CATEGORY_PREFIX}{col}'])
+                else:
+                    frame[col] = data[col]
+        frame = pd.DataFrame(frame)
+        yield frame if categorical else _decode(frame)
+
+
+def _iter_parquet(path: str, columns: Optional[Sequence[str]], categorical: bool) -> Iterator[pd.DataFrame]:
+    if not HAS_ARROW:
+        raise ValueError('Reading Parquet results requires pyarrow')
+    reader = pq.ParquetFile(path)
+    for i in range(reader.num_row_groups):
+        frame = reader.read_row_group(i, columns=columns).to_pandas()
+        yield frame if categorical else _decode(frame)
+
+
+def _decode(frame: pd.DataFrame) -> pd.DataFrame:
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(object)
+    return frame
+
+
+def read_results(base: str, columns: Optional[Sequence[str]] = None, categorical: bool = True) -> pd.DataFrame:
+    """Все результаты одним DataFrame; категориальные столбцы — pandas.Categorical (или строки)."""
+    chunks = list(iter_result_chunks(base, columns, categorical))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)